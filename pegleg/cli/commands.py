@@ -18,6 +18,7 @@ import warnings
 import click
 
 from pegleg.cli import utils
+from pegleg import engine
 from pegleg import pegleg_main
 
 LOG = logging.getLogger(__name__)
@@ -47,7 +48,22 @@ CONTEXT_SETTINGS = {
     '30=WARNING\n'
     '40=ERROR\n'
     '50=CRITICAL')
-def main(*, verbose, logging_level):
+@click.option(
+    '--cache/--no-cache',
+    'cache',
+    default=True,
+    show_default=True,
+    help='Enable or disable the persistent on-disk cache of parsed '
+    'documents.')
+@click.option(
+    '--cache-dir',
+    'cache_dir',
+    envvar='PEGLEG_CACHE_DIR',
+    type=click.Path(file_okay=False, resolve_path=True),
+    help='Directory for the persistent cache, which must be owned by the '
+    'current user and not writable by group or others. Defaults to '
+    '$XDG_CACHE_HOME/pegleg (~/.cache/pegleg).')
+def main(*, verbose, logging_level, cache, cache_dir):
     """Main CLI meta-group, which includes the following groups:
 
     * site: site-level actions
@@ -55,6 +71,7 @@ def main(*, verbose, logging_level):
 
     """
     pegleg_main.set_logging_level(verbose, logging_level)
+    pegleg_main.set_cache(cache, cache_dir)
 
 
 @main.group(help='Commands related to repositories.')
@@ -64,32 +81,102 @@ def main(*, verbose, logging_level):
 # able to lint multiple repos together.
 @utils.REPOSITORY_USERNAME_OPTION
 @utils.REPOSITORY_KEY_OPTION
-def repo(*, site_repository, clone_path, repo_key, repo_username):
+@utils.REPOSITORY_CLONE_MODE_OPTION
+@utils.REPOSITORY_CHECKOUT_OPTION
+def repo(
+        *, site_repository, clone_path, repo_key, repo_username, clone_mode,
+        checkout):
     """Group for repo-level actions, which include:
 
     * lint: lint all sites across the repository
+    * affected-sites: list sites whose inputs changed since a Git ref
+    * check-pki-certs: check certificates of all sites for expiration
     """
     pegleg_main.run_config(
         site_repository,
         clone_path,
         repo_key,
         repo_username, [],
-        run_umask=True)
+        run_umask=True,
+        clone_mode=clone_mode,
+        checkout=checkout)
 
 
 @repo.command('lint', help='Lint all sites in a repository.')
 @utils.ALLOW_MISSING_SUBSTITUTIONS_OPTION
 @utils.EXCLUDE_LINT_OPTION
 @utils.WARN_LINT_OPTION
-def lint_repo(*, fail_on_missing_sub_src, exclude_lint, warn_lint):
+@utils.JOBS_OPTION
+@click.option(
+    '--site',
+    'sitenames',
+    multiple=True,
+    help='Only lint this site and the files it is built from. Can be '
+    'specified multiple times. Defaults to all sites.')
+@click.option(
+    '--since',
+    'since',
+    metavar='REF',
+    help='Only lint sites consuming files changed since the merge base of '
+    'Git ref REF and HEAD, including uncommitted changes.')
+@click.option(
+    '--timings',
+    'timings',
+    is_flag=True,
+    default=False,
+    help='Print how long rendering each site took.')
+def lint_repo(
+        *, fail_on_missing_sub_src, exclude_lint, warn_lint, jobs, sitenames,
+        since, timings):
     """Lint all sites using checks defined in :mod:`pegleg.engine.errorcodes`.
     """
+    site_timings = [] if timings else None
     warns = pegleg_main.run_lint(
-        exclude_lint, fail_on_missing_sub_src, warn_lint)
+        exclude_lint,
+        fail_on_missing_sub_src,
+        warn_lint,
+        jobs=jobs,
+        sitenames=list(sitenames) or None,
+        since=since,
+        timings=site_timings)
     if warns:
         click.echo("Linting passed, but produced some warnings.")
         for w in warns:
             click.echo(w)
+    if site_timings:
+        click.echo("Per-site render timings:")
+        click.echo(engine.lint.format_site_timings(site_timings))
+
+
+@repo.command(
+    'affected-sites', help='List sites whose inputs changed since a Git ref.')
+@utils.SAVE_LOCATION_OPTION
+@click.option(
+    '--since',
+    'since',
+    metavar='REF',
+    required=True,
+    help='Git branch, tag, commit or ref to compare against. Changes since '
+    'the merge base of REF and HEAD, including uncommitted changes, count.')
+def affected_sites(*, save_location, since):
+    """List sites consuming any file changed since ``--since``, one per line.
+    """
+    pegleg_main.run_list_affected_sites(save_location, since)
+
+
+@repo.command(
+    'check-pki-certs',
+    help='Determine if certificates of any site of the repository are '
+    'expired or expiring within a specified number of days.')
+@utils.PKI_CERTS_DAYS_OPTION
+@utils.PKI_CERTS_OUTPUT_FORMAT_OPTION
+@utils.PKI_BACKEND_OPTION
+@utils.JOBS_OPTION
+def check_repo_pki_certs(*, days, output_format, pki_backend, jobs):
+    """Check PKI certificates of all sites for expiration, in one pass."""
+    expiring_certs_exist, cert_results = pegleg_main.run_check_repo_pki_certs(
+        days, pki_backend, jobs=jobs, output_format=output_format)
+    _echo_pki_certs(expiring_certs_exist, cert_results, days, output_format)
 
 
 @main.group(help='Commands related to sites.')
@@ -98,6 +185,8 @@ def lint_repo(*, fail_on_missing_sub_src, exclude_lint, warn_lint):
 @utils.EXTRA_REPOSITORY_OPTION
 @utils.REPOSITORY_USERNAME_OPTION
 @utils.REPOSITORY_KEY_OPTION
+@utils.REPOSITORY_CLONE_MODE_OPTION
+@utils.REPOSITORY_CHECKOUT_OPTION
 @click.option(
     '--decrypt/--no-decrypt',
     'decrypt_repos',
@@ -110,7 +199,7 @@ def lint_repo(*, fail_on_missing_sub_src, exclude_lint, warn_lint):
     'the full decrypt command should still be used.')
 def site(
         *, site_repository, clone_path, extra_repositories, repo_key,
-        repo_username, decrypt_repos):
+        repo_username, clone_mode, checkout, decrypt_repos):
     """Group for site-level actions, which include:
 
     * list: list available sites in a manifests repo
@@ -126,7 +215,9 @@ def site(
         repo_username,
         extra_repositories or [],
         run_umask=True,
-        decrypt_repos=decrypt_repos)
+        decrypt_repos=decrypt_repos,
+        clone_mode=clone_mode,
+        checkout=checkout)
 
 
 @site.command(help='Output complete config for one site.')
@@ -256,16 +347,52 @@ def lint_site(*, fail_on_missing_sub_src, exclude_lint, warn_lint, site_name):
     help='Specifies the name to use for the uploaded collection. '
     'Defaults to the specified `site_name`.',
     callback=utils.collection_default_callback)
+@click.option(
+    '--compress/--no-compress',
+    'compress',
+    default=False,
+    show_default=True,
+    help='Gzip the uploaded documents. Requires Shipyard, or a proxy in '
+    'front of it, to accept gzip encoded requests.')
+@click.option(
+    '--stream/--no-stream',
+    'stream',
+    default=False,
+    show_default=True,
+    help='Send the documents with chunked transfer encoding while they are '
+    'read, instead of all at once. Requires Shipyard, or a proxy in front '
+    'of it, to accept chunked requests.')
+@click.option(
+    '--force',
+    'force',
+    is_flag=True,
+    default=False,
+    help='Upload and commit the documents even if they haven\'t changed '
+    'since their last upload to the collection.')
 @utils.SITE_REPOSITORY_ARGUMENT
 @click.pass_context
 def upload(
         ctx, *, os_domain_name, os_project_domain_name, os_user_domain_name,
         os_project_name, os_username, os_password, os_auth_url, os_auth_token,
-        context_marker, site_name, buffer_mode, collection):
+        context_marker, site_name, buffer_mode, collection, compress, stream,
+        force):
     resp = pegleg_main.run_upload(
-        buffer_mode, collection, context_marker, ctx, os_auth_token,
-        os_auth_url, os_domain_name, os_password, os_project_domain_name,
-        os_project_name, os_user_domain_name, os_username, site_name)
+        buffer_mode,
+        collection,
+        context_marker,
+        ctx,
+        os_auth_token,
+        os_auth_url,
+        os_domain_name,
+        os_password,
+        os_project_domain_name,
+        os_project_name,
+        os_user_domain_name,
+        os_username,
+        site_name,
+        compress=compress,
+        stream=stream,
+        force=force)
     click.echo(resp)
 
 
@@ -397,19 +524,23 @@ def genesis_bundle(*, build_dir, validators, site_name):
     'check-pki-certs',
     help='Determine if certificates in a sites PKICatalog are expired or '
     'expiring within a specified number of days.')
-@click.option(
-    '-d',
-    '--days',
-    'days',
-    default=60,
-    help='The number of days past today to check if certificates are valid.')
+@utils.PKI_CERTS_DAYS_OPTION
+@utils.PKI_CERTS_OUTPUT_FORMAT_OPTION
+@utils.PKI_BACKEND_OPTION
+@utils.JOBS_OPTION
 @utils.SITE_REPOSITORY_ARGUMENT
-def check_pki_certs(site_name, days):
+def check_pki_certs(site_name, days, output_format, pki_backend, jobs):
     """Check PKI certificates of a site for expiration."""
     expiring_certs_exist, cert_results = pegleg_main.run_check_pki_certs(
-        days, site_name)
+        days, site_name, pki_backend, jobs=jobs, output_format=output_format)
+    _echo_pki_certs(expiring_certs_exist, cert_results, days, output_format)
+
 
-    if expiring_certs_exist:
+def _echo_pki_certs(expiring_certs_exist, cert_results, days, output_format):
+    if output_format == 'json':
+        click.echo(cert_results)
+        exit(1 if expiring_certs_exist else 0)
+    elif expiring_certs_exist:
         click.echo(
             "The following certs will expire within the next {} days: \n{}".
             format(days, cert_results))
@@ -427,9 +558,10 @@ def check_pki_certs(site_name, days):
 @utils.EXTRA_REPOSITORY_OPTION
 @utils.REPOSITORY_USERNAME_OPTION
 @utils.REPOSITORY_KEY_OPTION
+@utils.REPOSITORY_CLONE_MODE_OPTION
 def type(
         *, site_repository, clone_path, extra_repositories, repo_key,
-        repo_username):
+        repo_username, clone_mode):
     """Group for repo-level actions, which include:
 
     * list: list all types across the repository
@@ -441,7 +573,8 @@ def type(
         repo_key,
         repo_username,
         extra_repositories or [],
-        run_umask=False)
+        run_umask=False,
+        clone_mode=clone_mode)
 
 
 @type.command('list', help='List known types.')
@@ -498,14 +631,43 @@ def generate():
     'generated, wrapped, and encrypted passphrases files will be saved '
     'in: <save_location>/site/<site_name>/secrets/certificates/ '
     'directory. Defaults to site repository path if no value given.')
+@click.option(
+    '--expiring-within',
+    'expiring_within',
+    type=click.IntRange(min=0),
+    default=None,
+    metavar='DAYS',
+    help='Regenerate the existing CAs and certificates expiring within DAYS '
+    'days, and the certificates signed by regenerated CAs. Only the files '
+    'holding regenerated documents are rewritten.')
+@click.option(
+    '--regenerate-changed',
+    'regenerate_changed',
+    is_flag=True,
+    default=False,
+    help='Regenerate the existing certificates whose common name, hosts or '
+    'groups differ from the PKICatalog. Only the files holding regenerated '
+    'documents are rewritten.')
+@utils.PKI_BACKEND_OPTION
+@utils.PKI_JOBS_OPTION
 @utils.SITE_REPOSITORY_ARGUMENT
-def generate_pki(site_name, author, days, regenerate_all, save_location):
+def generate_pki(
+        site_name, author, days, regenerate_all, save_location,
+        expiring_within, regenerate_changed, pki_backend, jobs):
     """Generate certificates, certificate authorities and keypairs for a given
     site.
 
     """
     output_paths = pegleg_main.run_generate_pki(
-        author, days, regenerate_all, site_name, save_location)
+        author,
+        days,
+        regenerate_all,
+        site_name,
+        save_location,
+        pki_backend,
+        jobs=jobs,
+        expiring_within=expiring_within,
+        regenerate_changed=regenerate_changed)
     click.echo("Generated PKI files written to:\n%s" % '\n'.join(output_paths))
 
 
@@ -589,9 +751,11 @@ def generate_passphrases(
     required=True,
     help='Identifier for the program or person who is encrypting the secrets '
     'documents.')
+@utils.JOBS_OPTION
 @utils.SITE_REPOSITORY_ARGUMENT
-def encrypt(*, path, save_location, author, site_name):
-    pegleg_main.run_encrypt(author, save_location, site_name, path=path)
+def encrypt(*, path, save_location, author, jobs, site_name):
+    pegleg_main.run_encrypt(
+        author, save_location, site_name, path=path, jobs=jobs)
 
 
 @secrets.command(
@@ -620,9 +784,11 @@ def encrypt(*, path, save_location, author, site_name):
     default=False,
     help='Overwrites original file(s) at path with decrypted data when set. '
     'Overrides --save-location option.')
+@utils.JOBS_OPTION
 @utils.SITE_REPOSITORY_ARGUMENT
-def decrypt(*, path, save_location, overwrite, site_name):
-    data = pegleg_main.run_decrypt(overwrite, path, save_location, site_name)
+def decrypt(*, path, save_location, overwrite, jobs, site_name):
+    data = pegleg_main.run_decrypt(
+        overwrite, path, save_location, site_name, jobs=jobs)
     if data:
         for d in data:
             click.echo(d)
@@ -663,3 +829,26 @@ def generate_passphrase(length):
 def generate_salt(length):
     click.echo(
         "Generated Salt: {}".format(pegleg_main.run_generate_salt(length)))
+
+
+@main.group(help='Commands related to the persistent cache.')
+def cache():
+    pass
+
+
+@cache.command('stats', help='Show the size of each cache namespace.')
+@utils.SAVE_LOCATION_OPTION
+def cache_stats(*, save_location):
+    pegleg_main.run_cache_stats(save_location)
+
+
+@cache.command('clear', help='Remove cached entries.')
+@click.option(
+    '-n',
+    '--namespace',
+    'namespaces',
+    multiple=True,
+    help='Only clear the given namespace, e.g. documents, lint or render. '
+    'May be repeated. Defaults to all namespaces.')
+def cache_clear(*, namespaces):
+    pegleg_main.run_cache_clear(namespaces)
@@ -81,6 +81,50 @@ EXTRA_REPOSITORY_OPTION = click.option(
     'site-definition for the site will be leveraged but can be '
     'overridden using -e global=/opt/global@revision.')
 
+JOBS_OPTION = click.option(
+    '-j',
+    '--jobs',
+    'jobs',
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help='Number of worker processes to use. 0 uses one per available CPU.')
+
+PKI_JOBS_OPTION = click.option(
+    '-j',
+    '--jobs',
+    'jobs',
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help='Number of worker processes to use. 0 uses one per available CPU.')
+
+PKI_CERTS_DAYS_OPTION = click.option(
+    '-d',
+    '--days',
+    'days',
+    default=60,
+    help='The number of days past today to check if certificates are valid.')
+
+PKI_CERTS_OUTPUT_FORMAT_OPTION = click.option(
+    '--output-format',
+    'output_format',
+    type=click.Choice(['table', 'json']),
+    default='table',
+    show_default=True,
+    help='Report the expiring certificates as a table, or every certificate '
+    'as JSON.')
+
+PKI_BACKEND_OPTION = click.option(
+    '--pki-backend',
+    'pki_backend',
+    type=click.Choice(['cryptography', 'cfssl']),
+    default='cryptography',
+    show_default=True,
+    help='Backend generating and inspecting keys and certificates: '
+    'in-process with the cryptography library, or with the cfssl and openssl '
+    'executables.')
+
 MAIN_REPOSITORY_OPTION = click.option(
     '-r',
     '--site-repository',
@@ -109,6 +153,16 @@ SAVE_FILE_OPTION = click.option(
     help='File to save the output. Defaults to stdout. '
     '-o (--output) is deprecated and will be removed.')
 
+REPOSITORY_CHECKOUT_OPTION = click.option(
+    '--checkout/--no-checkout',
+    'checkout',
+    default=True,
+    show_default=True,
+    help='Whether to check out local repositories at the revision given '
+    'with @revision. With --no-checkout their files are read straight from '
+    'the Git object database instead, leaving the repositories untouched. '
+    'Only suitable for commands that do not modify repositories.')
+
 REPOSITORY_CLONE_PATH_OPTION = click.option(
     '-p',
     '--clone-path',
@@ -124,6 +178,18 @@ REPOSITORY_CLONE_PATH_OPTION = click.option(
     'created /tmp/mypath/airship/treasuremap '
     'which will contain the contents of the repo.')
 
+REPOSITORY_CLONE_MODE_OPTION = click.option(
+    '--clone-mode',
+    'clone_mode',
+    type=click.Choice(['full', 'shallow', 'sparse']),
+    default='full',
+    show_default=True,
+    help='How remote repositories are cloned. "shallow" fetches only the '
+    'requested revision, without history or, where the Git server supports '
+    'it, contents of files not checked out. "sparse" additionally checks out '
+    'only the directories the site is built from. Both fall back to a full '
+    'clone if the revision cannot be fetched that way.')
+
 REPOSITORY_KEY_OPTION = click.option(
     '-k',
     '--repo-key',
@@ -39,7 +39,16 @@ except NameError:
         'salt_min_length': 24,
         'passphrase_min_length': 24,
         'default_umask': 0o027,
-        'decrypt_repos': False
+        'decrypt_repos': False,
+        'clone_mode': 'full',
+        'checkout': True,
+        'repo_revisions': {},
+        'cache_enabled': True,
+        'cache_dir': None,
+        'cache_max_size': 512 * 1024 * 1024,
+        'parse_jobs': 0,
+        'parse_parallel_threshold': 2 * 1024 * 1024,
+        'pki_backend': 'cryptography'
     }
 
 
@@ -223,3 +232,120 @@ def set_decrypt_repos(decrypt_repos=False):
 
 def get_decrypt_repos():
     return GLOBAL_CONTEXT['decrypt_repos']
+
+
+def set_clone_mode(mode='full'):
+    """Set how remote repositories are cloned (``--clone-mode`` CLI flag):
+    ``full``, ``shallow`` or ``sparse``.
+    """
+    GLOBAL_CONTEXT['clone_mode'] = mode
+
+
+def get_clone_mode():
+    """Get how remote repositories are cloned."""
+    return GLOBAL_CONTEXT.get('clone_mode', 'full')
+
+
+def set_checkout(checkout=True):
+    """Set whether local repositories are checked out at their requested
+    revision (``--checkout/--no-checkout`` CLI flag), rather than read
+    straight from their Git object database.
+    """
+    GLOBAL_CONTEXT['checkout'] = checkout
+
+
+def get_checkout():
+    """Get whether local repositories are checked out at their requested
+    revision.
+    """
+    return GLOBAL_CONTEXT.get('checkout', True)
+
+
+def add_repo_revision(root, repo_path, commit, ref):
+    """Record that ``root`` serves the files of local repository
+    ``repo_path`` at ``commit`` (resolved from ``ref``).
+    """
+    GLOBAL_CONTEXT.setdefault('repo_revisions',
+                              {})[root] = (repo_path, commit, ref)
+
+
+def get_repo_revisions():
+    """Get the roots registered with :func:`add_repo_revision`."""
+    return GLOBAL_CONTEXT.get('repo_revisions', {})
+
+
+def set_cache_enabled(enabled=True):
+    """Enable or disable the on-disk cache (``--no-cache`` CLI flag)."""
+    GLOBAL_CONTEXT['cache_enabled'] = enabled
+
+
+def get_cache_enabled():
+    """Get whether the on-disk cache is enabled."""
+    return GLOBAL_CONTEXT.get('cache_enabled', True)
+
+
+def set_cache_dir(d):
+    """Set the on-disk cache directory (``--cache-dir`` CLI flag)."""
+    GLOBAL_CONTEXT['cache_dir'] = d
+
+
+def get_cache_dir():
+    """Get the on-disk cache directory.
+
+    Defaults to ``pegleg`` under ``$XDG_CACHE_HOME`` (``~/.cache``), which,
+    unlike the clone path, is private to the invoking user.
+    """
+    if GLOBAL_CONTEXT.get('cache_dir'):
+        return GLOBAL_CONTEXT['cache_dir']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pegleg')
+
+
+def set_cache_max_size(size):
+    """Set the size in bytes above which each cache namespace is pruned."""
+    GLOBAL_CONTEXT['cache_max_size'] = size
+
+
+def get_cache_max_size():
+    """Get the size in bytes above which each cache namespace is pruned."""
+    return GLOBAL_CONTEXT.get('cache_max_size', 512 * 1024 * 1024)
+
+
+def set_parse_jobs(jobs):
+    """Set the number of worker processes used to parse YAML files.
+
+    ``0`` means one per available CPU and ``1`` disables parallel parsing.
+    """
+    GLOBAL_CONTEXT['parse_jobs'] = jobs
+
+
+def get_parse_jobs():
+    """Get the number of worker processes used to parse YAML files."""
+    return GLOBAL_CONTEXT.get('parse_jobs', 0)
+
+
+def set_parse_parallel_threshold(size):
+    """Set the number of uncached bytes below which files are parsed
+    in-process rather than in worker processes.
+    """
+    GLOBAL_CONTEXT['parse_parallel_threshold'] = size
+
+
+def get_parse_parallel_threshold():
+    """Get the number of uncached bytes below which files are parsed
+    in-process rather than in worker processes.
+    """
+    return GLOBAL_CONTEXT.get('parse_parallel_threshold', 2 * 1024 * 1024)
+
+
+def set_pki_backend(backend):
+    """Set the backend generating keys and certificates (``--pki-backend``
+    CLI flag).
+    """
+    GLOBAL_CONTEXT['pki_backend'] = backend
+
+
+def get_pki_backend():
+    """Get the backend generating keys and certificates."""
+    return GLOBAL_CONTEXT.get('pki_backend', 'cryptography')
@@ -15,6 +15,7 @@
 import yaml
 
 # flake8: noqa
+from pegleg.engine import cache
 from pegleg.engine import lint
 from pegleg.engine import repository
 from pegleg.engine import site
@@ -0,0 +1,59 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+import click
+from prettytable import PrettyTable
+
+from pegleg import config
+from pegleg.engine import util
+from pegleg.engine.util import files
+
+__all__ = ('clear', 'stats')
+
+LOG = logging.getLogger(__name__)
+
+
+def stats(output_stream):
+    """Report the number of entries and size of each cache namespace."""
+
+    cache_table = PrettyTable()
+    cache_table.field_names = ['namespace', 'entries', 'size_bytes']
+    cache_table.align['namespace'] = 'l'
+    total_entries = total_size = 0
+    for namespace in util.cache.namespaces():
+        entries, size = util.cache.get_cache(namespace).usage()
+        cache_table.add_row([namespace, entries, size])
+        total_entries += entries
+        total_size += size
+    cache_table.add_row(['(total)', total_entries, total_size])
+    msg = 'Cache directory: %s (pruned above %d bytes per namespace)\n%s' % (
+        config.get_cache_dir(), config.get_cache_max_size(),
+        cache_table.get_string())
+    if output_stream:
+        files.write(msg + "\n", output_stream)
+    else:
+        click.echo(msg)
+
+
+def clear(namespaces=None):
+    """Remove every entry from ``namespaces``, or from all namespaces."""
+    namespaces = namespaces or util.cache.namespaces()
+    for namespace in namespaces:
+        LOG.info('Clearing %s cache.', namespace)
+        if namespace == util.git.MIRRORS_NAMESPACE:
+            util.git.clear_mirrors()
+        else:
+            util.cache.get_cache(namespace).clear()
@@ -0,0 +1,525 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Backends generating the keys and certificates of ``PKIUtility``.
+
+Backends take certificate signing requests and signing configuration in the
+JSON formats of ``cfssl``, and return PEM encoded results in the shape of
+``cfssl`` output, so that they are interchangeable.
+"""
+
+from abc import ABC
+from abc import abstractmethod
+import datetime
+import ipaddress
+import json
+import logging
+import os
+import re
+# Ignore bandit false positive: B404:blacklist
+# The cfssl backend safely encapsulates calls via fork.
+import subprocess  # nosec
+import tempfile
+
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography import x509
+from cryptography.x509.oid import ExtendedKeyUsageOID
+from cryptography.x509.oid import NameOID
+from cryptography.x509.oid import SignatureAlgorithmOID
+
+from pegleg.engine import exceptions
+from pegleg.engine import util
+from pegleg.engine.util.catalog import decode_bytes
+
+LOG = logging.getLogger(__name__)
+
+__all__ = [
+    'BACKENDS', 'CfsslBackend', 'CryptographyBackend', 'PKIBackend',
+    'get_backend'
+]
+
+# Validity of generated CAs, the ``cfssl gencert -initca`` default.
+CA_EXPIRY = '43800h'
+# Certificates are valid from a little while ago, like ``cfssl`` does, so
+# that they can be used right away by hosts with a slightly slow clock.
+BACKDATE = datetime.timedelta(minutes=5)
+
+
+class PKIBackend(ABC):
+    """Abstract Base Class of the backends of ``PKIUtility``."""
+
+    #: Name of the backend, as selected with ``--pki-backend``.
+    name = None
+
+    @abstractmethod
+    def generate_ca(self, csr):
+        """Generate a self-signed CA certificate and its key.
+
+        :param str csr: Certificate signing request, in cfssl JSON format.
+        :returns: PEM encoded ``{'cert': ..., 'key': ...}``.
+        :rtype: dict
+        """
+
+    @abstractmethod
+    def generate_certificate(self, csr, *, ca_cert, ca_key, ca_config):
+        """Generate a certificate and its key, signed by a CA.
+
+        :param str csr: Certificate signing request, in cfssl JSON format.
+        :param str ca_cert: PEM encoded CA certificate.
+        :param str ca_key: PEM encoded CA key.
+        :param str ca_config: Signing configuration, in cfssl JSON format.
+        :returns: PEM encoded ``{'cert': ..., 'key': ...}``.
+        :rtype: dict
+        """
+
+    @abstractmethod
+    def generate_keypair(self, key):
+        """Generate a keypair.
+
+        :param dict key: Key algorithm and size, in cfssl CSR ``key`` format.
+        :returns: PEM encoded ``{'pub': ..., 'priv': ...}``.
+        :rtype: dict
+        """
+
+    @abstractmethod
+    def cert_info(self, cert):
+        """Return information about a certificate, in cfssl certinfo format.
+
+        :param str cert: PEM encoded certificate.
+        :rtype: dict
+        """
+
+
+class CfsslBackend(PKIBackend):
+    """Generates certificates with ``cfssl`` and keypairs with ``openssl``,
+    run in subprocesses.
+    """
+
+    name = 'cfssl'
+
+    def generate_ca(self, csr):
+        return self._cfssl(
+            ['gencert', '-initca', 'csr.json'], files={'csr.json': csr})
+
+    def generate_certificate(self, csr, *, ca_cert, ca_key, ca_config):
+        return self._cfssl(
+            [
+                'gencert', '-ca', 'ca.pem', '-ca-key', 'ca-key.pem', '-config',
+                'ca-config.json', 'csr.json'
+            ],
+            files={
+                'ca-config.json': ca_config,
+                'ca.pem': ca_cert,
+                'ca-key.pem': ca_key,
+                'csr.json': csr,
+            })
+
+    def generate_keypair(self, key):
+        if key['algo'] == 'rsa':
+            priv_command = ['genrsa', '-out', 'priv.pem', str(key['size'])]
+        elif key['algo'] == 'ecdsa':
+            priv_command = [
+                'genpkey', '-algorithm', 'EC', '-pkeyopt',
+                'ec_paramgen_curve:P-%d' % key['size'], '-out', 'priv.pem'
+            ]
+        else:
+            priv_command = [
+                'genpkey', '-algorithm', key['algo'].upper(), '-out',
+                'priv.pem'
+            ]
+        priv_result = self._openssl(priv_command)
+        pub_result = self._openssl(
+            ['pkey', '-in', 'priv.pem', '-pubout', '-out', 'pub.pem'],
+            files={
+                'priv.pem': priv_result['priv.pem'],
+            })
+        return {'pub': pub_result['pub.pem'], 'priv': priv_result['priv.pem']}
+
+    def cert_info(self, cert):
+        return self._cfssl(
+            ['certinfo', '-cert', 'cert.pem'], files={'cert.pem': cert})
+
+    def _cfssl(self, command, *, files=None):
+        """Executes ``cfssl`` command via ``subprocess`` call."""
+        if not files:
+            files = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for filename, data in files.items():
+                util.files.write(
+                    decode_bytes(data), os.path.join(tmp, filename))
+
+            # Ignore bandit false positive:
+            #   B603:subprocess_without_shell_equals_true
+            # This method wraps cfssl calls originating from this module.
+            result = subprocess.check_output(  # nosec
+                ['cfssl'] + command, cwd=tmp, stderr=subprocess.PIPE)
+            result = decode_bytes(result)
+            return json.loads(result)
+
+    def _openssl(self, command, *, files=None):
+        """Executes ``openssl`` command via ``subprocess`` call."""
+        if not files:
+            files = {}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            for filename, data in files.items():
+                util.files.write(
+                    decode_bytes(data), os.path.join(tmp, filename))
+
+            # Ignore bandit false positive:
+            #   B603:subprocess_without_shell_equals_true
+            # This method wraps openssl calls originating from this module.
+            subprocess.check_call(  # nosec
+                ['openssl'] + command,
+                cwd=tmp,
+                stderr=subprocess.PIPE)
+
+            result = {}
+            for filename in os.listdir(tmp):
+                if filename not in files:
+                    with open(os.path.join(tmp, filename), 'r') as f:
+                        result[filename] = f.read()
+
+            return result
+
+
+# cfssl names of key usages, and the matching ``x509.KeyUsage`` arguments.
+_KEY_USAGES = {
+    'signing': 'digital_signature',
+    'digital signature': 'digital_signature',
+    'content commitment': 'content_commitment',
+    'key encipherment': 'key_encipherment',
+    'data encipherment': 'data_encipherment',
+    'key agreement': 'key_agreement',
+    'cert sign': 'key_cert_sign',
+    'crl sign': 'crl_sign',
+    'encipher only': 'encipher_only',
+    'decipher only': 'decipher_only',
+}
+
+# cfssl names of extended key usages.
+_EXTENDED_KEY_USAGES = {
+    'any': ExtendedKeyUsageOID.ANY_EXTENDED_KEY_USAGE,
+    'server auth': ExtendedKeyUsageOID.SERVER_AUTH,
+    'client auth': ExtendedKeyUsageOID.CLIENT_AUTH,
+    'code signing': ExtendedKeyUsageOID.CODE_SIGNING,
+    'email protection': ExtendedKeyUsageOID.EMAIL_PROTECTION,
+    'timestamping': ExtendedKeyUsageOID.TIME_STAMPING,
+    'ocsp signing': ExtendedKeyUsageOID.OCSP_SIGNING,
+}
+
+# Subject attributes of cfssl CSR ``names``, in the order Go encodes them.
+_NAME_ATTRIBUTES = (
+    ('C', NameOID.COUNTRY_NAME),
+    ('ST', NameOID.STATE_OR_PROVINCE_NAME),
+    ('L', NameOID.LOCALITY_NAME),
+    ('O', NameOID.ORGANIZATION_NAME),
+    ('OU', NameOID.ORGANIZATIONAL_UNIT_NAME),
+)
+
+# cfssl certinfo names of subject attributes.
+_CERT_INFO_NAMES = (
+    ('country', NameOID.COUNTRY_NAME),
+    ('organization', NameOID.ORGANIZATION_NAME),
+    ('organizational_unit', NameOID.ORGANIZATIONAL_UNIT_NAME),
+    ('locality', NameOID.LOCALITY_NAME),
+    ('province', NameOID.STATE_OR_PROVINCE_NAME),
+)
+
+# cfssl certinfo names of signature algorithms.
+_SIGNATURE_ALGORITHMS = {
+    SignatureAlgorithmOID.RSA_WITH_SHA256: 'SHA256WithRSA',
+    SignatureAlgorithmOID.RSA_WITH_SHA384: 'SHA384WithRSA',
+    SignatureAlgorithmOID.RSA_WITH_SHA512: 'SHA512WithRSA',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA256: 'ECDSAWithSHA256',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA384: 'ECDSAWithSHA384',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA512: 'ECDSAWithSHA512',
+    SignatureAlgorithmOID.ED25519: 'Ed25519',
+}
+
+# ECDSA curves by key size, and the hashes signatures use with them.
+_CURVES = {
+    256: ec.SECP256R1,
+    384: ec.SECP384R1,
+    521: ec.SECP521R1,
+}
+_CURVE_HASHES = {
+    256: hashes.SHA256,
+    384: hashes.SHA384,
+    521: hashes.SHA512,
+}
+
+_DURATION_UNITS = {
+    'h': 3600,
+    'm': 60,
+    's': 1,
+    'ms': 1e-3,
+    'us': 1e-6,
+    'µs': 1e-6,
+    'ns': 1e-9,
+}
+_DURATION_PART = re.compile(r'(\d+(?:\.\d*)?|\.\d+)(h|ms|m|s|us|µs|ns)')
+
+
+class CryptographyBackend(PKIBackend):
+    """Generates keys and certificates in-process, with the ``cryptography``
+    library, the way ``cfssl`` and ``openssl`` do.
+    """
+
+    name = 'cryptography'
+
+    def generate_ca(self, csr):
+        request = json.loads(csr)
+        key = _generate_key(request['key'])
+        subject = _subject(request)
+        builder = _builder(
+            subject, subject, key.public_key(), _parse_duration(CA_EXPIRY),
+            request.get('hosts'))
+        builder = builder.add_extension(
+            _key_usage(['cert sign', 'crl sign']), critical=True)
+        builder = builder.add_extension(
+            x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        return {
+            'cert': _cert_pem(builder.sign(key, _hash(key))),
+            'key': _private_key_pem(key)
+        }
+
+    def generate_certificate(self, csr, *, ca_cert, ca_key, ca_config):
+        request = json.loads(csr)
+        profile = json.loads(ca_config)['signing']['default']
+        ca_cert = x509.load_pem_x509_certificate(
+            decode_bytes(ca_cert).encode())
+        ca_key = serialization.load_pem_private_key(
+            decode_bytes(ca_key).encode(), password=None)
+
+        key = _generate_key(request['key'])
+        builder = _builder(
+            _subject(request), ca_cert.subject, key.public_key(),
+            _parse_duration(profile['expiry']), request.get('hosts'))
+        usages = profile.get('usages', [])
+        builder = builder.add_extension(_key_usage(usages), critical=True)
+        extended_usages = [
+            _EXTENDED_KEY_USAGES[usage] for usage in usages
+            if usage in _EXTENDED_KEY_USAGES
+        ]
+        if extended_usages:
+            builder = builder.add_extension(
+                x509.ExtendedKeyUsage(extended_usages), critical=False)
+        builder = builder.add_extension(
+            x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        builder = builder.add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(
+                ca_key.public_key()),
+            critical=False)
+        return {
+            'cert': _cert_pem(builder.sign(ca_key, _hash(ca_key))),
+            'key': _private_key_pem(key)
+        }
+
+    def generate_keypair(self, key):
+        key = _generate_key(key)
+        return {
+            'pub': decode_bytes(
+                key.public_key().public_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PublicFormat.SubjectPublicKeyInfo)),
+            'priv': decode_bytes(
+                key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.PKCS8,
+                    serialization.NoEncryption()))
+        }
+
+    def cert_info(self, cert):
+        certificate = x509.load_pem_x509_certificate(
+            decode_bytes(cert).encode())
+        info = {
+            'subject': _name_info(certificate.subject),
+            'issuer': _name_info(certificate.issuer),
+            'serial_number': str(certificate.serial_number),
+            'not_before': _time_info(certificate.not_valid_before_utc),
+            'not_after': _time_info(certificate.not_valid_after_utc),
+            'sigalg': _SIGNATURE_ALGORITHMS.get(
+                certificate.signature_algorithm_oid,
+                certificate.signature_algorithm_oid.dotted_string),
+            'authority_key_id': '',
+            'subject_key_id': '',
+            'pem': decode_bytes(
+                certificate.public_bytes(serialization.Encoding.PEM)),
+        }
+        extensions = certificate.extensions
+        try:
+            info['sans'] = [
+                str(name.value) for name in extensions.get_extension_for_class(
+                    x509.SubjectAlternativeName).value
+            ]
+        except x509.ExtensionNotFound:
+            pass
+        try:
+            info['authority_key_id'] = _key_id_info(
+                extensions.get_extension_for_class(
+                    x509.AuthorityKeyIdentifier).value.key_identifier)
+        except x509.ExtensionNotFound:
+            pass
+        try:
+            info['subject_key_id'] = _key_id_info(
+                extensions.get_extension_for_class(
+                    x509.SubjectKeyIdentifier).value.digest)
+        except x509.ExtensionNotFound:
+            pass
+        return info
+
+
+def _generate_key(spec):
+    algo = spec.get('algo', 'rsa')
+    size = spec.get('size')
+    if algo == 'rsa':
+        return rsa.generate_private_key(
+            public_exponent=65537, key_size=size or 2048)
+    elif algo == 'ecdsa' and (size or 256) in _CURVES:
+        return ec.generate_private_key(_CURVES[size or 256]())
+    elif algo == 'ed25519':
+        return ed25519.Ed25519PrivateKey.generate()
+    raise exceptions.PKIInvalidKeyError(
+        algo=algo, size=size, name='key', supported='rsa, ecdsa, ed25519')
+
+
+def _hash(signing_key):
+    """Return the hash algorithm ``cfssl`` signs with ``signing_key``."""
+    if isinstance(signing_key, ed25519.Ed25519PrivateKey):
+        return None
+    if isinstance(signing_key, ec.EllipticCurvePrivateKey):
+        return _CURVE_HASHES[signing_key.curve.key_size]()
+    return hashes.SHA256()
+
+
+def _subject(request):
+    attributes = []
+    for field, oid in _NAME_ATTRIBUTES:
+        for name in request.get('names', []):
+            if name.get(field):
+                attributes.append(x509.NameAttribute(oid, name[field]))
+    if request.get('CN'):
+        attributes.append(
+            x509.NameAttribute(NameOID.COMMON_NAME, request['CN']))
+    return x509.Name(attributes)
+
+
+def _builder(subject, issuer, public_key, expiry, hosts):
+    """Return a certificate builder for ``public_key``, with the extensions
+    common to CAs and certificates.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc).replace(
+        second=0, microsecond=0)
+    not_before = now - BACKDATE
+    builder = x509.CertificateBuilder().subject_name(subject).issuer_name(
+        issuer).public_key(public_key).serial_number(
+            x509.random_serial_number()).not_valid_before(
+                not_before).not_valid_after(not_before + expiry)
+    builder = builder.add_extension(
+        x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
+    if hosts:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName([_general_name(h) for h in hosts]),
+            critical=False)
+    return builder
+
+
+def _general_name(host):
+    try:
+        return x509.IPAddress(ipaddress.ip_address(host))
+    except ValueError:
+        pass
+    if '@' in host:
+        return x509.RFC822Name(host)
+    return x509.DNSName(host)
+
+
+def _key_usage(usages):
+    kwargs = dict.fromkeys(set(_KEY_USAGES.values()), False)
+    for usage in usages:
+        if usage in _KEY_USAGES:
+            kwargs[_KEY_USAGES[usage]] = True
+        elif usage not in _EXTENDED_KEY_USAGES:
+            raise ValueError('Unsupported key usage: {}'.format(usage))
+    return x509.KeyUsage(**kwargs)
+
+
+def _parse_duration(duration):
+    """Parse a Go duration such as ``8760h`` or ``1h30m``, as found in cfssl
+    configuration.
+    """
+    parts = _DURATION_PART.findall(duration)
+    if not parts or ''.join(v + u for v, u in parts) != duration:
+        raise exceptions.PKICertificateInvalidDuration()
+    return datetime.timedelta(
+        seconds=sum(float(v) * _DURATION_UNITS[u] for v, u in parts))
+
+
+def _cert_pem(certificate):
+    return decode_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+
+
+def _private_key_pem(key):
+    # Ed25519 keys have no traditional (PKCS1-like) encoding.
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        private_format = serialization.PrivateFormat.PKCS8
+    else:
+        private_format = serialization.PrivateFormat.TraditionalOpenSSL
+    return decode_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM, private_format,
+            serialization.NoEncryption()))
+
+
+def _name_info(name):
+    info = {}
+    common_names = name.get_attributes_for_oid(NameOID.COMMON_NAME)
+    if common_names:
+        info['common_name'] = common_names[0].value
+    for field, oid in _CERT_INFO_NAMES:
+        attributes = name.get_attributes_for_oid(oid)
+        if attributes:
+            info[field] = attributes[0].value
+    info['names'] = [attribute.value for attribute in name]
+    return info
+
+
+def _time_info(time):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _key_id_info(key_id):
+    return ':'.join('%02X' % b for b in key_id) if key_id else ''
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (CryptographyBackend, CfsslBackend)
+}
+
+
+def get_backend(name):
+    """Return an instance of the backend named ``name``.
+
+    :raises ValueError: If there is no such backend.
+    """
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError('Unknown PKI backend: {}'.format(name))
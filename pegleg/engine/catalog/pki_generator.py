@@ -24,11 +24,43 @@ from pegleg.engine import exceptions
 from pegleg.engine import site
 from pegleg.engine import util
 from pegleg.engine.util.pegleg_secret_management import PeglegSecretManagement
+from pegleg.engine.util import pool
 
 __all__ = ['PKIGenerator']
 
 LOG = logging.getLogger(__name__)
 
+# Kinds of the pair of documents of each kind of PKI entry.
+_KINDS = {
+    'ca': ['CertificateAuthority', 'CertificateAuthorityKey'],
+    'cert': ['Certificate', 'CertificateKey'],
+    'keypair': ['PublicKey', 'PrivateKey'],
+}
+
+# ``PKIUtility`` methods generating each kind of PKI entry.
+_GENERATORS = {
+    'ca': 'generate_ca',
+    'cert': 'generate_certificate',
+    'keypair': 'generate_keypair',
+}
+
+
+class _PKIEntry(object):
+    """A CA, certificate or keypair of a ``PKICatalog``, with the documents
+    found or generated for it.
+    """
+    def __init__(self, kind, document_name, ca, kwargs):
+        self.kind = kind
+        self.document_name = document_name
+        # Entry of the CA signing a certificate.
+        self.ca = ca
+        self.kwargs = kwargs
+        self.docs = None
+        # Earlier entry of the same document, whose documents are reused.
+        self.same_as = None
+        # Whether the documents are generated rather than found.
+        self.regenerate = False
+
 
 class PKIGenerator(object):
     """Generates certificates, certificate authorities and keypairs using
@@ -49,7 +81,10 @@ class PKIGenerator(object):
             author=None,
             duration=365,
             regenerate_all=False,
-            save_location=None):
+            save_location=None,
+            jobs=1,
+            expiring_within=None,
+            regenerate_changed=False):
         """Constructor for ``PKIGenerator``.
 
         :param int duration: Duration in days that generated certificates
@@ -61,6 +96,13 @@ class PKIGenerator(object):
         :param str author: Identifying name of the author generating new
             certificates.
         :param bool regenerate_all: If Pegleg should regenerate all certs.
+        :param int jobs: Number of worker processes generating keys and
+            certificates; 0 means one per CPU.
+        :param int expiring_within: If set, regenerate the existing CAs and
+            certificates expiring within this many days.
+        :param bool regenerate_changed: If Pegleg should regenerate the
+            existing certificates whose common name, hosts or groups differ
+            from the catalog.
         """
 
         self._regenerate_all = regenerate_all
@@ -69,85 +111,153 @@ class PKIGenerator(object):
         self._author = author
         self._save_location = save_location or config.get_site_repo()
 
-        self.keys = pki_utility.PKIUtility(
-            block_strings=block_strings, duration=duration)
+        self._block_strings = block_strings
+        self._duration = duration
+        self._jobs = jobs
+        self._expiring_within = expiring_within
+        self._regenerate_changed = regenerate_changed
+        self._keys = pki_utility.PKIUtility(duration=expiring_within)
         self.outputs = collections.defaultdict(dict)
+        # Names of the outputs generated, rather than reused, by schema.
+        self._regenerated = set()
 
         # Maps certificates to CAs in order to derive certificate paths.
         self._cert_to_ca_map = {}
 
     def generate(self):
+        """Generate the missing CAs, certificates and keypairs of the site's
+        ``PKICatalog`` documents and write them out.
+
+        CAs and keypairs are generated first, then the certificates signed
+        by those CAs, each concurrently on up to ``jobs`` worker processes.
+        The outputs are collected in catalog order, so documents are written
+        out in the same order regardless of the number of jobs.
+
+        :returns: Paths of the files written.
+        :rtype: set
+        """
+        entries = []
+        planned = {}
         for catalog in util.catalog.iterate(documents=self._documents,
                                             kind='PKICatalog'):
             for ca_name, ca_def in catalog['data'].get(
                     'certificate_authorities', {}).items():
-                ca_cert, ca_key = self.get_or_gen_ca(ca_name)
+                ca = self._plan(
+                    entries, planned, 'ca', ca_name, key=ca_def.get('key'))
 
                 for cert_def in ca_def.get('certificates', []):
                     document_name = cert_def['document_name']
                     self._cert_to_ca_map.setdefault(document_name, ca_name)
-                    cert, key = self.get_or_gen_cert(
+                    self._plan(
+                        entries,
+                        planned,
+                        'cert',
                         document_name,
-                        ca_cert=ca_cert,
-                        ca_key=ca_key,
+                        ca=ca,
                         cn=cert_def['common_name'],
                         hosts=_extract_hosts(cert_def),
-                        groups=cert_def.get('groups', []))
+                        groups=cert_def.get('groups', []),
+                        key=cert_def.get('key'))
 
             for keypair_def in catalog['data'].get('keypairs', []):
-                document_name = keypair_def['name']
-                self.get_or_gen_keypair(document_name)
+                self._plan(
+                    entries,
+                    planned,
+                    'keypair',
+                    keypair_def['name'],
+                    key=keypair_def.get('key'))
 
-        return self._write(self._save_location)
+        self._generate([e for e in entries if e.kind != 'cert'])
+        self._generate([e for e in entries if e.kind == 'cert'])
 
-    def get_or_gen_ca(self, document_name):
-        kinds = [
-            'CertificateAuthority',
-            'CertificateAuthorityKey',
-        ]
-        return self._get_or_gen(self.gen_ca, kinds, document_name)
-
-    def get_or_gen_cert(self, document_name, **kwargs):
-        kinds = [
-            'Certificate',
-            'CertificateKey',
-        ]
-        return self._get_or_gen(self.gen_cert, kinds, document_name, **kwargs)
-
-    def get_or_gen_keypair(self, document_name):
-        kinds = [
-            'PublicKey',
-            'PrivateKey',
-        ]
-        return self._get_or_gen(self.gen_keypair, kinds, document_name)
-
-    def gen_ca(self, document_name, **kwargs):
-        return self.keys.generate_ca(document_name, **kwargs)
-
-    def gen_cert(self, document_name, *, ca_cert, ca_key, **kwargs):
-        ca_cert_data = ca_cert['data']['managedDocument']['data']
-        ca_key_data = ca_key['data']['managedDocument']['data']
-        return self.keys.generate_certificate(
-            document_name, ca_cert=ca_cert_data, ca_key=ca_key_data, **kwargs)
-
-    def gen_keypair(self, document_name):
-        return self.keys.generate_keypair(document_name)
-
-    def _get_or_gen(self, generator, kinds, document_name, *args, **kwargs):
-        docs = self._find_docs(kinds, document_name)
-        if not docs or self._regenerate_all:
-            docs = generator(document_name, *args, **kwargs)
-        else:
-            docs = PeglegSecretManagement(docs=docs)
         # Adding these to output should be idempotent, so we use a dict.
+        for entry in entries:
+            for wrapper_doc in entry.docs:
+                wrapped_doc = wrapper_doc['data']['managedDocument']
+                schema = wrapped_doc['schema']
+                name = wrapped_doc['metadata']['name']
+                self.outputs[schema][name] = wrapper_doc
+                if entry.regenerate:
+                    self._regenerated.add((schema, name))
 
-        for wrapper_doc in docs:
-            wrapped_doc = wrapper_doc['data']['managedDocument']
-            schema = wrapped_doc['schema']
-            name = wrapped_doc['metadata']['name']
-            self.outputs[schema][name] = wrapper_doc
+        return self._write(self._save_location)
 
-        return docs
+    def _plan(self, entries, planned, kind, document_name, ca=None, **kwargs):
+        """Append the entry for a CA, certificate or keypair to ``entries``,
+        reusing existing documents unless regenerating all of them or they
+        are outdated.
+        """
+        entry = _PKIEntry(kind, document_name, ca, kwargs)
+        previous = planned.get((kind, document_name))
+        if self._regenerate_all:
+            entry.regenerate = True
+        elif previous:
+            entry.same_as = previous
+            entry.regenerate = previous.regenerate
+        else:
+            docs = self._find_docs(_KINDS[kind], document_name)
+            entry.regenerate = not docs or self._outdated(entry, docs)
+            if not entry.regenerate:
+                entry.docs = list(PeglegSecretManagement(docs=docs))
+        planned[(kind, document_name)] = entry
+        entries.append(entry)
+        return entry
+
+    def _outdated(self, entry, docs):
+        """Return whether the existing documents of ``entry`` need to be
+        regenerated: when its CA is, or when selectively regenerating expiring
+        or changed certificates.
+        """
+        if entry.ca is not None and entry.ca.regenerate:
+            LOG.info(
+                'Regenerating %s, signed by regenerated CA %s.',
+                entry.document_name, entry.ca.document_name)
+            return True
+        if entry.kind == 'keypair':
+            return False
+
+        cert = _data(docs[0])
+        if self._expiring_within is not None:
+            expiry = self._keys.check_expiry(cert)
+            if expiry['expired']:
+                LOG.info(
+                    'Regenerating %s, expiring on %s.', entry.document_name,
+                    expiry['expiry_date'])
+                return True
+        if self._regenerate_changed and entry.kind == 'cert':
+            info = self._keys.cert_info(cert)
+            kwargs = entry.kwargs
+            if (info['subject'].get('common_name') != kwargs['cn']
+                    or sorted(info['subject'].get('names', []))
+                    != sorted(kwargs['groups'] + [kwargs['cn']])
+                    or sorted(set(info.get('sans') or [])) != sorted(set(
+                        kwargs['hosts']))):
+                LOG.info(
+                    'Regenerating %s, changed in the catalog.',
+                    entry.document_name)
+                return True
+        return False
+
+    def _generate(self, entries):
+        """Generate the documents of ``entries`` lacking them."""
+        pending = [e for e in entries if e.regenerate and not e.same_as]
+        tasks = []
+        for entry in pending:
+            kwargs = dict(entry.kwargs)
+            if entry.ca is not None:
+                ca_cert, ca_key = entry.ca.docs
+                kwargs['ca_cert'] = _data(ca_cert)
+                kwargs['ca_key'] = _data(ca_key)
+            tasks.append(
+                (
+                    _GENERATORS[entry.kind], entry.document_name, kwargs,
+                    self._block_strings, self._duration))
+        for entry, docs in zip(pending, pool.parallel_map(_generate, tasks,
+                                                          self._jobs)):
+            entry.docs = docs
+        for entry in entries:
+            if entry.docs is None:
+                entry.docs = entry.same_as.docs
 
     def _find_docs(self, kinds, document_name):
         schemas = ['deckhand/%s/v1' % k for k in kinds]
@@ -196,15 +306,24 @@ class PKIGenerator(object):
         documents = self.get_documents()
         output_paths = set()
 
+        if self._expiring_within is not None or self._regenerate_changed:
+            # Only rewrite the files holding regenerated documents, along with
+            # the documents they share these files with.
+            changed = {
+                self._output_path(output_dir, document)
+                for document in documents
+                if _key(document) in self._regenerated
+            }
+            documents = [
+                document for document in documents
+                if self._output_path(output_dir, document) in changed
+            ]
+
         # First, delete each of the output paths below because we do an append
         # action in the `open` call below. This means that for regeneration
         # of certs, the original paths must be deleted.
         for document in documents:
-            output_file_path = md.get_document_path(
-                sitename=self._sitename,
-                wrapper_document=document,
-                cert_to_ca_map=self._cert_to_ca_map)
-            output_path = os.path.join(output_dir, 'site', output_file_path)
+            output_path = self._output_path(output_dir, document)
             # NOTE(felipemonteiro): This is currently an entirely safe
             # operation as these files are being removed in the temporarily
             # replicated versions of the local repositories.
@@ -213,11 +332,7 @@ class PKIGenerator(object):
 
         # Next, generate (or regenerate) the certificates.
         for document in documents:
-            output_file_path = md.get_document_path(
-                sitename=self._sitename,
-                wrapper_document=document,
-                cert_to_ca_map=self._cert_to_ca_map)
-            output_path = os.path.join(output_dir, 'site', output_file_path)
+            output_path = self._output_path(output_dir, document)
             dir_name = os.path.dirname(output_path)
 
             if not os.path.exists(dir_name):
@@ -241,12 +356,38 @@ class PKIGenerator(object):
             output_paths.add(output_path)
         return output_paths
 
+    def _output_path(self, output_dir, document):
+        output_file_path = md.get_document_path(
+            sitename=self._sitename,
+            wrapper_document=document,
+            cert_to_ca_map=self._cert_to_ca_map)
+        return os.path.join(output_dir, 'site', output_file_path)
+
     def get_documents(self):
         return list(
             itertools.chain.from_iterable(
                 v.values() for v in self.outputs.values()))
 
 
+def _key(wrapper_document):
+    wrapped_document = wrapper_document['data']['managedDocument']
+    return wrapped_document['schema'], wrapped_document['metadata']['name']
+
+
+def _data(wrapper_document):
+    """Return the decrypted data of a PKI document."""
+    return PeglegSecretManagement(
+        docs=[wrapper_document]).get_decrypted_secrets()[0]['data']
+
+
+def _generate(task):
+    """Generate the documents of a PKI entry, in a worker process."""
+    method, document_name, kwargs, block_strings, duration = task
+    keys = pki_utility.PKIUtility(
+        block_strings=block_strings, duration=duration)
+    return getattr(keys, method)(document_name, **kwargs)
+
+
 def get_host_list(service_names):
     service_list = []
     for service in service_names:
@@ -16,19 +16,17 @@ from collections import OrderedDict
 import datetime
 import json
 import logging
-import os
 # Ignore bandit false positive: B404:blacklist
 # The purpose of this module is to safely encapsulate calls via fork.
 import subprocess  # nosec
-import tempfile
 
 from dateutil import parser
 import pytz
 import yaml
 
+from pegleg import config
+from pegleg.engine.catalog import pki_backend
 from pegleg.engine import exceptions
-from pegleg.engine import util
-from pegleg.engine.util.catalog import decode_bytes
 from pegleg.engine.util.pegleg_managed_document import \
     PeglegManagedSecretsDocument
 
@@ -36,6 +34,20 @@ LOG = logging.getLogger(__name__)
 
 __all__ = ['PKIUtility']
 
+DEFAULT_KEY = {'algo': 'rsa', 'size': 2048}
+
+# Supported sizes of each key algorithm, the first being the default.
+KEY_SIZES = OrderedDict(
+    [
+        ('rsa', (2048, 3072, 4096)),
+        ('ecdsa', (256, 384, 521)),
+        ('ed25519', (None, )),
+    ])
+# Key algorithms supported for CAs and certificates, as Ed25519 certificates
+# are not widely supported by TLS clients yet.
+CERTIFICATE_KEY_ALGORITHMS = ('rsa', 'ecdsa')
+KEYPAIR_KEY_ALGORITHMS = ('rsa', 'ecdsa', 'ed25519')
+
 # TODO(felipemonteiro): Create an abstract base class for other future Catalog
 # classes.
 
@@ -43,9 +55,11 @@ __all__ = ['PKIUtility']
 class PKIUtility(object):
     """Public Key Infrastructure utility class.
 
-    Responsible for generating certificate and CA documents using ``cfssl`` and
-    keypairs using ``openssl``. These secrets are all wrapped in instances
-    of ``pegleg/PeglegManagedDocument/v1``.
+    Responsible for generating certificate and CA documents and keypairs
+    using a :class:`~pegleg.engine.catalog.pki_backend.PKIBackend`, by
+    default the in-process ``cryptography`` backend, otherwise ``cfssl`` and
+    ``openssl``. These secrets are all wrapped in instances of
+    ``pegleg/PeglegManagedDocument/v1``.
 
     """
     @staticmethod
@@ -58,10 +72,12 @@ class PKIUtility(object):
         except subprocess.CalledProcessError:
             return False
 
-    def __init__(self, *, block_strings=True, duration=None):
+    def __init__(self, *, block_strings=True, duration=None, backend=None):
         self.block_strings = block_strings
         self._ca_config_string = None
         self.duration = duration
+        self.backend = pki_backend.get_backend(
+            backend or config.get_pki_backend())
 
     @property
     def ca_config(self):
@@ -83,45 +99,49 @@ class PKIUtility(object):
                 })
         return self._ca_config_string
 
-    def generate_ca(self, ca_name):
+    def generate_ca(self, ca_name, key=None):
         """Generate CA cert and associated key.
 
         :param str ca_name: Name of Certificate Authority in wrapped document.
+        :param dict key: Key ``algo`` and ``size``. Defaults to RSA 2048.
         :returns: Tuple of (wrapped CA cert, wrapped CA key)
         :rtype: tuple[dict, dict]
 
         """
 
-        result = self._cfssl(
-            ['gencert', '-initca', 'csr.json'],
-            files={'csr.json': self.csr(name=ca_name)})
+        result = self.backend.generate_ca(self.csr(name=ca_name, key=key))
 
         return (
             self._wrap_ca(ca_name, result['cert']),
             self._wrap_ca_key(ca_name, result['key']))
 
-    def generate_keypair(self, name):
+    def generate_keypair(self, name, key=None):
         """Generate keypair.
 
         :param str name: Name of keypair in wrapped document.
+        :param dict key: Key ``algo`` and ``size``. Defaults to RSA 2048.
         :returns: Tuple of (wrapped public key, wrapped private key)
         :rtype: tuple[dict, dict]
 
         """
 
-        priv_result = self._openssl(['genrsa', '-out', 'priv.pem'])
-        pub_result = self._openssl(
-            ['rsa', '-in', 'priv.pem', '-pubout', '-out', 'pub.pem'],
-            files={
-                'priv.pem': priv_result['priv.pem'],
-            })
+        result = self.backend.generate_keypair(
+            key_spec(key, KEYPAIR_KEY_ALGORITHMS, name))
 
         return (
-            self._wrap_pub_key(name, pub_result['pub.pem']),
-            self._wrap_priv_key(name, priv_result['priv.pem']))
+            self._wrap_pub_key(name, result['pub']),
+            self._wrap_priv_key(name, result['priv']))
 
     def generate_certificate(
-            self, name, *, ca_cert, ca_key, cn, groups=None, hosts=None):
+            self,
+            name,
+            *,
+            ca_cert,
+            ca_key,
+            cn,
+            groups=None,
+            hosts=None,
+            key=None):
         """Generate certificate and associated key given CA cert and key.
 
         :param str name: Name of certificate in wrapped document.
@@ -130,6 +150,7 @@ class PKIUtility(object):
         :param str cn: Common name associated with certificate.
         :param list groups: List of groups associated with certificate.
         :param list hosts: List of hosts associated with certificate.
+        :param dict key: Key ``algo`` and ``size``. Defaults to RSA 2048.
         :returns: Tuple of (wrapped certificate, wrapped certificate key)
         :rtype: tuple[dict, dict]
 
@@ -140,32 +161,17 @@ class PKIUtility(object):
         if hosts is None:
             hosts = []
 
-        result = self._cfssl(
-            [
-                'gencert', '-ca', 'ca.pem', '-ca-key', 'ca-key.pem', '-config',
-                'ca-config.json', 'csr.json'
-            ],
-            files={
-                'ca-config.json': self.ca_config,
-                'ca.pem': ca_cert,
-                'ca-key.pem': ca_key,
-                'csr.json': self.csr(name=cn, groups=groups, hosts=hosts),
-            })
+        result = self.backend.generate_certificate(
+            self.csr(name=cn, groups=groups, hosts=hosts, key=key),
+            ca_cert=ca_cert,
+            ca_key=ca_key,
+            ca_config=self.ca_config)
 
         return (
             self._wrap_cert(name, result['cert']),
             self._wrap_cert_key(name, result['key']))
 
-    def csr(
-            self,
-            *,
-            name,
-            groups=None,
-            hosts=None,
-            key={
-                'algo': 'rsa',
-                'size': 2048
-            }):
+    def csr(self, *, name, groups=None, hosts=None, key=None):
         if groups is None:
             groups = []
         if hosts is None:
@@ -174,7 +180,7 @@ class PKIUtility(object):
         return json.dumps(
             {
                 'CN': name,
-                'key': key,
+                'key': key_spec(key, CERTIFICATE_KEY_ALGORITHMS, name),
                 'hosts': hosts,
                 'names': [{
                     'O': g
@@ -182,7 +188,7 @@ class PKIUtility(object):
             })
 
     def cert_info(self, cert):
-        """Retrieve certificate info via ``cfssl``.
+        """Retrieve certificate info, in ``cfssl certinfo`` format.
 
         :param str cert: Client certificate that contains the public key.
         :returns: Information related to certificate.
@@ -190,16 +196,15 @@ class PKIUtility(object):
 
         """
 
-        return self._cfssl(
-            ['certinfo', '-cert', 'cert.pem'], files={'cert.pem': cert})
+        return self.backend.cert_info(cert)
 
     def check_expiry(self, cert):
         """Chek whether a given certificate is expired.
 
         :param str cert: Client certificate that contains the public key.
         :returns: In dictionary format returns the expiration date of the cert
-            and True if the cert is or will be expired within the next
-            expire_in_days
+            (``expiry_date``, and ``not_after`` in ISO 8601 format) and True
+            if the cert is or will be expired within the next expire_in_days
         :rtype: dict
 
         """
@@ -215,50 +220,11 @@ class PKIUtility(object):
             datetime.timedelta(days=self.duration)
         expired = expiry_window > expiry
         expiry = expiry.strftime('%d-%b-%Y %H:%M:%S %Z')
-        return {'expiry_date': expiry, 'expired': expired}
-
-    def _cfssl(self, command, *, files=None):
-        """Executes ``cfssl`` command via ``subprocess`` call."""
-        if not files:
-            files = {}
-        with tempfile.TemporaryDirectory() as tmp:
-            for filename, data in files.items():
-                util.files.write(
-                    decode_bytes(data), os.path.join(tmp, filename))
-
-            # Ignore bandit false positive:
-            #   B603:subprocess_without_shell_equals_true
-            # This method wraps cfssl calls originating from this module.
-            result = subprocess.check_output(  # nosec
-                ['cfssl'] + command, cwd=tmp, stderr=subprocess.PIPE)
-            result = decode_bytes(result)
-            return json.loads(result)
-
-    def _openssl(self, command, *, files=None):
-        """Executes ``openssl`` command via ``subprocess`` call."""
-        if not files:
-            files = {}
-
-        with tempfile.TemporaryDirectory() as tmp:
-            for filename, data in files.items():
-                util.files.write(
-                    decode_bytes(data), os.path.join(tmp, filename))
-
-            # Ignore bandit false positive:
-            #   B603:subprocess_without_shell_equals_true
-            # This method wraps openssl calls originating from this module.
-            subprocess.check_call(  # nosec
-                ['openssl'] + command,
-                cwd=tmp,
-                stderr=subprocess.PIPE)
-
-            result = {}
-            for filename in os.listdir(tmp):
-                if filename not in files:
-                    with open(os.path.join(tmp, filename), 'r') as f:
-                        result[filename] = f.read()
-
-            return result
+        return {
+            'expiry_date': expiry,
+            'expired': expired,
+            'not_after': expiry_str
+        }
 
     def _wrap_ca(self, name, data):
         return self.wrap_document(
@@ -345,6 +311,35 @@ class PKIUtility(object):
             return data
 
 
+def key_spec(key, algorithms, name):
+    """Return the complete ``algo`` and ``size`` of a ``key`` entry of a
+    ``PKICatalog``.
+
+    :param dict key: Key ``algo`` and ``size``, both optional.
+    :param tuple algorithms: Key algorithms supported for the document.
+    :param str name: Name of the document, for error messages.
+    :raises PKIInvalidKeyError: If the algorithm or size is not supported.
+    """
+    if not key:
+        return dict(DEFAULT_KEY)
+    algo = key.get('algo', DEFAULT_KEY['algo'])
+    sizes = KEY_SIZES.get(algo, ())
+    size = key.get('size', sizes[0] if sizes else None)
+    if algo not in algorithms or size not in sizes:
+        raise exceptions.PKIInvalidKeyError(
+            algo=algo,
+            size=size,
+            name=name,
+            supported=', '.join(
+                '%s %s' % (a, '/'.join(
+                    str(s) for s in KEY_SIZES[a])) if KEY_SIZES[a][0] else a
+                for a in algorithms))
+    spec = {'algo': algo}
+    if size:
+        spec['size'] = size
+    return spec
+
+
 class block_literal(str):
     pass
 
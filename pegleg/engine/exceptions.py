@@ -70,6 +70,11 @@ class GitInvalidRepoException(PeglegBaseException):
     message = 'The repository path or URL is invalid: %(repo_url)s'
 
 
+class GitInvalidRefException(PeglegBaseException):
+    """Exception raised when a reference cannot be resolved in a repo."""
+    message = 'Failed to resolve ref {ref} in repo {repo_url}'
+
+
 class GitMissingUserException(PeglegBaseException):
     """Exception raised when a username is required, but not provided."""
     message = 'Repo URL %(url)s requires a username, but none was provided.'
@@ -143,6 +148,13 @@ class PKICertificateInvalidDuration(PeglegBaseException):
         'a positive integer.')
 
 
+class PKIInvalidKeyError(PeglegBaseException):
+    """Exception for an unsupported PKI key algorithm or size."""
+    message = (
+        'Unsupported key algo={algo}, size={size} for {name}. Supported '
+        'keys are: {supported}.')
+
+
 #
 # CREDENTIALS EXCEPTIONS
 #
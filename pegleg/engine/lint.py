@@ -12,11 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import importlib.metadata
 from importlib.resources import files
 import logging
 import os
 import shutil
 import textwrap
+import time
 
 import click
 from prettytable import PrettyTable
@@ -35,6 +38,13 @@ __all__ = ['full']
 
 LOG = logging.getLogger(__name__)
 
+# Bump whenever a lint check changes so that findings recorded in the lint
+# store by an older version are not reused.
+LINT_RULES_VERSION = '1'
+# Stands in for the file name in stored findings, which are shared by every
+# copy of a file regardless of where the repository was checked out.
+_FILENAME_TOKEN = '\0filename\0'
+
 DECKHAND_SCHEMAS = {
     'root': 'schemas/deckhand-root.yaml',
     'metadata/Control/v1': 'schemas/deckhand-metadata-control.yaml',
@@ -42,7 +52,13 @@ DECKHAND_SCHEMAS = {
 }
 
 
-def full(fail_on_missing_sub_src=False, exclude_lint=None, warn_lint=None):
+def full(
+        fail_on_missing_sub_src=False,
+        exclude_lint=None,
+        warn_lint=None,
+        jobs=1,
+        sitenames=None,
+        timings=None):
     """Lint all sites in a repository.
 
     :param bool fail_on_missing_sub_src: Whether to allow Deckhand rendering
@@ -52,6 +68,16 @@ def full(fail_on_missing_sub_src=False, exclude_lint=None, warn_lint=None):
         defined in :mod:`pegleg.engine.errorcodes`.
     :param list warn_lint: List of lint rules to warn about. See those
         defined in :mod:`pegleg.engine.errorcodes`.
+    :param int jobs: Number of worker processes used to verify files and
+        render sites; 0 means one per CPU. Messages are reported in the same
+        order regardless of this value.
+    :param list sitenames: Only lint these sites, and the files they are
+        built from, e.g. those returned by
+        :func:`pegleg.engine.util.definition.affected_sites`. Defaults to
+        every site in the repository.
+    :param list timings: If given, extended with a ``(site_name,
+        render_errors, seconds)`` tuple per site, ordered by site name. See
+        :func:`format_site_timings`.
     :raises ClickException: If a lint check was caught and it isn't contained
         in ``exclude_lint`` or ``warn_lint``.
     :returns: List of warnings produced, if any.
@@ -64,7 +90,7 @@ def full(fail_on_missing_sub_src=False, exclude_lint=None, warn_lint=None):
     # If policy is cleartext and error is added this will put
     # that particular message into the warns list and all others will
     # be added to the error list if SCHEMA_STORAGE_POLICY_MISMATCH_FLAG
-    messages.extend(_verify_file_contents())
+    messages.extend(_verify_file_contents(sitenames=sitenames, jobs=jobs))
 
     # FIXME(felipemonteiro): Now that we are using revisioned repositories
     # instead of flat directories with subfolders mirroring "revisions",
@@ -79,7 +105,10 @@ def full(fail_on_missing_sub_src=False, exclude_lint=None, warn_lint=None):
     # Deckhand rendering completes without error
     messages.extend(
         _verify_deckhand_render(
-            fail_on_missing_sub_src=fail_on_missing_sub_src))
+            sitenames=sitenames,
+            fail_on_missing_sub_src=fail_on_missing_sub_src,
+            jobs=jobs,
+            timings=timings))
 
     return _filter_messages_by_warn_and_error_lint(
         messages=messages, exclude_lint=exclude_lint, warn_lint=warn_lint)
@@ -205,23 +234,99 @@ def _verify_no_unexpected_files(*, sitenames=None):
     return errors
 
 
-def _verify_file_contents(*, sitename=None):
+def _verify_file_contents(*, sitename=None, sitenames=None, jobs=1):
     if sitename:
-        files = util.definition.site_files(sitename)
+        sitenames = [sitename]
+    if sitenames is not None:
+        # Files shared between sites are only verified once.
+        files = list(
+            dict.fromkeys(
+                f for site_name in sitenames
+                for f in util.definition.site_files(site_name)))
     else:
-        files = util.files.all()
+        files = list(util.files.all())
+
+    # Several chunks per worker keep the pool busy when file sizes vary.
+    chunks = util.pool.chunks(files, util.pool.resolve_jobs(jobs) * 4)
+    errors = []
+    for chunk_errors in util.pool.parallel_map(_verify_files, chunks, jobs):
+        errors.extend(chunk_errors)
+    return errors
+
+
+def _verify_files(filenames):
     schemas = _load_schemas()
 
     errors = []
-    for filename in files:
-        errors.extend(_verify_single_file(filename, schemas))
+    for filename in filenames:
+        errors.extend(_verify_single_file_incrementally(filename, schemas))
     return errors
 
 
+@functools.lru_cache()
+def _rules_version():
+    versions = [LINT_RULES_VERSION]
+    for dist in ('pegleg', 'deckhand'):
+        try:
+            versions.append(importlib.metadata.version(dist))
+        except importlib.metadata.PackageNotFoundError:
+            versions.append('')
+    return ':'.join(versions)
+
+
+def _lint_store():
+    return util.cache.get_cache('lint')
+
+
+def _content_digest(filename):
+    """Return a digest of the content of ``filename``.
+
+    :raises OSError: If ``filename`` cannot be read.
+    """
+    found = util.revision.lookup(filename)
+    if found is not None:
+        # Files read from a Git revision are identified by blob SHA.
+        return found[0].sha(found[1])
+    return util.cache.file_digest(filename)
+
+
+def _verify_single_file_incrementally(filename, schemas):
+    """Return the findings of :func:`_verify_single_file`, reusing those
+    recorded for a file with identical content, location and lint rules.
+    """
+    store = _lint_store()
+    if not store.enabled:
+        return _verify_single_file(filename, schemas)
+    try:
+        content_digest = _content_digest(filename)
+    except OSError:
+        return _verify_single_file(filename, schemas)
+
+    # Besides its content, the findings for a file depend on the layer
+    # expected from its location and on whether it is in a secrets path.
+    key = util.cache.digest(
+        _rules_version(), 'file', content_digest,
+        str(_expected_layer(filename)),
+        str(util.files.file_in_subdir(filename, 'secrets')))
+    findings = store.get(key)
+    if findings is None:
+        findings = [
+            (code, message.replace(filename, _FILENAME_TOKEN))
+            for code, message in _verify_single_file(filename, schemas)
+        ]
+        store.set(key, findings)
+    else:
+        LOG.debug('Reusing lint findings for unchanged file %s.', filename)
+    return [
+        (code, message.replace(_FILENAME_TOKEN, filename))
+        for code, message in findings
+    ]
+
+
 def _verify_single_file(filename, schemas):
     errors = []
     LOG.debug("Validating file %s.", filename)
-    with open(filename, 'r') as f:
+    with util.files.open_document(filename) as f:
         if not f.read(4) == '---\n':
             errors.append(
                 (
@@ -297,6 +402,9 @@ def _handle_managed_document(doc):
     using this so that managed documents and the documents
     that depend on them can be linted.
 
+    The input document is never modified, since parsed documents may be
+    shared between the document sets of several sites.
+
     :param dict doc: A YAML document
     :returns: the processed document
     :rtype: dict
@@ -304,52 +412,152 @@ def _handle_managed_document(doc):
     if "managedDocument" in doc["data"]:
         doc = doc["data"]["managedDocument"]
         if isinstance(doc["data"], bytes):
-            doc["data"] = doc["data"].decode("ascii")
+            doc = dict(doc, data=doc["data"].decode("ascii"))
     return doc
 
 
-def _verify_deckhand_render(*, sitename=None, fail_on_missing_sub_src=False):
+def _verify_deckhand_render(
+        *,
+        sitename=None,
+        sitenames=None,
+        fail_on_missing_sub_src=False,
+        jobs=1,
+        timings=None):
     """Verify Deckhand render works by using all relevant deployment files.
 
+    Render errors are recorded in the lint store against a fingerprint of
+    every file in the site's document set, so a site is only rendered again
+    once one of its inputs (or the lint rules) changed.
+
+    Only ``sitenames`` are rendered if given, otherwise every site. When
+    linting several sites with ``jobs`` other than 1, each site is gathered
+    and rendered in its own worker process. Errors are always reported
+    ordered by site name. A ``(site_name, render_errors, seconds)`` tuple
+    per site is appended to ``timings`` if given; sites whose results were
+    reused from the lint store took 0 seconds.
+
     :returns: List of errors generated during rendering.
     """
     all_errors = []
+    store = _lint_store()
 
     if sitename:
-        documents_to_render = [
-            _handle_managed_document(doc)
-            for doc in util.definition.documents_for_site(sitename)
+        sitenames = [sitename]
+    elif sitenames is None:
+        sitenames = list(util.files.list_sites())
+    results = []
+    fingerprints = {}
+    stale = []
+    for site_name in sitenames:
+        fingerprint = _render_fingerprint(site_name, fail_on_missing_sub_src)
+        errors = store.get(fingerprint) if fingerprint else None
+        if errors is None:
+            fingerprints[site_name] = fingerprint
+            stale.append(site_name)
+        else:
+            LOG.debug(
+                'Reusing render results for unchanged site: %s.', site_name)
+            results.append((site_name, errors, 0.0))
+
+    if sitename:
+        rendered = [
+            _render_site(site_name, fail_on_missing_sub_src)
+            for site_name in stale
+        ]
+    elif jobs != 1:
+        rendered = util.pool.parallel_map(
+            functools.partial(
+                _render_site, fail_on_missing_sub_src=fail_on_missing_sub_src),
+            stale, jobs)
+    else:
+        documents_to_render = util.definition.documents_for_each_site(
+            sitenames=stale)
+        rendered = [
+            _render_site_documents(
+                site_name, documents, fail_on_missing_sub_src)
+            for site_name, documents in documents_to_render.items()
         ]
 
-        LOG.debug('Rendering documents for site: %s.', sitename)
-        _, errors = util.deckhand.deckhand_render(
-            documents=documents_to_render,
-            fail_on_missing_sub_src=fail_on_missing_sub_src,
-            validate=True,
-        )
-        LOG.debug(
-            'Generated %d rendering errors for site: %s.', len(errors),
-            sitename)
+    for site_name, errors, _ in rendered:
+        if fingerprints.get(site_name):
+            store.set(fingerprints[site_name], errors)
+    results.extend(rendered)
+
+    results.sort(key=lambda result: str(result[0]))
+    for _, errors, _ in results:
         all_errors.extend(errors)
-    else:
-        documents_to_render = util.definition.documents_for_each_site()
-
-        for site_name, documents in documents_to_render.items():
-            clean_documents = [
-                _handle_managed_document(doc) for doc in documents
-            ]
-            LOG.debug('Rendering documents for site: %s.', site_name)
-            _, errors = util.deckhand.deckhand_render(
-                documents=clean_documents,
-                fail_on_missing_sub_src=fail_on_missing_sub_src,
-                validate=True,
-            )
-            LOG.debug(
-                'Generated %d rendering errors for site: %s.', len(errors),
-                site_name)
-            all_errors.extend(errors)
+    if timings is not None:
+        timings.extend(
+            (site_name, len(errors), elapsed)
+            for site_name, errors, elapsed in results)
+
+    # De-duplicate while keeping the (deterministic) order of first appearance
+    return list(dict.fromkeys(all_errors))
+
+
+def _render_fingerprint(site_name, fail_on_missing_sub_src):
+    """Fingerprint every input to rendering ``site_name``.
 
-    return list(set(all_errors))
+    :returns: Hex digest, or None if the lint store is disabled or an input
+        cannot be read.
+    """
+    if not _lint_store().enabled:
+        return None
+    try:
+        entries = sorted(
+            '%s:%s' % (_repo_relative_path(f), _content_digest(f))
+            for f in set(util.definition.site_files(site_name)))
+    except OSError:
+        return None
+    return util.cache.digest(
+        _rules_version(), 'render', str(bool(fail_on_missing_sub_src)),
+        *entries)
+
+
+def _repo_relative_path(filename):
+    for r in config.all_repos():
+        if filename.startswith(r):
+            return filename[len(r):]
+    return filename
+
+
+def _render_site(site_name, fail_on_missing_sub_src=False):
+    documents = util.definition.documents_for_site(site_name)
+    return _render_site_documents(
+        site_name, documents, fail_on_missing_sub_src)
+
+
+def _render_site_documents(site_name, documents, fail_on_missing_sub_src):
+    """Render ``documents`` for ``site_name``.
+
+    :returns: Tuple of site name, rendering errors and elapsed seconds.
+    """
+    start = time.monotonic()
+    clean_documents = [_handle_managed_document(doc) for doc in documents]
+    LOG.debug('Rendering documents for site: %s.', site_name)
+    _, errors = util.deckhand.deckhand_render(
+        documents=clean_documents,
+        fail_on_missing_sub_src=fail_on_missing_sub_src,
+        validate=True,
+    )
+    LOG.debug(
+        'Generated %d rendering errors for site: %s.', len(errors), site_name)
+    return site_name, errors, time.monotonic() - start
+
+
+def format_site_timings(timings):
+    """Format the per-site render timings collected by :func:`full`.
+
+    :param list timings: ``(site_name, render_errors, seconds)`` tuples.
+    :returns: The timings as a table.
+    :rtype: str
+    """
+    timings_table = PrettyTable()
+    timings_table.field_names = ['site', 'render_errors', 'seconds']
+    timings_table.align['site'] = 'l'
+    for site_name, errors, elapsed in timings:
+        timings_table.add_row([site_name, errors, '%.2f' % elapsed])
+    return timings_table.get_string()
 
 
 def _layer(data):
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import atexit
+import concurrent.futures
 import logging
 import os
 import re
@@ -34,6 +35,10 @@ _INVALID_FORMAT_MSG = (
 
 LOG = logging.getLogger(__name__)
 
+# Upper bound on the number of extra repositories cloned, fetched or checked
+# out at the same time.
+MAX_CONCURRENT_REPOSITORIES = 8
+
 
 @atexit.register
 def _clean_temp_folders():
@@ -51,9 +56,11 @@ def process_repositories(site_name, overwrite_existing=False):
     """
 
     # Only tracks extra repositories - not the site (primary) repository.
-    extra_repos = []
+    repos_to_process = []
 
-    site_repo = process_site_repository(overwrite_existing=overwrite_existing)
+    site_repo = process_site_repository(
+        overwrite_existing=overwrite_existing,
+        sparse_paths=_sparse_paths(site_name))
 
     # Retrieve extra repo data from site-definition.yaml files.
     site_data = util.definition.load_as_params(
@@ -95,12 +102,12 @@ def process_repositories(site_name, overwrite_existing=False):
             "Processing repository %s with url=%s, repo_key=%s, "
             "repo_username=%s, revision=%s", repo_alias, repo_url_or_path,
             repo_key, repo_user, repo_revision)
+        repos_to_process.append((repo_alias, repo_url_or_path, repo_revision))
 
-        temp_extra_repo = _process_repository(
-            repo_url_or_path,
-            repo_revision,
-            overwrite_existing=overwrite_existing)
-        extra_repos.append(temp_extra_repo)
+    extra_repos = _process_extra_repositories(
+        repos_to_process,
+        overwrite_existing=overwrite_existing,
+        sparse_paths=_sparse_paths(site_name, site_data.get('site_type')))
 
     # Overwrite the site repo and extra repos in the config because further
     # processing will fail if they contain revision info in their paths.
@@ -111,13 +118,84 @@ def process_repositories(site_name, overwrite_existing=False):
     config.set_extra_repo_list(extra_repos)
 
 
-def process_site_repository(update_config=False, overwrite_existing=False):
+def _sparse_paths(site_name, site_type=None):
+    """Return the directories to check out for ``site_name`` when cloning
+    in ``sparse`` clone mode, or None in other clone modes.
+
+    Every type is checked out if ``site_type`` isn't known (yet).
+    """
+    if config.get_clone_mode() != 'sparse':
+        return None
+    # An empty site type turns its directory into the parent of all types.
+    return [
+        os.path.normpath(path) for path in util.files.relative_directories_for(
+            site_name=site_name, site_type=site_type or '')
+    ]
+
+
+def _process_extra_repositories(
+        repos, overwrite_existing=False, sparse_paths=None):
+    """Process each of ``repos`` concurrently, on a bounded thread pool.
+
+    :param list repos: ``(repo_alias, repo_url_or_path, repo_revision)``
+        tuples.
+    :param overwrite_existing: Whether to overwrite an existing directory
+    :param sparse_paths: Directories to check out of remote repositories in
+        ``sparse`` clone mode.
+    :returns: Path of each processed repository, in the order of ``repos``.
+    :rtype: list
+    :raises ClickException: Listing every repository that failed, if more
+        than one did. A single failure is raised as is.
+
+    """
+    if not repos:
+        return []
+
+    workers = min(len(repos), MAX_CONCURRENT_REPOSITORIES)
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='pegleg-repository') as executor:
+        futures = [
+            executor.submit(
+                _process_repository,
+                repo_url_or_path,
+                repo_revision,
+                overwrite_existing=overwrite_existing,
+                sparse_paths=sparse_paths)
+            for _, repo_url_or_path, repo_revision in repos
+        ]
+
+    repo_paths = []
+    errors = []
+    for (repo_alias, repo_url_or_path, _), future in zip(repos, futures):
+        try:
+            repo_paths.append(future.result())
+        except Exception as e:
+            LOG.error(
+                'Failed to process repository %s with url=%s: %s', repo_alias,
+                repo_url_or_path, e)
+            errors.append((repo_alias, repo_url_or_path, e))
+
+    if len(errors) == 1:
+        raise errors[0][2]
+    elif errors:
+        raise click.ClickException(
+            'Failed to process %d repositories:\n%s' % (
+                len(errors), '\n'.join(
+                    '%s (%s): %s' % error for error in errors)))
+    return repo_paths
+
+
+def process_site_repository(
+        update_config=False, overwrite_existing=False, sparse_paths=None):
     """Process and setup site repository including ensuring we are at the right
     revision based on the site's own site-definition.yaml file.
 
     :param bool update_config: Whether to update Pegleg config with computed
         site repo path.
     :param overwrite_existing: Whether to overwrite an existing directory
+    :param sparse_paths: Directories to check out if the site repository is
+        remote and cloned in ``sparse`` clone mode.
 
     """
 
@@ -133,7 +211,10 @@ def process_site_repository(update_config=False, overwrite_existing=False):
     config.set_site_rev(repo_revision)
     repo_url_or_path = _format_url_with_repo_username(repo_url_or_path)
     new_repo_path = _process_repository(
-        repo_url_or_path, repo_revision, overwrite_existing=overwrite_existing)
+        repo_url_or_path,
+        repo_revision,
+        overwrite_existing=overwrite_existing,
+        sparse_paths=sparse_paths)
 
     if update_config:
         # Overwrite the site repo in the config because further processing will
@@ -145,12 +226,17 @@ def process_site_repository(update_config=False, overwrite_existing=False):
 
 
 def _process_repository(
-        repo_url_or_path, repo_revision, overwrite_existing=False):
+        repo_url_or_path,
+        repo_revision,
+        overwrite_existing=False,
+        sparse_paths=None):
     """Process a repository located at ``repo_url_or_path``.
 
     :param str repo_url_or_path: Path to local repo or URL of remote URL.
     :param str repo_revision: branch, commit or ref in the repo to checkout.
     :param overwrite_existing: Whether to overwrite an existing directory
+    :param sparse_paths: Directories, relative to ``repo_url_or_path``, to
+        check out if it is cloned in ``sparse`` clone mode.
 
     """
 
@@ -160,17 +246,36 @@ def _process_repository(
         __REPO_FOLDERS.setdefault(repo_name, parent_temp_path)
         new_temp_path = os.path.join(parent_temp_path, repo_name)
         norm_path, sub_path = util.git.normalize_repo_path(repo_url_or_path)
-        shutil.copytree(src=norm_path, dst=new_temp_path, symlinks=True)
+        if repo_revision and not config.get_checkout():
+            try:
+                util.revision.register(new_temp_path, norm_path, repo_revision)
+                return os.path.join(new_temp_path, sub_path)
+            except exceptions.GitInvalidRefException:
+                LOG.info(
+                    'ref=%s not found locally for repo=%s, checking it out '
+                    'instead', repo_revision, norm_path)
+        try:
+            util.git.replicate(norm_path, new_temp_path)
+        except exceptions.GitException as e:
+            LOG.info(
+                'Failed to replicate repo=%s, copying it instead: %s',
+                norm_path, e)
+            shutil.rmtree(new_temp_path, ignore_errors=True)
+            shutil.copytree(src=norm_path, dst=new_temp_path, symlinks=True)
         __REPO_FOLDERS.setdefault(repo_name, new_temp_path)
         git_repo_path = _process_site_repository(new_temp_path, repo_revision)
         return os.path.join(git_repo_path, sub_path)
     else:
         repo_url, sub_path = util.git.normalize_repo_path(repo_url_or_path)
-        git_repo_path = _process_site_repository(repo_url, repo_revision)
+        if sparse_paths:
+            sparse_paths = [os.path.join(sub_path, p) for p in sparse_paths]
+        git_repo_path = _process_site_repository(
+            repo_url, repo_revision, sparse_paths=sparse_paths)
         return os.path.join(git_repo_path, sub_path)
 
 
-def _process_site_repository(repo_url_or_path, repo_revision):
+def _process_site_repository(
+        repo_url_or_path, repo_revision, sparse_paths=None):
     """Process the primary or site repository located at ``repo_url_or_path``.
 
     Also validate that the provided ``repo_url_or_path`` is a valid Git
@@ -186,6 +291,7 @@ def _process_site_repository(repo_url_or_path, repo_revision):
         * <LOCAL_REPO_PATH>@<ref>
         * same values as above without @<ref>
     :param str repo_revision: branch, commit or ref in the repo to checkout.
+    :param sparse_paths: Directories to check out in ``sparse`` clone mode.
 
     """
 
@@ -197,8 +303,11 @@ def _process_site_repository(repo_url_or_path, repo_revision):
         "Processing repository %s with url=%s, repo_key=%s, "
         "repo_username=%s, revision=%s", repo_alias, repo_url_or_path,
         repo_key, repo_user, repo_revision)
+    kwargs = {}
+    if sparse_paths:
+        kwargs['sparse_paths'] = sparse_paths
     return _handle_repository(
-        repo_url_or_path, ref=repo_revision, auth_key=repo_key)
+        repo_url_or_path, ref=repo_revision, auth_key=repo_key, **kwargs)
 
 
 def _get_and_validate_site_repositories(site_name, site_data):
@@ -349,8 +458,11 @@ def _handle_repository(repo_url_or_path, *args, **kwargs):
     clone_path = config.get_clone_path()
 
     try:
-        return util.git.git_handler(
+        repo_path = util.git.git_handler(
             repo_url_or_path, clone_path=clone_path, *args, **kwargs)
+        # A checkout may have changed files that were already indexed.
+        util.index.invalidate()
+        return repo_path
     except exceptions.GitException as e:
         raise click.ClickException(e)
     except Exception as e:
@@ -14,9 +14,11 @@
 
 from collections import OrderedDict
 from glob import glob
+import json
 import logging
 import os
 import re
+import time
 
 from prettytable import PrettyTable
 import yaml
@@ -32,13 +34,17 @@ from pegleg.engine.util import files
 from pegleg.engine.util.pegleg_managed_document import \
     PeglegManagedSecretsDocument as PeglegManagedSecret
 from pegleg.engine.util.pegleg_secret_management import PeglegSecretManagement
+from pegleg.engine.util import pool
 
 __all__ = ('encrypt', 'decrypt', 'generate_passphrases', 'wrap_secret')
 
 LOG = logging.getLogger(__name__)
 
+_CERT_PATTERN = re.compile(
+    r'-----BEGIN CERTIFICATE-----.*?-----END CERTIFICATE-----', re.DOTALL)
 
-def encrypt(save_location, author, site_name, path=None):
+
+def encrypt(save_location, author, site_name, path=None, jobs=1):
     """
     Encrypt all secrets documents for a site identifies by site_name.
 
@@ -58,6 +64,8 @@ def encrypt(save_location, author, site_name, path=None):
     encrypts the secrets documents.
     :param str site_name: The name of the site to encrypt its secrets files.
     :param str path: The path to the directory or file to be encrypted.
+    :param int jobs: Number of worker processes encrypting files
+    concurrently. 0 means one per CPU.
     """
 
     files.check_file_save_location(save_location)
@@ -81,12 +89,8 @@ def encrypt(save_location, author, site_name, path=None):
         file_sets = list(definition.site_files_by_repo(site_name))
 
     LOG.info('Started encrypting...')
-    secrets_found = False
+    tasks = []
     for repo_base, file_path in file_sets:
-        LOG.debug('Looking at %s in %s repo', file_path, repo_base)
-        secrets_found = True
-        secret = PeglegSecretManagement(
-            file_path=file_path, author=author, site_name=site_name)
         if path_exists:
             if save_location:
                 output_path = os.path.join(
@@ -96,16 +100,30 @@ def encrypt(save_location, author, site_name, path=None):
                 output_path = file_path
         else:
             output_path = _get_dest_path(repo_base, file_path, save_location)
-        LOG.debug('Outputting encrypted data to %s', output_path)
-        secret.encrypt_secrets(output_path)
+        tasks.append((file_path, output_path, author, site_name))
 
-    if secrets_found:
+    if tasks:
+        start = time.monotonic()
+        results = pool.parallel_map(_encrypt_file, tasks, jobs)
+        _report('Encrypted', results, time.monotonic() - start)
         LOG.info('Encryption of all secret files was completed.')
     else:
         LOG.warning('No secret documents were found for site: %s', site_name)
 
 
-def decrypt(path, site_name=None):
+def _encrypt_file(task):
+    """Encrypt the secrets of one file, in a worker process."""
+    file_path, output_path, author, site_name = task
+    start = time.monotonic()
+    size = os.path.getsize(file_path)
+    LOG.debug('Outputting encrypted data of %s to %s', file_path, output_path)
+    secret = PeglegSecretManagement(
+        file_path=file_path, author=author, site_name=site_name)
+    written = secret.encrypt_secrets(output_path)
+    return file_path, written, size, time.monotonic() - start
+
+
+def decrypt(path, site_name=None, jobs=1):
     """Decrypt one secrets file, and print the decrypted file to standard out.
 
     Search the specified file_path for a file.
@@ -116,6 +134,9 @@ def decrypt(path, site_name=None):
     Passphrase and salt for the decryption are read from environment variables.
     :param path: Path to the file to be unwrapped and decrypted.
     :type path: string
+    :param jobs: Number of worker processes decrypting files concurrently. 0
+    means one per CPU.
+    :type jobs: int
     :return: The decrypted secrets
     :rtype: dict
     """
@@ -129,19 +150,57 @@ def decrypt(path, site_name=None):
         return file_dict
 
     if os.path.isfile(path):
-        file_dict[path] = PeglegSecretManagement(
-            path, site_name=site_name).decrypt_secrets()
+        file_list = [path]
     else:
         match = os.path.join(path, '**', '*.yaml')
         file_list = glob(match, recursive=True)
         if not file_list:
             LOG.warning('No YAML files were discovered in path: %s', path)
-        for file_path in file_list:
-            file_dict[file_path] = PeglegSecretManagement(
-                file_path).decrypt_secrets()
+            return file_dict
+
+    start = time.monotonic()
+    results = pool.parallel_map(
+        _decrypt_file, [(file_path, site_name) for file_path in file_list],
+        jobs)
+    _report(
+        'Decrypted', [
+            (file_path, True, size, seconds)
+            for file_path, _, size, seconds in results
+        ],
+        time.monotonic() - start)
+    for file_path, data, _, _ in results:
+        file_dict[file_path] = data
     return file_dict
 
 
+def _decrypt_file(task):
+    """Decrypt the secrets of one file, in a worker process."""
+    file_path, site_name = task
+    start = time.monotonic()
+    data = PeglegSecretManagement(
+        file_path, site_name=site_name).decrypt_secrets()
+    return (
+        file_path, data, os.path.getsize(file_path), time.monotonic() - start)
+
+
+def _report(action, results, elapsed):
+    """Log the outcome of processing secrets files concurrently.
+
+    :param results: ``(file_path, processed, size, seconds)`` of each file.
+    """
+    count = total = 0
+    for file_path, processed, size, seconds in results:
+        LOG.debug(
+            '%s %s (%d bytes) in %.3fs', action if processed else 'Skipped',
+            file_path, size, seconds)
+        if processed:
+            count += 1
+            total += size
+    LOG.info(
+        '%s %d of %d files (%d bytes) in %.2fs.', action, count, len(results),
+        total, elapsed)
+
+
 def _get_dest_path(repo_base, file_path, save_location):
     """
     Calculate and return the destination base directory path for the
@@ -268,7 +327,7 @@ def wrap_secret(
         explicit_end=True)
 
 
-def check_cert_expiry(site_name, duration=60):
+def check_cert_expiry(site_name, duration=60, jobs=1, output_format='table'):
     """
     Check certs from a sites PKICatalog to determine if they are expired or
     expiring within N days
@@ -276,45 +335,110 @@ def check_cert_expiry(site_name, duration=60):
     :param str site_name: The site to read from
     :param int duration: Number of days from today to check cert
         expirations
-    :rtype: str
+    :param int jobs: Number of worker processes scanning files.
+    :param str output_format: ``table`` of the expiring certificates, or
+        ``json`` report of all certificates.
+    :returns: Whether any certificate is expiring, and the report.
+    :rtype: tuple[bool, str]
+    """
+    results = scan_cert_expiry([site_name], duration=duration, jobs=jobs)
+    return _cert_expiry_report(results, duration, output_format, sites=False)
+
+
+def check_repo_cert_expiry(duration=60, jobs=1, output_format='table'):
+    """Check the certs of all sites of the site repository, in one pass.
+
+    Same as :func:`check_cert_expiry`, for every site, with the site of each
+    certificate in the report.
     """
+    results = scan_cert_expiry(
+        sorted(files.list_sites()), duration=duration, jobs=jobs)
+    return _cert_expiry_report(results, duration, output_format, sites=True)
+
 
+def scan_cert_expiry(site_names, duration=60, jobs=1):
+    """Scan the certificate files of ``site_names`` for certificates expired
+    or expiring within ``duration`` days.
+
+    Files are read, decrypted and their certificates parsed concurrently on
+    up to ``jobs`` worker processes.
+
+    :param list site_names: Sites to scan.
+    :param int duration: Number of days from today to check cert
+        expirations.
+    :param int jobs: Number of worker processes; 0 means one per CPU.
+    :returns: For each certificate, in site, file and document order, a
+        dict with its ``site``, ``file``, ``cert_name``, ``schema``,
+        ``not_after`` (ISO 8601) and ``expiry_date`` and whether it is
+        ``expired``.
+    :rtype: list
+    """
+    if duration is None or duration < 0:
+        raise exceptions.PKICertificateInvalidDuration()
+    tasks = []
+    for site_name in site_names:
+        # Site files may be encrypted with the global credentials of each
+        # site, so they travel with the tasks.
+        global_creds = get_global_creds(site_name)
+        tasks.extend(
+            (site_name, path, duration, global_creds)
+            for path in definition.site_files(site_name)
+            if 'certificate' in path)
+    return [
+        result for results in pool.parallel_map(_scan_cert_file, tasks, jobs)
+        for result in results
+    ]
+
+
+def _scan_cert_file(task):
+    site_name, path, duration, global_creds = task
     cert_schemas = [
         'deckhand/Certificate/v1', 'deckhand/CertificateAuthority/v1'
     ]
     pki_util = PKIUtility(duration=duration)
-    # Create a table to output expired/expiring certs for this site.
+    with files.open_document(path) as f:
+        documents = list(yaml.safe_load_all(f))  # Validate valid YAML.
+    results = []
+    for document in PeglegSecretManagement(
+            docs=documents, global_creds=global_creds).get_decrypted_secrets():
+        if document['schema'] not in cert_schemas:
+            continue
+        for cert in _CERT_PATTERN.findall(document['data']):
+            cert_info = pki_util.check_expiry(cert)
+            results.append(
+                {
+                    'site': site_name,
+                    'file': path,
+                    'cert_name': document['metadata']['name'],
+                    'schema': document['schema'],
+                    'not_after': cert_info['not_after'],
+                    'expiry_date': cert_info['expiry_date'],
+                    'expired': cert_info['expired'],
+                })
+    return results
+
+
+def _cert_expiry_report(results, duration, output_format, sites):
+    expired = [r for r in results if r['expired']]
+    if output_format == 'json':
+        report = json.dumps(
+            {
+                'days': duration,
+                'expiring': len(expired),
+                'certificates': results
+            },
+            indent=2)
+        return bool(expired), report
+
+    # Create a table to output expired/expiring certs.
     cert_table = PrettyTable()
-    cert_table.field_names = ['file', 'cert_name', 'expiration_date']
-    expired_certs_exist = False
-
-    s = definition.site_files(site_name)
-    for doc in s:
-        if 'certificate' in doc:
-            with open(doc, 'r') as f:
-                results = yaml.safe_load_all(f)  # Validate valid YAML.
-                results = PeglegSecretManagement(
-                    docs=results).get_decrypted_secrets()
-                for result in results:
-                    if result['schema'] in cert_schemas:
-                        text = result['data']
-                        header_pattern = '-----BEGIN CERTIFICATE-----'
-                        footer_pattern = '-----END CERTIFICATE-----'
-                        find_pattern = r'%s.*?%s' % (
-                            header_pattern, footer_pattern)
-                        certs = re.findall(find_pattern, text, re.DOTALL)
-                        for cert in certs:
-                            cert_info = pki_util.check_expiry(cert)
-                            if cert_info['expired'] is True:
-                                cert_table.add_row(
-                                    [
-                                        doc, result['metadata']['name'],
-                                        cert_info['expiry_date']
-                                    ])
-                                expired_certs_exist = True
-
+    columns = ['file', 'cert_name', 'expiration_date']
+    cert_table.field_names = ['site'] + columns if sites else columns
+    for result in expired:
+        row = [result['file'], result['cert_name'], result['expiry_date']]
+        cert_table.add_row([result['site']] + row if sites else row)
     # Return table of cert names and expiration dates that are expiring
-    return expired_certs_exist, cert_table.get_string()
+    return bool(expired), cert_table.get_string()
 
 
 def get_global_creds(site_name):
@@ -14,7 +14,9 @@
 
 from collections import OrderedDict
 import logging
+import mmap
 import os
+import sys
 
 import click
 import git
@@ -23,6 +25,7 @@ import yaml
 from yaml.constructor import SafeConstructor
 
 from pegleg import config
+from pegleg.engine import exceptions
 from pegleg.engine import util
 from pegleg.engine.util import files
 from pegleg.engine.util.files import add_representer_ordered_dict
@@ -34,34 +37,95 @@ LOG = logging.getLogger(__name__)
 
 
 def _read_and_format_yaml(filename):
-    with open(filename, 'r') as f:
+    with files.open_document(filename) as f:
         lines_to_write = f.readlines()
-        if lines_to_write[0] != '---\n':
+        if not lines_to_write or lines_to_write[0] != '---\n':
             lines_to_write = ['---\n'] + lines_to_write
+        if not lines_to_write[-1].endswith('\n'):
+            lines_to_write[-1] += '\n'
         if lines_to_write[-1] != '...\n':
             lines_to_write.append('...\n')
     return lines_to_write or []
 
 
+def _write_document_file(filename, out):
+    """Write the documents in ``filename`` to binary stream ``out``, adding
+    leading ``---`` and trailing ``...`` markers where missing.
+
+    The file body is copied as-is with :func:`files.copy_range`, so large
+    sites are collected without reading every file into Python. Files with
+    carriage returns go through :func:`_read_and_format_yaml` instead, so
+    that their line endings are normalized to ``\n``.
+    """
+    found = util.revision.lookup(filename)
+    if found is not None:
+        data = found[0].read(found[1])
+        markers = _document_markers(data)
+        if markers is None:
+            out.write(''.join(_read_and_format_yaml(filename)).encode())
+        else:
+            out.write(markers[0] + data + markers[1])
+        return
+
+    with open(filename, 'rb') as src:
+        size = os.fstat(src.fileno()).st_size
+        if not size:
+            out.write(b'---\n...\n')
+            return
+        with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            markers = _document_markers(m)
+        if markers is None:
+            out.write(''.join(_read_and_format_yaml(filename)).encode())
+            return
+        out.write(markers[0])
+        files.copy_range(src, out, size)
+        out.write(markers[1])
+
+
+def _document_markers(data):
+    """Return the bytes to write before and after the document file
+    content ``data`` (bytes or an mmap), or None if it has carriage returns.
+    """
+    if not data:
+        return b'---\n', b'...\n'
+    if data.find(b'\r') != -1:
+        return None
+    has_start = data[:4] == b'---\n'
+    tail = data[-5:]
+    if tail[-4:] == b'\n...' or len(data) == 3 and tail == b'...':
+        # Only the newline ending the last line is missing.
+        end = b'\n'
+    elif tail == b'\n...\n' or len(data) == 4 and tail == b'...\n':
+        end = b''
+    elif tail[-1:] == b'\n':
+        end = b'...\n'
+    else:
+        end = b'\n...\n'
+    return b'' if has_start else b'---\n', end
+
+
+def _deployment_data(site_name):
+    add_representer_ordered_dict()
+    return yaml.safe_dump(
+        get_deployment_data_doc(site_name),
+        explicit_start=True,
+        explicit_end=True,
+        default_flow_style=False).encode()
+
+
 def _collect_to_stdout(site_name):
     """Collects all documents related to ``site_name`` and outputs them to
-    stdout via ``output_stream``.
+    stdout through a single buffered binary stream.
     """
     try:
+        # Keep anything already echoed ahead of the collected documents.
+        sys.stdout.flush()
+        out = sys.stdout.buffer
         for repo_base, filename in util.definition.site_files_by_repo(
                 site_name):
-            for line in _read_and_format_yaml(filename):
-                # This code is a pattern to convert \r\n to \n.
-                click.echo("\n".join(line.splitlines()))
-        add_representer_ordered_dict()
-        res = yaml.safe_dump(
-            get_deployment_data_doc(site_name),
-            explicit_start=True,
-            explicit_end=True,
-            default_flow_style=False)
-        # Click isn't splitting these lines correctly, so do it manually
-        for line in res.split('\n'):
-            click.echo(line)
+            _write_document_file(filename, out)
+        out.write(_deployment_data(site_name))
+        out.flush()
     except Exception as ex:
         raise click.ClickException("Error printing output: %s" % str(ex))
 
@@ -82,16 +146,10 @@ def _collect_to_file(site_name, save_location):
             repo_name = os.path.normpath(repo_base).split(os.sep)[-1]
             save_file = os.path.join(save_location, repo_name + '.yaml')
             if repo_name not in save_files:
-                save_files[repo_name] = open(save_file, 'w')
+                save_files[repo_name] = open(save_file, 'wb')
             LOG.debug("Collecting file %s to file %s", filename, save_file)
-            save_files[repo_name].writelines(_read_and_format_yaml(filename))
-        add_representer_ordered_dict()
-        save_files[curr_site_repo].writelines(
-            yaml.safe_dump(
-                get_deployment_data_doc(site_name),
-                default_flow_style=False,
-                explicit_start=True,
-                explicit_end=True))
+            _write_document_file(filename, save_files[repo_name])
+        save_files[curr_site_repo].write(_deployment_data(site_name))
     except Exception as ex:
         raise click.ClickException("Error saving output: %s" % str(ex))
     finally:
@@ -132,7 +190,7 @@ def get_rendered_docs(site_name, validate=True):
     SafeConstructor.add_multi_constructor(
         '', lambda loader, suffix, node: None)
     for filename in util.definition.site_files(site_name):
-        with open(filename, 'r') as f:
+        with files.open_document(filename) as f:
             docs = yaml.safe_load_all(f)
 
             for doc in docs:
@@ -189,6 +247,34 @@ def list_(output_stream):
         click.echo(msg)
 
 
+def affected(since):
+    """Return the names of sites in the primary repository whose inputs
+    changed since the Git ref ``since``.
+
+    :raises click.ClickException: If ``since`` cannot be resolved.
+    """
+    try:
+        changed = util.git.changed_files(config.get_site_repo(), since)
+    except exceptions.GitInvalidRefException as e:
+        raise click.ClickException(e.message)
+    LOG.debug('Found %d files changed since %s.', len(changed), since)
+    return util.definition.affected_sites(changed)
+
+
+def list_affected(since, output_stream):
+    """List the names of sites whose inputs changed since ``since``.
+
+    One site name is written per line, so the output can be fed straight
+    back into other commands; nothing is written if no site is affected.
+    """
+    sitenames = affected(since)
+    msg = ''.join(site_name + '\n' for site_name in sitenames)
+    if output_stream:
+        files.write(msg, output_stream)
+    elif msg:
+        click.echo(msg, nl=False)
+
+
 def show(site_name, output_stream):
     data = util.definition.load_as_params(site_name)
     data['files'] = list(util.definition.site_files(site_name))
@@ -253,6 +339,21 @@ def get_deployment_data_doc(site_name):
 
 
 def _get_repo_deployment_data_stanza(repo_path):
+    """Return the commit, tag (or branch) and dirtiness of the repo at
+    ``repo_path``, memoized within a session.
+    """
+    memo = util.session.memo('deployment-data')
+    key = os.path.abspath(repo_path)
+    if key not in memo:
+        found = util.revision.lookup(repo_path)
+        if found is not None:
+            memo[key] = _get_revision_deployment_data_stanza(found[0])
+        else:
+            memo[key] = _get_checkout_deployment_data_stanza(repo_path)
+    return dict(memo[key])
+
+
+def _get_checkout_deployment_data_stanza(repo_path):
     try:
         repo = git.Repo(repo_path)
         commit = repo.commit()
@@ -261,7 +362,7 @@ def _get_repo_deployment_data_stanza(repo_path):
         # The repo may not appear dirty if Pegleg has made a temporary commit
         # on top of changed/untracked files, but we know if that temporary
         # commit happened the repo is indeed dirty
-        dirty = (repo.is_dirty() or contains_pegleg_commit)
+        dirty = (contains_pegleg_commit or repo.is_dirty())
 
         if contains_pegleg_commit:
             # The commit grabbed above isn't really what we want this data to
@@ -272,7 +373,7 @@ def _get_repo_deployment_data_stanza(repo_path):
                 commit = commit.parents[0]
 
         # If we're at a particular tag, reference it
-        tag = [tag.name for tag in repo.tags if tag.commit == commit]
+        tag = util.git.tags_by_commit(repo_path).get(commit.hexsha)
         if tag:
             tag = ", ".join(tag)
         else:
@@ -287,3 +388,18 @@ def _get_repo_deployment_data_stanza(repo_path):
         return {"commit": commit.hexsha, "tag": tag, "dirty": dirty}
     except git.InvalidGitRepositoryError:
         return {"commit": "None", "tag": "None", "dirty": "None"}
+
+
+def _get_revision_deployment_data_stanza(revision):
+    """Like :func:`_get_repo_deployment_data_stanza`, for a repository
+    read at a Git revision: what a checkout of that revision would report.
+    """
+    repo = git.Repo(revision.repo_path)
+    tag = util.git.tags_by_commit(revision.repo_path).get(revision.commit)
+    if tag:
+        tag = ", ".join(tag)
+    elif revision.ref in repo.heads:
+        tag = revision.ref
+    else:
+        tag = "Detached HEAD"
+    return {"commit": revision.commit, "tag": tag, "dirty": False}
@@ -13,8 +13,13 @@
 # limitations under the License.
 
 # flake8: noqa
+from pegleg.engine.util import cache
 from pegleg.engine.util import catalog
 from pegleg.engine.util import definition
 from pegleg.engine.util import deckhand
 from pegleg.engine.util import files
 from pegleg.engine.util import git
+from pegleg.engine.util import index
+from pegleg.engine.util import pool
+from pegleg.engine.util import revision
+from pegleg.engine.util import session
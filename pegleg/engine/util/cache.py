@@ -0,0 +1,346 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent, content-addressed cache for expensive intermediate results.
+
+Entries are stored under ``<cache dir>/<namespace>/<key[:2]>/<key>`` where
+``key`` is a hex digest computed by the caller (see :func:`digest`). Each
+entry is written atomically and carries a header with the format version,
+its own key and a SHA-256 of the payload, so that truncated, corrupted or
+foreign files are treated as misses rather than trusted. Since entries are
+unpickled, the cache directory and each namespace in it are created private
+to the invoking user, and are ignored altogether if they are owned by
+someone else or writable by group or others.
+
+Least recently used entries (by mtime, refreshed on every hit) are evicted
+at interpreter exit whenever a namespace grows beyond the configured size.
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+# Ignore bandit false positive: B403:import_pickle
+# Only entries written by this module, under a directory owned by the
+# invoking user, are unpickled, and every payload is digest-checked first.
+import pickle  # nosec
+import stat
+import tempfile
+import time
+
+from pegleg import config
+
+LOG = logging.getLogger(__name__)
+
+__all__ = (
+    'DiskCache', 'digest', 'file_digest', 'get_cache', 'namespaces', 'stats')
+
+FORMAT_VERSION = b'1'
+_HEADER = b'pegleg-cache-v' + FORMAT_VERSION + b'\n'
+_DIGEST_SIZE = hashlib.sha256().digest_size
+
+_RACY_MTIME_NS = 2 * 10**9
+
+_CACHES = {}
+_FILE_DIGESTS = {}
+_PRIVATE_DIRS = set()
+_UNTRUSTED_DIRS = set()
+
+
+def digest(*parts):
+    """Return a hex SHA-256 digest over ``parts`` (``str`` or ``bytes``)."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8', 'surrogateescape')
+        h.update(part)
+        # Separator so that ('ab', 'c') and ('a', 'bc') differ.
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _is_private(st):
+    """Return whether ``st`` is owned by the invoking user and not writable
+    by group or others.
+    """
+    return (
+        st.st_uid == os.getuid()
+        and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+
+def _private_dir(path, create):
+    """Return whether ``path`` is a directory private to the invoking user,
+    first creating it with mode 0700 if ``create`` is set.
+    """
+    if path in _PRIVATE_DIRS:
+        return True
+    if create:
+        try:
+            os.makedirs(path, mode=0o700, exist_ok=True)
+        except OSError as e:
+            LOG.debug('Unable to create cache directory %s: %s', path, e)
+            return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(st.st_mode):
+        return False
+    if not _is_private(st):
+        if path not in _UNTRUSTED_DIRS:
+            _UNTRUSTED_DIRS.add(path)
+            LOG.warning(
+                'Ignoring cache directory %s: it must be owned by the '
+                'current user and not writable by group or others.', path)
+        return False
+    _PRIVATE_DIRS.add(path)
+    return True
+
+
+class DiskCache(object):
+    """Size-bounded on-disk store of pickled values for one namespace.
+
+    The cache directory is resolved lazily from :mod:`pegleg.config` so that
+    ``--cache-dir`` (or ``PEGLEG_CACHE_DIR``) takes effect even when the
+    cache object was created at import time.
+    """
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @property
+    def path(self):
+        return os.path.join(config.get_cache_dir(), self.namespace)
+
+    @property
+    def enabled(self):
+        return config.get_cache_enabled()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _trusted(self, create=False):
+        """Return whether the cache and namespace directories are private
+        to the invoking user, creating them first if ``create`` is set.
+        """
+        return (
+            _private_dir(config.get_cache_dir(), create)
+            and _private_dir(self.path, create))
+
+    def get(self, key, default=None):
+        """Return the value stored for ``key`` or ``default`` on a miss."""
+        if not self.enabled:
+            return default
+        entry = self._entry_path(key)
+        try:
+            if not self._trusted():
+                raise PermissionError
+            with open(entry, 'rb') as f:
+                if not _is_private(os.fstat(f.fileno())):
+                    LOG.debug('Ignoring foreign cache entry %s', entry)
+                    raise PermissionError
+                raw = f.read()
+        except OSError:
+            self.misses += 1
+            return default
+
+        value = self._decode(key, raw, entry)
+        if value is None:
+            self.misses += 1
+            return default
+
+        try:
+            # Refresh the mtime so that pruning evicts the least recently
+            # used entries first.
+            os.utime(entry)
+        except OSError:
+            pass
+        self.hits += 1
+        return value[0]
+
+    def set(self, key, value):
+        """Atomically store ``value`` for ``key``; failures are not fatal."""
+        if not self.enabled:
+            return
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            LOG.debug('Not caching unpicklable value for %s: %s', key, e)
+            return
+        if not self._trusted(create=True):
+            return
+        entry = self._entry_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(entry), mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(entry), prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER)
+                f.write(key.encode('ascii') + b'\n')
+                f.write(hashlib.sha256(payload).digest())
+                f.write(payload)
+            os.replace(tmp_path, entry)
+            tmp_path = None
+            self.writes += 1
+        except OSError as e:
+            LOG.debug('Unable to write cache entry %s: %s', entry, e)
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    def _decode(self, key, raw, entry):
+        """Validate ``raw`` and return ``(value,)``, or None if invalid."""
+        key_line = key.encode('ascii') + b'\n'
+        offset = len(_HEADER) + len(key_line)
+        if (not raw.startswith(_HEADER)
+                or raw[len(_HEADER):offset] != key_line):
+            LOG.debug('Ignoring cache entry %s with bad header', entry)
+            return None
+        expected = raw[offset:offset + _DIGEST_SIZE]
+        payload = raw[offset + _DIGEST_SIZE:]
+        if hashlib.sha256(payload).digest() != expected:
+            LOG.debug('Ignoring corrupt cache entry %s', entry)
+            return None
+        try:
+            # Ignore bandit false positive: B301:pickle
+            # The payload was written by this module and its digest has
+            # just been verified.
+            return (pickle.loads(payload), )  # nosec
+        except Exception as e:
+            LOG.debug('Ignoring unreadable cache entry %s: %s', entry, e)
+            return None
+
+    def _entries(self):
+        for root, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def size(self):
+        """Return the total size in bytes of this namespace on disk."""
+        return sum(size for _, size, _ in self._entries())
+
+    def usage(self):
+        """Return the number of entries and their total size in bytes."""
+        count = total = 0
+        for _, size, _ in self._entries():
+            count += 1
+            total += size
+        return count, total
+
+    def prune(self, max_size=None):
+        """Evict least recently used entries until under ``max_size``."""
+        if max_size is None:
+            max_size = config.get_cache_max_size()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        if removed:
+            LOG.debug(
+                'Evicted %d entries from %s cache.', removed, self.namespace)
+        return removed
+
+    def clear(self):
+        """Remove every entry from this namespace."""
+        for _, _, path in list(self._entries()):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+def file_digest(path):
+    """Return the hex SHA-256 digest of the content of file ``path``.
+
+    Digests are remembered for the life of the process, keyed on the path,
+    size and modification time, except for files modified in the last couple
+    of seconds whose mtime could still be shared with a later write.
+
+    :raises OSError: If ``path`` cannot be read.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    result = _FILE_DIGESTS.get(memo_key)
+    if result is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        result = h.hexdigest()
+        if time.time_ns() - st.st_mtime_ns > _RACY_MTIME_NS:
+            _FILE_DIGESTS[memo_key] = result
+    return result
+
+
+def get_cache(namespace):
+    """Return the process-wide :class:`DiskCache` for ``namespace``."""
+    if namespace not in _CACHES:
+        _CACHES[namespace] = DiskCache(namespace)
+    return _CACHES[namespace]
+
+
+def namespaces():
+    """Return the names of the namespaces present in the cache directory."""
+    root = config.get_cache_dir()
+    try:
+        return sorted(
+            name for name in os.listdir(root)
+            if os.path.isdir(os.path.join(root, name)))
+    except FileNotFoundError:
+        return []
+
+
+def stats():
+    """Return ``{namespace: {'hits': n, 'misses': n, 'writes': n}}``."""
+    return {
+        name: {
+            'hits': c.hits,
+            'misses': c.misses,
+            'writes': c.writes
+        }
+        for name, c in sorted(_CACHES.items())
+    }
+
+
+@atexit.register
+def _report_and_prune():
+    for name, c in sorted(_CACHES.items()):
+        if c.hits or c.misses:
+            LOG.info(
+                'Cache %s: %d hits, %d misses, %d writes.', name, c.hits,
+                c.misses, c.writes)
+        if c.writes and c.enabled:
+            try:
+                c.prune()
+            except OSError as e:
+                LOG.debug('Unable to prune %s cache: %s', name, e)
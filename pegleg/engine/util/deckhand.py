@@ -12,12 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import base64
+import importlib.metadata
+import json
+import logging
+
 from deckhand.engine import document_validation
 from deckhand.engine import layering
 from deckhand import errors as dh_errors
 
+from pegleg import config
 from pegleg.engine.errorcodes import DECKHAND_DUPLICATE_SCHEMA
 from pegleg.engine.errorcodes import DECKHAND_RENDER_EXCEPTION
+from pegleg.engine.util import cache
+from pegleg.engine.util import pegleg_managed_document as md
+from pegleg.engine.util import session
+
+LOG = logging.getLogger(__name__)
+
+# Bump whenever deckhand_render's output for the same input changes.
+_RENDER_CACHE_VERSION = '1'
+_RENDER_CACHE = cache.get_cache('render')
 
 
 def load_schemas_from_docs(documents):
@@ -43,9 +58,86 @@ def load_schemas_from_docs(documents):
     return schema_set, errors
 
 
+def _json_default(obj):
+    if isinstance(obj, bytes):
+        return {'__bytes__': base64.b64encode(obj).decode('ascii')}
+    return {'__%s__' % type(obj).__name__: str(obj)}
+
+
+def _deckhand_version():
+    try:
+        return importlib.metadata.version('deckhand')
+    except importlib.metadata.PackageNotFoundError:
+        return ''
+
+
+def render_fingerprint(documents, fail_on_missing_sub_src, validate):
+    """Return a stable fingerprint of a ``deckhand_render`` call.
+
+    The documents are serialized canonically (sorted keys, in document
+    order), so equal document sets always produce the same fingerprint,
+    whichever files or process they were loaded from.
+    """
+    serialized = json.dumps(
+        documents,
+        sort_keys=True,
+        separators=(',', ':'),
+        default=_json_default)
+    return cache.digest(
+        _RENDER_CACHE_VERSION, _deckhand_version(),
+        str(bool(fail_on_missing_sub_src)), str(bool(validate)), serialized)
+
+
 def deckhand_render(
         documents=None, fail_on_missing_sub_src=False, validate=True):
+    """Render ``documents`` with Deckhand, optionally validating them.
+
+    Results are kept in the persistent ``render`` cache, keyed on
+    :func:`render_fingerprint`, so rendering an unchanged document set
+    again only costs a cache lookup. Within a document session they are
+    also kept in memory, so a document set is rendered at most once per
+    command even with the persistent cache disabled. Renders that may
+    contain secrets in cleartext, because repositories were decrypted or
+    any of ``documents`` is a decrypted secret, are only kept in memory.
+
+    :returns: Tuple of the rendered documents and a list of errors.
+    """
     documents = documents or []
+
+    try:
+        key = render_fingerprint(documents, fail_on_missing_sub_src, validate)
+    except (TypeError, ValueError) as e:
+        LOG.debug('Unable to fingerprint documents, not caching: %s', e)
+        key = None
+    memo = session.memo('render')
+    if key and key in memo:
+        LOG.debug('Reusing render of %d documents.', len(documents))
+        result = memo[key]
+    else:
+        result = _RENDER_CACHE.get(key) if key else None
+        if result is not None:
+            LOG.debug('Reusing cached render of %d documents.', len(documents))
+        else:
+            result = _render(documents, fail_on_missing_sub_src, validate)
+            if key and _persistable(documents):
+                _RENDER_CACHE.set(key, result)
+        if key:
+            memo[key] = result
+
+    # Callers may extend the returned lists; keep the memoized ones intact.
+    rendered_documents, errors = result
+    return list(rendered_documents), list(errors)
+
+
+def _persistable(documents):
+    """Return whether the render of ``documents`` may be cached on disk."""
+    if config.get_decrypt_repos() or md.has_cleartext_secrets(documents):
+        LOG.debug('Not caching render of documents with cleartext secrets.')
+        return False
+    return True
+
+
+def _render(documents, fail_on_missing_sub_src, validate):
     errors = []
     rendered_documents = []
 
@@ -23,7 +23,8 @@ from pegleg.engine.util import files
 
 __all__ = [
     'load', 'load_as_params', 'path', 'pluck', 'site_files',
-    'site_files_by_repo', 'documents_for_each_site', 'documents_for_site'
+    'site_files_by_repo', 'documents_for_each_site', 'documents_for_site',
+    'site_consumers', 'affected_sites'
 ]
 
 
@@ -85,24 +86,87 @@ def site_files_by_repo(site_name):
             yield (repo, filename)
 
 
-def documents_for_each_site():
+def site_consumers(primary_repo_base=None):
+    """Index the primary repository's input directories by the sites that
+    consume them.
+
+    Every file a site is built from lives under one of the directories
+    returned by :func:`files.directories_for` for that site, so a file maps
+    to the sites of each indexed directory it is contained in.
+
+    :param str primary_repo_base: Path to primary repository.
+    :returns: Dictionary of sorted site names, keyed by the real path of
+        each input directory.
+    :rtype: dict
+    """
+    if not primary_repo_base:
+        primary_repo_base = config.get_site_repo()
+    consumers = {}
+    for sitename in files.list_sites(primary_repo_base):
+        params = load_as_params(sitename, primary_repo_base=primary_repo_base)
+        dir_map = files.directories_for_each_repo(**params)
+        for directory in dir_map.get(primary_repo_base, []):
+            consumers.setdefault(os.path.realpath(directory),
+                                 set()).add(sitename)
+    return {d: sorted(sites) for d, sites in consumers.items()}
+
+
+def affected_sites(filenames, primary_repo_base=None):
+    """Return the sites consuming any of ``filenames``.
+
+    Files are matched by path only, so deleted files count as well. Files
+    that :func:`files.search` would never pick up (anything that is not a
+    ``.yaml`` file, or is under a hidden or ``tools`` directory) affect no
+    site.
+
+    :param iterable filenames: Paths of changed files.
+    :param str primary_repo_base: Path to primary repository.
+    :returns: Sorted list of site names.
+    :rtype: list
+    """
+    consumers = site_consumers(primary_repo_base)
+    affected = set()
+    for filename in filenames:
+        filename = os.path.realpath(filename)
+        for directory, sitenames in consumers.items():
+            relpath = os.path.relpath(filename, directory)
+            if relpath.startswith(os.pardir) or not _searched(relpath):
+                continue
+            affected.update(sitenames)
+    return sorted(affected)
+
+
+def _searched(relpath):
+    *dirnames, basename = relpath.split(os.sep)
+    if any(d.startswith('.') or d == 'tools' for d in dirnames):
+        return False
+    return not basename.startswith('.') and basename.endswith('.yaml')
+
+
+def documents_for_each_site(sitenames=None):
     """Gathers all relevant documents per site, which includes all type and
     global documents that are needed to render each site document.
 
+    Global and type files are shared by many sites, so each file is parsed
+    (and each directory searched) only once per call; every site references
+    the same immutable per-file document tuples rather than its own copies.
+
+    :param list sitenames: Sites for which to gather documents. Defaults to
+        every site in the primary repository.
     :returns: Dictionary of documents, keyed by each site name.
     :rtype: dict
 
     """
 
-    sitenames = list(files.list_sites())
-    documents = {s: [] for s in sitenames}
+    if sitenames is None:
+        sitenames = list(files.list_sites())
+    documents = {}
+    corpus = _Corpus()
 
     for sitename in sitenames:
         params = load_as_params(sitename)
         paths = files.directories_for(**params)
-        filenames = set(files.search(paths))
-        for filename in filenames:
-            documents[sitename].extend(files.read(filename))
+        documents[sitename] = corpus.documents_for(paths)
 
     return documents
 
@@ -117,12 +181,37 @@ def documents_for_site(sitename):
 
     """
 
-    documents = []
-
     params = load_as_params(sitename)
     paths = files.directories_for(**params)
-    filenames = set(files.search(paths))
-    for filename in filenames:
-        documents.extend(files.read(filename))
+    return _Corpus().documents_for(paths)
 
-    return documents
+
+class _Corpus(object):
+    """Parse-once store of the documents found under a set of directories.
+
+    Search results are remembered per directory and parsed documents per
+    file, so that directories shared between sites (``global`` and
+    ``type/<x>``) are only walked and parsed once.
+    """
+    def __init__(self):
+        self._filenames = {}
+        self._documents = {}
+
+    def filenames_for(self, paths):
+        filenames = set()
+        for path in paths:
+            if path not in self._filenames:
+                self._filenames[path] = tuple(files.search(path))
+            filenames.update(self._filenames[path])
+        return sorted(filenames)
+
+    def documents_for(self, paths):
+        filenames = self.filenames_for(paths)
+        unread = [f for f in filenames if f not in self._documents]
+        for filename, documents in zip(unread, files.read_many(unread)):
+            self._documents[filename] = tuple(documents)
+
+        documents = []
+        for filename in filenames:
+            documents.extend(self._documents[filename])
+        return documents
@@ -13,8 +13,12 @@
 # limitations under the License.
 
 import collections
+import errno
+import io
 import logging
 import os
+import shutil
+import tempfile
 
 import click
 import yaml
@@ -22,10 +26,20 @@ from yaml.constructor import SafeConstructor
 
 from pegleg import config
 from pegleg.engine import util
+from pegleg.engine.util import cache
+from pegleg.engine.util import index
 from pegleg.engine.util import pegleg_managed_document as md
+from pegleg.engine.util import pool
+from pegleg.engine.util import revision
+from pegleg.engine.util import session
 
 LOG = logging.getLogger(__name__)
 
+# Bump whenever the filtering performed by ``read`` changes, so that stale
+# cached document lists are never returned.
+_READ_CACHE_VERSION = '1'
+_READ_CACHE = cache.get_cache('documents')
+
 __all__ = [
     'all',
     'create_global_directories',
@@ -33,16 +47,21 @@ __all__ = [
     'create_site_type_directories',
     'directories_for',
     'directory_for',
+    'relative_directories_for',
     'dump',
     'safe_dump',
     'dump_all',
+    'open_document',
     'read',
+    'read_many',
     'write',
     'existing_directories',
     'search',
     'slurp',
     'check_file_save_location',
     'collect_files_by_repo',
+    'iter_files_by_repo',
+    'copy_range',
 ]
 
 DIR_DEPTHS = {
@@ -117,6 +136,7 @@ FULL_STRUCTURE = {
 
 
 def _create_tree(root_path, *, tree=FULL_STRUCTURE):
+    index.invalidate()
     for name, data in tree.get('directories', {}).items():
         path = os.path.join(root_path, name)
         os.makedirs(os.path.abspath(path), exist_ok=True)
@@ -128,13 +148,21 @@ def _create_tree(root_path, *, tree=FULL_STRUCTURE):
             yaml.safe_dump(yaml_data, f)
 
 
-def directories_for(*, site_name, site_type):
-    library_list = [
+def relative_directories_for(*, site_name, site_type):
+    """Provide the directories, relative to the root of each repo, that
+    documents for ``site_name`` are collected from.
+    """
+    return [
         _global_root_path(),
         _site_type_root_path(site_type),
         _site_path(site_name),
     ]
 
+
+def directories_for(*, site_name, site_type):
+    library_list = relative_directories_for(
+        site_name=site_name, site_type=site_type)
+
     return [
         os.path.join(b, lib) for b in config.all_repos()
         for lib in library_list
@@ -148,11 +176,8 @@ def directories_for_each_repo(*, site_name, site_type):
     must be collated by repo. Provide the list of source directories
     by repo.
     """
-    library_list = [
-        _global_root_path(),
-        _site_type_root_path(site_type),
-        _site_path(site_name),
-    ]
+    library_list = relative_directories_for(
+        site_name=site_name, site_type=site_type)
 
     dir_map = dict()
     for r in config.all_repos():
@@ -187,10 +212,8 @@ def list_sites(primary_repo_base=None):
         primary_repo_base = config.get_site_repo()
     full_site_path = os.path.join(
         primary_repo_base, config.get_rel_site_path())
-    for path in os.listdir(full_site_path):
-        joined_path = os.path.join(full_site_path, path)
-        if os.path.isdir(joined_path):
-            yield path
+    for path in index.subdirectories(full_site_path):
+        yield path
 
 
 def list_types(primary_repo_base=None):
@@ -199,10 +222,8 @@ def list_types(primary_repo_base=None):
         primary_repo_base = config.get_site_repo()
     full_type_path = os.path.join(
         primary_repo_base, config.get_rel_type_path())
-    for path in os.listdir(full_type_path):
-        joined_path = os.path.join(full_type_path, path)
-        if os.path.isdir(joined_path):
-            yield path
+    for path in index.subdirectories(full_type_path):
+        yield path
 
 
 def directory_for(*, path):
@@ -224,13 +245,42 @@ def existing_directories():
     return directories
 
 
+def _exists(path):
+    found = revision.lookup(path)
+    if found is not None:
+        return found[0].exists(found[1])
+    return os.path.exists(path)
+
+
+def open_document(path, mode='r'):
+    """Open the file ``path`` of a repository for reading, in text or
+    binary ``mode``.
+
+    Files of repositories read at a Git revision (see
+    :mod:`pegleg.engine.util.revision`) are read from the object database
+    into an in-memory stream.
+    """
+    found = revision.lookup(path)
+    if found is None:
+        return open(path, mode)
+    data = found[0].read(found[1])
+    if 'b' in mode:
+        stream = io.BytesIO(data)
+    else:
+        # Translate line endings like open() does.
+        stream = io.StringIO(data.decode('utf-8'), newline=None)
+    # Parse errors refer to the stream's name.
+    stream.name = path
+    return stream
+
+
 def slurp(path):
-    if not os.path.exists(path):
+    if not _exists(path):
         raise click.ClickException(
             '%s not found. Pegleg must be run from the root of a configuration'
             ' repository.' % path)
 
-    with open(path, 'r') as f:
+    with open_document(path) as f:
         try:
             # Ignore YAML tags, only construct dicts
             SafeConstructor.add_multi_constructor(
@@ -242,6 +292,7 @@ def slurp(path):
 
 def dump(data, path, flag='w', **kwargs):
     add_representer_ordered_dict()
+    index.invalidate()
     os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
     with open(path, flag) as f:
 
@@ -250,6 +301,7 @@ def dump(data, path, flag='w', **kwargs):
 
 def safe_dump(data, path, flag='w', **kwargs):
     add_representer_ordered_dict()
+    index.invalidate()
     os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
     with open(path, flag) as f:
 
@@ -258,6 +310,7 @@ def safe_dump(data, path, flag='w', **kwargs):
 
 def dump_all(data, path, flag='w', **kwargs):
     add_representer_ordered_dict()
+    index.invalidate()
     os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
     with open(path, flag) as f:
 
@@ -268,13 +321,78 @@ def read(path):
     """
     Read the yaml file ``path`` and return its contents as a list of
     dicts
+
+    Within a :func:`pegleg.engine.util.session.session`, each file is only
+    parsed once; later reads of an unchanged file return the same document
+    dicts, which callers must therefore not modify.
     """
 
+    found = revision.lookup(path)
+    if found is not None:
+        return _read_blob(path, *found)
+
+    documents = _read_memoized(path)
+    if documents is None:
+        documents = _read(path)
+        _memoize(path, documents)
+    return documents
+
+
+def _not_found(path):
+    return click.ClickException(
+        '{} not found. Pegleg must be run from the root of a '
+        'configuration repository.'.format(path))
+
+
+def _read(path):
     if not os.path.exists(path):
-        raise click.ClickException(
-            '{} not found. Pegleg must be run from the root of a '
-            'configuration repository.'.format(path))
+        raise _not_found(path)
+
+    with open(path, 'r') as stream:
+        content = stream.read()
+        key = _read_cache_key(content)
+        documents = _READ_CACHE.get(key)
+        if documents is not None:
+            return documents
+
+        # Parse from the stream rather than the string so that error marks
+        # keep referring to the file name.
+        stream.seek(0)
+        documents = _parse(stream, path)
 
+    _cache_documents(key, documents)
+    return documents
+
+
+def _read_blob(path, rev, relpath):
+    """Read ``path``, file ``relpath`` of Git revision ``rev``.
+
+    Blobs are immutable, so the documents are cached by blob SHA: a file
+    unchanged between revisions is only ever parsed once.
+    """
+    try:
+        sha = rev.sha(relpath)
+    except FileNotFoundError:
+        raise _not_found(path)
+
+    memo = session.memo('blobs')
+    documents = memo.get(sha)
+    if documents is not None:
+        return list(documents)
+
+    key = cache.digest(_READ_CACHE_VERSION, 'blob', sha)
+    documents = _READ_CACHE.get(key)
+    if documents is None:
+        with open_document(path) as stream:
+            documents = _parse(stream, path)
+        _cache_documents(key, documents)
+    if session.active():
+        memo[sha] = tuple(documents)
+    return documents
+
+
+def _parse(stream, path):
+    """Return the Deckhand and Pegleg managed documents in ``stream``."""
     def is_deckhand_document(document):
         # Deckhand documents only consist of control and application
         # documents.
@@ -299,20 +417,135 @@ def read(path):
         return md.PeglegManagedSecretsDocument.is_pegleg_managed_secret(
             document)
 
-    with open(path, 'r') as stream:
-        # Ignore YAML tags, only construct dicts
-        SafeConstructor.add_multi_constructor(
-            '', lambda loader, suffix, node: None)
-        try:
-            return [
-                d for d in yaml.safe_load_all(stream) if d and (
-                    is_deckhand_document(d) or is_pegleg_managed_document(d))
-            ]
-        except yaml.YAMLError as e:
-            raise click.ClickException('Failed to parse %s:\n%s' % (path, e))
+    # Ignore YAML tags, only construct dicts
+    SafeConstructor.add_multi_constructor(
+        '', lambda loader, suffix, node: None)
+    try:
+        return [
+            d for d in yaml.safe_load_all(stream) if d and (
+                is_deckhand_document(d) or is_pegleg_managed_document(d))
+        ]
+    except yaml.YAMLError as e:
+        raise click.ClickException('Failed to parse %s:\n%s' % (path, e))
 
 
-def write(data, file_path, sort_keys=False):
+def _cache_documents(key, documents):
+    """Store ``documents`` in the document cache, unless they may hold
+    secrets in cleartext, which must never outlive the command.
+    """
+    if config.get_decrypt_repos() or md.has_cleartext_secrets(documents):
+        LOG.debug('Not caching documents holding cleartext secrets.')
+        return
+    _READ_CACHE.set(key, documents)
+
+
+def _read_cache_key(content):
+    return cache.digest(_READ_CACHE_VERSION, content)
+
+
+def _stat_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def _read_memoized(path):
+    """Return the documents read from ``path`` earlier in the current
+    session, or None.
+    """
+    entry = session.memo('documents').get(path)
+    if entry is None:
+        return None
+    signature, documents = entry
+    try:
+        if _stat_signature(path) != signature:
+            return None
+    except OSError:
+        return None
+    return list(documents)
+
+
+def _memoize(path, documents):
+    if not session.active():
+        return
+    try:
+        signature = _stat_signature(path)
+    except OSError:
+        return
+    session.memo('documents')[path] = (signature, tuple(documents))
+
+
+def _read_cached(path):
+    """Return the cached documents for ``path``, or None if not cached."""
+    try:
+        with open(path, 'r') as stream:
+            content = stream.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return _READ_CACHE.get(_read_cache_key(content))
+
+
+def _read_batch(paths):
+    return [read(path) for path in paths]
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def read_many(paths, jobs=None):
+    """Read each of ``paths`` like :func:`read`, in parallel when worthwhile.
+
+    Files already read in the current session, or in the document cache, are
+    served in-process. The remaining files are split into ordered batches
+    and parsed in worker processes, unless they add up to less than
+    :func:`pegleg.config.get_parse_parallel_threshold` bytes, in which case
+    starting workers would cost more than it saves.
+
+    :param paths: Iterable of YAML file paths.
+    :param int jobs: Number of worker processes; defaults to
+        :func:`pegleg.config.get_parse_jobs`. 0 means one per CPU.
+    :returns: List holding the list of documents of each path, in the same
+        order as ``paths``.
+    :rtype: list
+    """
+    paths = list(paths)
+    if jobs is None:
+        jobs = config.get_parse_jobs()
+    jobs = pool.resolve_jobs(jobs)
+    if jobs <= 1 or pool.in_worker():
+        return _read_batch(paths)
+
+    results = []
+    for path in paths:
+        documents = _read_memoized(path)
+        if documents is None:
+            documents = _read_cached(path)
+            if documents is not None:
+                _memoize(path, documents)
+        results.append(documents)
+    pending = [i for i, documents in enumerate(results) if documents is None]
+    pending_size = sum(_file_size(paths[i]) for i in pending)
+    if pending_size < config.get_parse_parallel_threshold():
+        jobs = 1
+    LOG.debug(
+        'Parsing %d of %d files (%d bytes) with %d jobs.', len(pending),
+        len(paths), pending_size, jobs)
+
+    # Several batches per worker keep the pool busy when file sizes vary.
+    batches = pool.chunks(pending, jobs * 4)
+    parsed = pool.parallel_map(
+        _read_batch, [[paths[i] for i in batch] for batch in batches], jobs)
+    for batch, batch_documents in zip(batches, parsed):
+        for i, documents in zip(batch, batch_documents):
+            results[i] = documents
+            _memoize(paths[i], documents)
+    return results
+
+
+def write(data, file_path, sort_keys=False, atomic=False):
     """
     Write the data to destination file_path.
 
@@ -325,11 +558,23 @@ def write(data, file_path, sort_keys=False):
     :type data: str, dict, or a list of dicts
     :param sort_keys: sort keys alphabetically in output yaml
     :type sort_keys: bool
+    :param atomic: write to a temporary file renamed to file_path once
+        complete, so that file_path is never left partially written
+    :type atomic: bool
     """
     add_representer_ordered_dict()
+    index.invalidate()
+    tmp_path = None
     try:
-        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
-        with open(file_path, 'w') as stream:
+        dir_name = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(dir_name, exist_ok=True)
+        if atomic:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=dir_name, prefix='.tmp-', suffix='.yaml')
+            stream = os.fdopen(fd, 'w')
+        else:
+            stream = open(file_path, 'w')
+        with stream:
             if isinstance(data, str):
                 stream.write(data)
             elif isinstance(data, (dict, collections.abc.Iterable)):
@@ -346,9 +591,30 @@ def write(data, file_path, sort_keys=False):
                 raise ValueError(
                     'data must be str or dict, '
                     'not {}'.format(type(data)))
+        if atomic:
+            os.chmod(tmp_path, _file_mode(file_path))
+            os.replace(tmp_path, file_path)
+            tmp_path = None
     except EnvironmentError as e:
         raise click.ClickError(
             "Couldn't write data to {}: {}".format(file_path, e))
+    finally:
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def _file_mode(file_path):
+    """Return the permissions of file_path, or those of a new file."""
+    try:
+        return os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        # The umask can only be read by setting it.
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
 
 
 def add_representer_ordered_dict():
@@ -365,35 +631,32 @@ def add_representer_ordered_dict():
 def _recurse_subdirs(search_path, depth):
     directories = set()
     try:
-        for path in os.listdir(search_path):
+        for path in index.subdirectories(search_path):
             joined_path = os.path.join(search_path, path)
-            if os.path.isdir(joined_path):
-                if depth == 1:
-                    directories.add(joined_path)
-                else:
-                    directories.update(
-                        _recurse_subdirs(joined_path, depth - 1))
-    except FileNotFoundError:
+            if depth == 1:
+                directories.add(joined_path)
+            else:
+                directories.update(_recurse_subdirs(joined_path, depth - 1))
+    except (FileNotFoundError, NotADirectoryError):
         pass
     return directories
 
 
+def _skip_search_dir(name):
+    # Ignore hidden folders like .tox or .git for faster processing, and
+    # anything in tools/ because it will never contain valid Pegleg-owned
+    # manifest documents. Both are pruned before being listed.
+    return name.startswith(".") or name == "tools"
+
+
 def search(search_paths):
     if not isinstance(search_paths, (list, tuple)):
         search_paths = [search_paths]
 
     for search_path in search_paths:
         LOG.debug("Recursively collecting YAMLs from %s", search_path)
-        for root, _, filenames in os.walk(search_path):
-
-            # Ignore hidden folders like .tox or .git for faster processing.
-            if os.path.basename(root).startswith("."):
-                continue
-            # Skip over anything in tools/ because it will never contain valid
-            # Pegleg-owned manifest documents.
-            if "tools" in root.split("/"):
-                continue
-
+        for root, _, filenames in index.walk(search_path,
+                                             skip_dir=_skip_search_dir):
             for filename in filenames:
                 # Ignore files like .zuul.yaml.
                 if filename.startswith("."):
@@ -429,13 +692,93 @@ def collect_files_by_repo(site_name):
     """Collects file by repo name in memory."""
 
     collected_files_by_repo = collections.defaultdict(list)
-    for repo_base, filename in util.definition.site_files_by_repo(site_name):
-        repo_name = os.path.normpath(repo_base).split(os.sep)[-1]
-        documents = util.files.read(filename)
-        collected_files_by_repo[repo_name].extend(documents)
+    site_files = list(util.definition.site_files_by_repo(site_name))
+    all_documents = read_many(filename for _, filename in site_files)
+    for (repo_base, _), documents in zip(site_files, all_documents):
+        collected_files_by_repo[_repo_name(repo_base)].extend(documents)
     return collected_files_by_repo
 
 
+def iter_files_by_repo(site_name):
+    """Like :func:`collect_files_by_repo`, but lazily yields the repo name
+    and documents of one file at a time, so that only the documents of the
+    file being processed are held in memory.
+    """
+    for repo_base, filename in util.definition.site_files_by_repo(site_name):
+        yield _repo_name(repo_base), read(filename)
+
+
+def _repo_name(repo_base):
+    return os.path.normpath(repo_base).split(os.sep)[-1]
+
+
+# Errors meaning a kernel-side copy is unsupported for the given pair of
+# files (e.g. across file systems, to a terminal or to an O_APPEND file).
+_KERNEL_COPY_UNSUPPORTED = frozenset(
+    getattr(errno, name) for name in (
+        'EXDEV', 'EINVAL', 'ENOSYS', 'EBADF', 'EOPNOTSUPP', 'ENOTSUP')
+    if hasattr(errno, name))
+
+
+def _kernel_copies():
+    if hasattr(os, 'copy_file_range'):
+        yield lambda src, dst, offset, count: os.copy_file_range(
+            src, dst, count, offset)
+    if hasattr(os, 'sendfile'):
+        yield lambda src, dst, offset, count: os.sendfile(
+            dst, src, offset, count)
+
+
+def _kernel_copy(src_fd, dst_fd, count):
+    copied = 0
+    for copy in _kernel_copies():
+        try:
+            while copied < count:
+                sent = copy(src_fd, dst_fd, copied, count - copied)
+                if not sent:
+                    return copied
+                copied += sent
+            return copied
+        except OSError as e:
+            if e.errno not in _KERNEL_COPY_UNSUPPORTED:
+                raise
+    return copied
+
+
+def copy_range(src, dst, count):
+    """Copy the first ``count`` bytes of binary file ``src`` to the current
+    position of binary stream ``dst``.
+
+    When ``dst`` is backed by a file descriptor the bytes are copied
+    kernel-side with :func:`os.copy_file_range` or :func:`os.sendfile`,
+    without passing through Python, and ``dst`` is flushed first so earlier
+    writes stay in order. Otherwise (or if neither is supported for these
+    files) the data is copied through memory.
+
+    :param src: Binary file opened for reading.
+    :param dst: Binary stream to write to.
+    :param int count: Number of bytes to copy.
+    """
+    try:
+        dst_fd = dst.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        dst_fd = None
+
+    copied = 0
+    if dst_fd is not None:
+        dst.flush()
+        copied = _kernel_copy(src.fileno(), dst_fd, count)
+    if copied < count:
+        src.seek(copied)
+        remaining = count - copied
+        while remaining:
+            chunk = src.read(min(remaining, shutil.COPY_BUFSIZE))
+            if not chunk:
+                break
+            dst.write(chunk)
+            remaining -= len(chunk)
+
+
 def file_in_subdir(filename, _dir):
     """
     Check if a folder named _dir is in the path to the file
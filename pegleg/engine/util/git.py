@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import fcntl
 import logging
 import os
+import shutil
 import tempfile
 from urllib.parse import urlparse
 
@@ -23,18 +26,32 @@ from git import Repo
 
 from pegleg import config
 from pegleg.engine import exceptions
+from pegleg.engine.util import cache
+from pegleg.engine.util import session
 
 LOG = logging.getLogger(__name__)
 
 __all__ = (
     'git_handler', 'is_repository', 'is_equal', 'repo_url', 'repo_name',
-    'normalize_repo_path')
+    'normalize_repo_path', 'changed_files', 'clear_mirrors', 'replicate',
+    'tags_by_commit')
 
 TEMP_PEGLEG_COMMIT_MSG = 'Temporary Pegleg commit'
 
+# Mirrors of remote repositories live in this namespace of the cache dir.
+MIRRORS_NAMESPACE = 'git-mirrors'
+# Mirrors track all branches and tags. Other refpaths (e.g. Gerrit changes)
+# are fetched into the mirror on demand.
+_MIRROR_REFSPECS = ('+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+
 
 def git_handler(
-        repo_url, ref=None, proxy_server=None, auth_key=None, clone_path=None):
+        repo_url,
+        ref=None,
+        proxy_server=None,
+        auth_key=None,
+        clone_path=None,
+        sparse_paths=None):
     """Handle directories that are Git repositories.
 
     If ``repo_url`` is a valid URL for which a local repository doesn't
@@ -59,6 +76,9 @@ def git_handler(
         with the specified key.  If the value is None, SSH is not used.
     :param clone_path: The path where the repo will be cloned. By default the
         repo will be cloned to the /tmp path.
+    :param sparse_paths: Directories, relative to the root of the repo, to
+        check out when cloning in ``sparse`` clone mode. None checks out
+        every directory.
     :returns: Path to the cloned repo if a repo was cloned, else absolute
         path to ``repo_url``.
     :raises ValueError: If ``repo_url`` isn't a valid URL or doesn't begin
@@ -81,7 +101,12 @@ def git_handler(
         # checkout the appropriate reference - and return the tmpdir
         if parsed_url.scheme in supported_clone_protocols:
             return _try_git_clone(
-                repo_url, ref, proxy_server, auth_key, clone_path)
+                repo_url,
+                ref,
+                proxy_server,
+                auth_key,
+                clone_path,
+                sparse_paths=sparse_paths)
         else:
             raise ValueError(
                 'repo_url=%s must use one of the following '
@@ -160,9 +185,19 @@ def get_remote_url(repo_url):
 
 
 def _try_git_clone(
-        repo_url, ref=None, proxy_server=None, auth_key=None, clone_path=None):
+        repo_url,
+        ref=None,
+        proxy_server=None,
+        auth_key=None,
+        clone_path=None,
+        sparse_paths=None):
     """Try cloning Git repo from ``repo_url`` using the reference ``ref``.
 
+    In ``shallow`` and ``sparse`` clone modes (see
+    :func:`pegleg.config.get_clone_mode`) only ``ref`` is fetched, see
+    :func:`_try_git_clone_partial`, falling back to a full clone if the
+    remote can't serve it that way.
+
     :param repo_url: URL of remote Git repo or path to local Git repo.
     :param ref: branch, commit or reference in the repo to clone.
     :param proxy_server: optional, HTTP proxy to use while cloning the repo.
@@ -170,6 +205,7 @@ def _try_git_clone(
         with the specified key.  If the value is None, SSH is not used.
     :param clone_path: The path where the repo will be cloned. By default the
         repo will be cloned to the /tmp path.
+    :param sparse_paths: Directories to check out in ``sparse`` clone mode.
     :returns: Path to the cloned repo.
     :rtype: str
     :raises GitException: If ``repo_url`` is invalid or could not be found.
@@ -198,6 +234,28 @@ def _try_git_clone(
     env_vars = _get_remote_env_vars(auth_key)
     ssh_cmd = env_vars.get('GIT_SSH_COMMAND')
 
+    clone_mode = config.get_clone_mode()
+    if clone_mode != 'full':
+        if clone_mode != 'sparse':
+            sparse_paths = None
+        try:
+            _try_git_clone_partial(
+                repo_url, temp_dir, ref, proxy_server, env_vars, sparse_paths)
+            return temp_dir
+        except git_exc.GitCommandError as e:
+            LOG.warning(
+                'Failed to fetch ref=%s of repo_url=%s shallowly, falling '
+                'back to a full clone. Details: %s', ref, repo_url,
+                e.stderr.strip())
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            os.makedirs(temp_dir)
+
+    if config.get_cache_enabled():
+        with _locked(_mirror_path(repo_url)):
+            _try_git_clone_from_mirror(
+                repo_url, temp_dir, ref, proxy_server, auth_key)
+        return temp_dir
+
     try:
         if proxy_server and proxy_server.strip():
             LOG.debug('Cloning [%s] with proxy [%s]', repo_url, proxy_server)
@@ -234,6 +292,227 @@ def _try_git_clone(
     return temp_dir
 
 
+def _try_git_clone_partial(
+        repo_url, temp_dir, ref, proxy_server, env_vars, sparse_paths=None):
+    """Fetch the commit ``ref`` points to, without its history, into the
+    empty directory ``temp_dir`` and check it out.
+
+    Where the remote supports partial clones, file contents are only
+    downloaded for the files being checked out. If ``sparse_paths`` is given
+    only those directories (and files at the top of the repo) are checked
+    out. A local branch named ``ref`` is created, like for full clones.
+
+    :raises GitCommandError: If ``ref`` could not be fetched this way, e.g.
+        because it is a commit the remote does not allow fetching directly.
+
+    """
+    g = Git(temp_dir)
+    g.init()
+    g.remote('add', 'origin', repo_url)
+    if proxy_server and proxy_server.strip():
+        g.config('http.proxy', proxy_server)
+    if sparse_paths:
+        g.sparse_checkout('set', '--cone', *sparse_paths)
+    if ref is None:
+        # Check out the remote's default branch, like a clone would.
+        head = _remote_head(g, env_vars)
+        if head and head.startswith('refs/heads/'):
+            ref = head[len('refs/heads/'):]
+
+    LOG.debug(
+        'Fetching ref=%s of [%s] with depth 1, sparse paths: %s', ref,
+        repo_url, sparse_paths)
+    g.fetch(
+        '--depth',
+        '1',
+        '--filter=blob:none',
+        'origin',
+        ref or 'HEAD',
+        env=env_vars)
+    # Missing file contents are fetched on demand while checking out.
+    if ref:
+        g.checkout('-B', ref, 'FETCH_HEAD', env=env_vars)
+    else:
+        g.checkout('FETCH_HEAD', env=env_vars)
+
+
+def _remote_head(g, env_vars):
+    """Return the ref the ``HEAD`` of the ``origin`` remote of ``g`` points
+    to, e.g. ``refs/heads/master``, or None if it can't be determined.
+    """
+    head = g.ls_remote('--symref', 'origin', 'HEAD', env=env_vars)
+    for line in head.splitlines():
+        if line.startswith('ref: '):
+            return line[len('ref: '):].split('\t')[0]
+    return None
+
+
+def _try_git_clone_from_mirror(
+        repo_url, temp_dir, ref=None, proxy_server=None, auth_key=None):
+    """Clone ``repo_url`` into ``temp_dir`` by way of its local mirror.
+
+    The mirror is created, or incrementally fetched, from ``repo_url`` and
+    then cloned locally, which hard links its objects instead of copying
+    them. ``ref`` is fetched from the mirror when it has it and from
+    ``repo_url`` otherwise. The clone's ``origin`` is ``repo_url``.
+
+    Must be called with the mirror's lock held, see :func:`_locked`.
+
+    :returns: The cloned Git Repo object.
+    :raises GitException: If ``repo_url`` is invalid or could not be found.
+    :raises GitAuthException: If authentication with the Git repository failed.
+    :raises GitProxyException: If the repo could not be cloned due to a proxy
+        issue.
+
+    """
+    env_vars = _get_remote_env_vars(auth_key)
+    ssh_cmd = env_vars.get('GIT_SSH_COMMAND')
+    mirror_path = _mirror_path(repo_url)
+
+    try:
+        _update_mirror(mirror_path, repo_url, ref, proxy_server, env_vars)
+        LOG.debug('Cloning [%s] from mirror %s', repo_url, mirror_path)
+        # The environment is kept by the clone, so refs missing from the
+        # mirror are fetched from ``repo_url`` with the same SSH key.
+        repo = Repo.clone_from(mirror_path, temp_dir, env=env_vars)
+        if proxy_server and proxy_server.strip():
+            with repo.config_writer() as writer:
+                writer.set_value('http', 'proxy', proxy_server)
+    except git_exc.GitCommandError as e:
+        LOG.exception(
+            'Failed to clone repo_url=%s using ref=%s.', repo_url, ref)
+        if (ssh_cmd and ssh_cmd in e.stderr
+                or 'permission denied' in e.stderr.lower()):
+            raise exceptions.GitAuthException(
+                repo_url=repo_url, ssh_key_path=auth_key)
+        elif 'could not resolve proxy' in e.stderr.lower():
+            raise exceptions.GitProxyException(location=proxy_server)
+        else:
+            raise exceptions.GitException(location=repo_url, details=e)
+    except Exception as e:
+        LOG.exception(
+            'Encountered unknown Exception during clone of %s', repo_url)
+        raise exceptions.GitException(location=repo_url, details=e)
+
+    if ref and not _has_commit(Git(mirror_path), ref):
+        repo.remotes.origin.set_url(repo_url)
+    _try_git_checkout(repo=repo, repo_url=repo_url, ref=ref)
+    repo.remotes.origin.set_url(repo_url)
+    return repo
+
+
+def _normalize_url(repo_url):
+    """Normalize ``repo_url`` so that every spelling of the URL of a repo,
+    with or without credentials, a trailing slash or ``.git``, maps to the
+    same mirror.
+    """
+    parsed = urlparse(repo_url)
+    netloc = (parsed.hostname or '').lower()
+    if parsed.port:
+        netloc += ':%d' % parsed.port
+    path = parsed.path.rstrip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+    return '%s://%s%s' % (parsed.scheme.lower(), netloc, path)
+
+
+def _mirror_path(repo_url):
+    normalized = _normalize_url(repo_url)
+    name = normalized.rsplit('/', 1)[-1] or 'repo'
+    return os.path.join(
+        config.get_cache_dir(), MIRRORS_NAMESPACE, '%s-%s.git' %
+        (name, cache.digest(normalized)[:16]))
+
+
+@contextlib.contextmanager
+def _locked(mirror_path):
+    """Hold an exclusive lock on ``mirror_path``, shared by every Pegleg
+    process on the host.
+    """
+    os.makedirs(os.path.dirname(mirror_path), exist_ok=True)
+    with open(mirror_path + '.lock', 'a') as lock:
+        LOG.debug('Waiting for lock on mirror %s', mirror_path)
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def clear_mirrors():
+    """Remove every repository mirror, waiting for any Pegleg process that
+    is using one to finish with it.
+    """
+    mirrors_dir = os.path.join(config.get_cache_dir(), MIRRORS_NAMESPACE)
+    try:
+        names = os.listdir(mirrors_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        mirror_path = os.path.join(mirrors_dir, name)
+        if name.endswith('.git') and os.path.isdir(mirror_path):
+            # Lock files are kept: removing one could let two processes
+            # hold "the" lock at the same time.
+            with _locked(mirror_path):
+                LOG.debug('Removing mirror %s', mirror_path)
+                shutil.rmtree(mirror_path, ignore_errors=True)
+
+
+def _has_commit(g, ref):
+    try:
+        g.rev_parse('--verify', '--quiet', '%s^{commit}' % ref)
+        return True
+    except git_exc.GitCommandError:
+        return False
+
+
+def _update_mirror(mirror_path, repo_url, ref, proxy_server, env_vars):
+    """Create the bare mirror of ``repo_url`` at ``mirror_path``, or fetch
+    what changed since it was last updated.
+    """
+    refspecs = list(_MIRROR_REFSPECS)
+    tracked = ('refs/heads/', 'refs/tags/')
+    if ref and ref.startswith('refs/') and not ref.startswith(tracked):
+        refspecs.append('+%s:%s' % (ref, ref))
+    git_options = {}
+    if proxy_server and proxy_server.strip():
+        git_options['c'] = 'http.proxy=%s' % proxy_server
+
+    if os.path.isdir(mirror_path):
+        try:
+            Repo(mirror_path)
+        except git_exc.GitError:
+            LOG.warning('Removing invalid repo mirror %s', mirror_path)
+            shutil.rmtree(mirror_path, ignore_errors=True)
+
+    if os.path.isdir(mirror_path):
+        LOG.debug('Updating mirror %s of [%s]', mirror_path, repo_url)
+        g = Git(mirror_path)
+        g.remote('set-url', 'origin', repo_url)
+        g(**git_options).fetch('origin', '--prune', *refspecs, env=env_vars)
+        return
+
+    # Populate a new mirror next to its final location, then move it into
+    # place, so that an interrupted fetch never leaves a partial mirror.
+    LOG.debug('Creating mirror %s of [%s]', mirror_path, repo_url)
+    staging = tempfile.mkdtemp(dir=os.path.dirname(mirror_path))
+    try:
+        g = Git(staging)
+        g.init('--bare')
+        # Run automatic gc in the foreground, while the lock is held.
+        g.config('gc.autoDetach', 'false')
+        g.remote('add', 'origin', repo_url)
+        g(**git_options).fetch('origin', *refspecs, env=env_vars)
+        # Point HEAD at the remote's default branch, so that clones without
+        # a ref check out the same branch as a clone of ``repo_url`` would.
+        head = _remote_head(g(**git_options), env_vars)
+        if head:
+            g.symbolic_ref('HEAD', head)
+        os.rename(staging, mirror_path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
 def _get_remote_env_vars(auth_key=None):
     """Generate environment variables include SSH command for Git clone.
 
@@ -398,6 +677,152 @@ def is_equal(first_repo, other_repo):
         return False
 
 
+def changed_files(repo_path, since):
+    """Return the files changed in ``repo_path`` since ``since``.
+
+    Changes are taken relative to the merge base of ``since`` and HEAD, so
+    that for a topic branch only the branch's own changes are reported, and
+    include uncommitted and untracked files in the working tree (or the
+    temporary commit Pegleg made of them, see :func:`git_handler`). Renames are
+    reported as a deletion and an addition so both paths are returned.
+
+    :param str repo_path: Path to a local Git repo (or a subfolder of one).
+    :param str since: Branch, tag, commit or ref to compare against.
+    :returns: Sorted absolute paths of changed files, including deleted ones.
+    :rtype: list
+    :raises GitInvalidRefException: If ``since`` cannot be resolved.
+
+    """
+
+    repo = Repo(repo_path, search_parent_directories=True)
+    try:
+        base = repo.git.merge_base(since, 'HEAD')
+    except git_exc.GitCommandError as e:
+        LOG.error('Failed to resolve ref %s: %s', since, e)
+        raise exceptions.GitInvalidRefException(ref=since, repo_url=repo_path)
+
+    # Uncommitted changes may have been committed by ``git_handler``; they
+    # are still changes relative to the commit they were made on top of.
+    commit = repo.commit(base)
+    if commit.message == TEMP_PEGLEG_COMMIT_MSG and commit.parents:
+        base = commit.parents[0].hexsha
+
+    diff = repo.git.diff(base, '--name-only', '--no-renames', '-z', '--')
+    paths = set(p for p in diff.split('\0') if p)
+    paths.update(repo.untracked_files)
+    return sorted(os.path.join(repo.working_tree_dir, p) for p in paths)
+
+
+def tags_by_commit(repo_path):
+    """Index the tags of the repo at ``repo_path`` by the commit they tag.
+
+    All tags are listed by a single ``git for-each-ref``, which peels
+    annotated tags to their commit. Within a
+    :func:`pegleg.engine.util.session.session` the index is built once per
+    repo.
+
+    :param repo_path: Path to local Git repo.
+    :returns: Dictionary mapping commit hexshas to the sorted names of their
+        tags.
+    :rtype: dict
+    """
+    key = os.path.abspath(repo_path)
+    memo = session.memo('tags')
+    tags = memo.get(key)
+    if tags is None:
+        tags = {}
+        output = Git(repo_path).for_each_ref(
+            '--format=%(objectname) %(*objectname) %(refname:strip=2)',
+            'refs/tags')
+        for line in output.splitlines():
+            hexsha, peeled, name = line.split(' ', 2)
+            tags.setdefault(peeled or hexsha, []).append(name)
+        memo[key] = tags
+    return tags
+
+
+def replicate(repo_path, replica_path):
+    """Create a replica of the local repository at ``repo_path``, including
+    any uncommitted, untracked and ignored files, at ``replica_path``.
+
+    Unlike a copy, the replica borrows the objects of ``repo_path`` (see
+    ``git clone --shared``) instead of duplicating its ``.git`` directory:
+    only the working tree is written out. The replica has the same refs,
+    configuration and ``HEAD`` as ``repo_path``. Commits and checkouts in the
+    replica never change ``repo_path``, neither its working tree nor its
+    refs, index or objects.
+
+    :param repo_path: Path to the root of a local, non-bare Git repo.
+    :param replica_path: Path of the replica. Must not exist yet.
+    :raises GitException: If the replica could not be created, e.g. because
+        ``repo_path`` is not a repository.
+
+    """
+    LOG.debug('Replicating repo %s to %s', repo_path, replica_path)
+    try:
+        repo = Repo(repo_path)
+        common_dir = os.path.join(
+            repo_path, repo.git.rev_parse('--git-common-dir'))
+        replica = Repo.init(replica_path)
+        with open(os.path.join(replica.git_dir, 'objects', 'info',
+                               'alternates'), 'w') as f:
+            f.write(os.path.abspath(os.path.join(common_dir, 'objects')))
+        shallow = os.path.join(common_dir, 'shallow')
+        if os.path.exists(shallow):
+            shutil.copy(shallow, os.path.join(replica.git_dir, 'shallow'))
+        shutil.copy(
+            os.path.join(common_dir, 'config'),
+            os.path.join(replica.git_dir, 'config'))
+        for name in ('core.worktree', 'core.sparseCheckout',
+                     'core.sparseCheckoutCone'):
+            replica.git.config('--unset-all', name, with_exceptions=False)
+
+        # Every object is already present, so this only copies the refs.
+        replica.git.fetch(
+            '--quiet', '--update-head-ok', '--no-tags',
+            os.path.abspath(repo_path), '+refs/*:refs/*')
+        if repo.head.is_detached:
+            replica.git.update_ref(
+                '--no-deref', 'HEAD', repo.head.commit.hexsha)
+        else:
+            replica.git.symbolic_ref('HEAD', repo.head.ref.path)
+        replica.git.reset('--quiet', '--hard')
+
+        _replicate_changes(repo, repo_path, replica_path)
+    except (git_exc.GitError, ValueError) as e:
+        LOG.debug('Failed to replicate repo %s: %s', repo_path, e)
+        raise exceptions.GitException(location=repo_path, details=e)
+    return replica_path
+
+
+def _replicate_changes(repo, repo_path, replica_path):
+    """Copy every file of ``repo`` that differs from its ``HEAD`` (including
+    untracked and ignored files) to ``replica_path`` and remove the files
+    deleted from it.
+    """
+    # Optional locks are disabled so that ``repo``'s index isn't refreshed.
+    status = repo.git.status(
+        '--porcelain=v1',
+        '-z',
+        '--untracked-files=all',
+        '--ignored',
+        '--no-renames',
+        env={'GIT_OPTIONAL_LOCKS': '0'})
+    for entry in status.split('\0'):
+        if not entry:
+            continue
+        path = entry[3:]
+        src = os.path.join(repo_path, path)
+        dst = os.path.join(replica_path, path)
+        if os.path.lexists(dst) and not os.path.isdir(dst):
+            os.unlink(dst)
+        if os.path.isdir(src) and not os.path.islink(src):
+            shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True)
+        elif os.path.lexists(src):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst, follow_symlinks=False)
+
+
 def repo_url(repo_url_or_path):
     """Get the repository URL for the local or remote repo at
     ``repo_url_or_path``.
@@ -0,0 +1,125 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory index of repository directory listings.
+
+Every directory is listed with a single :func:`os.scandir` call the first
+time it is needed, and the listing is reused for the rest of the invocation.
+Overlapping searches (the same ``global`` tree searched for every site, or
+``existing_directories`` after ``search``) therefore never stat the same
+entries twice, which matters on network-mounted checkouts.
+
+Pegleg invalidates the index whenever it writes files itself; see
+:func:`invalidate`. Directories of repositories read at a Git revision are
+listed from the revision's tree instead, see
+:mod:`pegleg.engine.util.revision`.
+"""
+
+import collections
+import logging
+import os
+
+from pegleg.engine.util import revision
+
+LOG = logging.getLogger(__name__)
+
+__all__ = ('invalidate', 'listing', 'subdirectories', 'walk')
+
+Listing = collections.namedtuple('Listing', ['dirs', 'files', 'links'])
+
+_LISTINGS = {}
+
+
+def _scan(path):
+    dirs = []
+    files = []
+    links = set()
+    with os.scandir(path) as it:
+        for entry in it:
+            # Same classification as os.walk: anything that is (or links
+            # to) a directory is a directory, everything else is a file.
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry.name)
+                try:
+                    if entry.is_symlink():
+                        links.add(entry.name)
+                except OSError:
+                    pass
+            else:
+                files.append(entry.name)
+    return Listing(tuple(dirs), tuple(files), frozenset(links))
+
+
+def listing(path):
+    """Return the :class:`Listing` of directory ``path``.
+
+    Names are in the order returned by the operating system, like
+    :func:`os.listdir`.
+
+    :raises OSError: If ``path`` cannot be listed (e.g. it does not exist).
+    """
+    key = os.path.abspath(path)
+    result = _LISTINGS.get(key)
+    if result is None:
+        found = revision.lookup(key)
+        if found is not None:
+            result = Listing(*found[0].listing(found[1]))
+        else:
+            result = _scan(key)
+        _LISTINGS[key] = result
+    return result
+
+
+def subdirectories(path):
+    """Return the names of the directories in ``path``, including symlinks
+    to directories.
+
+    :raises OSError: If ``path`` cannot be listed.
+    """
+    return listing(path).dirs
+
+
+def walk(top, skip_dir=None):
+    """Top-down equivalent of ``os.walk(top)`` served from the index.
+
+    Like :func:`os.walk`, symlinked directories are listed but not descended
+    into and unreadable directories are silently skipped. Directories for
+    which ``skip_dir(name)`` is true are pruned before being listed.
+
+    :returns: Generator of ``(dirpath, dirnames, filenames)`` tuples.
+    """
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        try:
+            result = listing(path)
+        except OSError:
+            continue
+        yield path, result.dirs, result.files
+        children = [
+            name for name in result.dirs
+            if name not in result.links and not (skip_dir and skip_dir(name))
+        ]
+        stack.extend(os.path.join(path, name) for name in reversed(children))
+
+
+def invalidate():
+    """Forget every cached listing, e.g. after files have been written."""
+    if _LISTINGS:
+        LOG.debug('Invalidating index of %d directories.', len(_LISTINGS))
+    _LISTINGS.clear()
@@ -26,9 +26,40 @@ GENERATED = 'generated'
 STORAGE_POLICY = 'storagePolicy'
 METADATA = 'metadata'
 DEFAULT_LAYER = 'site'
+# Fernet tokens are the URL-safe base64 encoding of a 0x80 version byte and
+# a 64-bit timestamp, whose leading bytes stay zero for a long time to come.
+FERNET_TOKEN_PREFIX = 'gAAAAA'
 LOG = logging.getLogger(__name__)
 
-__all__ = ['PeglegManagedSecretsDocument']
+__all__ = ['PeglegManagedSecretsDocument', 'has_cleartext_secrets']
+
+
+def _is_cleartext_secret(document):
+    if not isinstance(document, dict):
+        return False
+    if PEGLEG_MANAGED_SCHEMA in str(document.get('schema', '')):
+        data = document.get('data') or {}
+        if ENCRYPTED in data:
+            return False
+        document = data.get('managedDocument') or {}
+    metadata = document.get(METADATA) or {}
+    if metadata.get(STORAGE_POLICY) != ENCRYPTED:
+        return False
+    data = document.get('data')
+    if isinstance(data, bytes):
+        data = data.decode('ascii', 'replace')
+    return bool(data) and not (
+        isinstance(data, str) and data.startswith(FERNET_TOKEN_PREFIX))
+
+
+def has_cleartext_secrets(documents):
+    """Return whether any of ``documents`` holds secret data in cleartext.
+
+    That is any document whose storage policy is encrypted but whose data
+    isn't encrypted, be it wrapped in a Pegleg managed document or not, as
+    happens once secrets have been decrypted in place.
+    """
+    return any(_is_cleartext_secret(document) for document in documents)
 
 
 class PeglegManagedSecretsDocument(object):
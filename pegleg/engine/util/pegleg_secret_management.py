@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import logging
 
 import click
@@ -22,6 +23,7 @@ from pegleg.engine.util.encryption import decrypt
 from pegleg.engine.util.encryption import encrypt
 from pegleg.engine.util import files
 from pegleg.engine.util.files import add_representer_ordered_dict
+from pegleg.engine.util.pegleg_managed_document import ENCRYPTED
 from pegleg.engine.util.pegleg_managed_document import \
     PeglegManagedSecretsDocument as PeglegManagedSecret
 
@@ -37,12 +39,17 @@ class PeglegSecretManagement(object):
             generated=False,
             catalog=None,
             author=None,
-            site_name=None):
+            site_name=None,
+            global_creds=None):
         """
         Read the source file and the environment data needed to wrap and
         process the file documents as pegleg managed document.
         Either of the ``file_path`` or ``docs`` must be
         provided.
+
+        ``global_creds``, a tuple of passphrase and salt, are used for the
+        documents outside of the site layer instead of the global
+        credentials in the config.
         """
 
         # Set passphrase and salt
@@ -60,23 +67,35 @@ class PeglegSecretManagement(object):
                 "catalog must be specified.")
 
         self.file_path = file_path
-        self.documents = list()
         self._generated = generated
 
+        # Documents are only wrapped in pegleg managed documents when needed,
+        # decryption deals with the source documents directly.
         if docs:
-            for doc in docs:
-                self.documents.append(
-                    PeglegManagedSecret(
-                        doc,
-                        generated=generated,
-                        catalog=catalog,
-                        author=author))
+            self._docs = list(docs)
+            self._wrap_args = {
+                'generated': generated,
+                'catalog': catalog,
+                'author': author
+            }
         else:
             self.file_path = file_path
-            for doc in files.read(file_path):
-                self.documents.append(PeglegManagedSecret(doc))
+            self._docs = files.read(file_path)
+            self._wrap_args = {}
+        self._documents = None
 
         self._author = author
+        self._global_creds = global_creds
+
+    @property
+    def documents(self):
+        """The documents wrapped in pegleg managed documents."""
+        if self._documents is None:
+            self._documents = [
+                PeglegManagedSecret(doc, **self._wrap_args)
+                for doc in self._docs
+            ]
+        return self._documents
 
     def __iter__(self):
         """
@@ -99,16 +118,19 @@ class PeglegSecretManagement(object):
         :param author: Identifier for the program or person who is
         encrypting the secrets documents
         :type author: string
+        :return: Whether any documents were encrypted and written
+        :rtype: bool
         """
 
         doc_list, encrypted_docs = self.get_encrypted_secrets()
         if encrypted_docs:
-            files.write(doc_list, save_path)
+            files.write(doc_list, save_path, atomic=True)
             click.echo('Wrote encrypted data to: {}'.format(save_path))
         else:
             LOG.debug(
                 'All documents in file: %s are either already encrypted '
                 'or have cleartext storage policy. Skipping.', self.file_path)
+        return encrypted_docs
 
     def get_encrypted_secrets(self):
         """
@@ -140,12 +162,8 @@ class PeglegSecretManagement(object):
                 continue
 
             # Get appropriate encryption keys to use
-            if doc.get_layer() == 'site':
-                passphrase = config.get_passphrase()
-                salt = config.get_salt()
-            else:
-                passphrase = config.get_global_passphrase()
-                salt = config.get_global_salt()
+            passphrase, salt = _credentials(
+                doc.get_layer(), self._global_creds)
 
             secret_doc = doc.get_secret()
             if not isinstance(secret_doc, bytes):
@@ -179,23 +197,43 @@ class PeglegSecretManagement(object):
         encrypted files, or documents inside the file, it will return
         the original unwrapped and unencrypted documents.
 
-        """
+        Documents which aren't pegleg managed documents are returned as is,
+        and the source documents are never modified.
 
-        doc_list = []
-        for doc in self.documents:
-            # do not decrypt already decrypted data
-            if doc.is_encrypted():
+        """
 
-                # Get appropriate encryption keys to use
-                if doc.get_layer() == 'site':
-                    passphrase = config.get_passphrase()
-                    salt = config.get_salt()
-                else:
-                    passphrase = config.get_global_passphrase()
-                    salt = config.get_global_salt()
-
-                doc.set_secret(
-                    decrypt(doc.get_secret(), passphrase, salt).decode())
-                doc.set_decrypted()
-            doc_list.append(doc.embedded_document)
-        return doc_list
+        if self._documents is not None:
+            docs = [doc.pegleg_document for doc in self._documents]
+        else:
+            docs = self._docs
+        return [_decrypted(doc, self._global_creds) for doc in docs]
+
+
+def _credentials(layer, global_creds=None):
+    """Return the passphrase and salt for documents of ``layer``."""
+    if layer == 'site':
+        return config.get_passphrase(), config.get_salt()
+    if global_creds is not None:
+        return global_creds
+    return config.get_global_passphrase(), config.get_global_salt()
+
+
+def _decrypted(doc, global_creds=None):
+    """Return the document embedded in ``doc``, decrypted if need be, if
+    ``doc`` is a pegleg managed document, or else ``doc`` itself.
+    """
+    if not PeglegManagedSecret.is_pegleg_managed_secret(doc):
+        return doc
+    embedded_document = doc['data']['managedDocument']
+    # do not decrypt already decrypted data
+    if ENCRYPTED not in doc['data']:
+        return embedded_document
+
+    # Get appropriate encryption keys to use
+    layer = embedded_document['metadata']['layeringDefinition']['layer']
+    passphrase, salt = _credentials(layer, global_creds)
+
+    decrypted_document = copy.copy(embedded_document)
+    decrypted_document['data'] = decrypt(
+        embedded_document['data'], passphrase, salt).decode()
+    return decrypted_document
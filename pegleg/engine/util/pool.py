@@ -0,0 +1,94 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Process pool helpers that carry Pegleg's global configuration along."""
+
+import concurrent.futures
+import copy
+import logging
+import multiprocessing
+import os
+
+from pegleg import config
+
+LOG = logging.getLogger(__name__)
+
+__all__ = ('chunks', 'in_worker', 'parallel_map', 'resolve_jobs')
+
+
+def resolve_jobs(jobs):
+    """Return the number of worker processes to use for ``jobs``.
+
+    ``0`` (or ``None``) means one worker per available CPU.
+    """
+    if not jobs:
+        try:
+            return len(os.sched_getaffinity(0))
+        except AttributeError:
+            return os.cpu_count() or 1
+    return jobs
+
+
+def in_worker():
+    """Return True when running inside a pool worker process."""
+    return multiprocessing.parent_process() is not None
+
+
+def chunks(items, count):
+    """Split ``items`` into at most ``count`` contiguous, ordered chunks."""
+    items = list(items)
+    count = max(1, min(count, len(items)))
+    size, remainder = divmod(len(items), count)
+    result = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < remainder else 0)
+        result.append(items[start:end])
+        start = end
+    return [c for c in result if c]
+
+
+def _initialize_worker(global_context, log_level):
+    config.GLOBAL_CONTEXT = global_context
+    logging.basicConfig(level=log_level)
+    logging.getLogger().setLevel(log_level)
+
+
+def parallel_map(func, items, jobs=1):
+    """Return ``[func(item) for item in items]``, using up to ``jobs``
+    worker processes.
+
+    Results are always returned in the order of ``items``. Workers start with
+    a copy of :data:`pegleg.config.GLOBAL_CONTEXT` so that repository and
+    path configuration set up by the CLI applies to them as well. Nested
+    calls from within a worker, single items and ``jobs == 1`` all run
+    in-process.
+
+    :param func: Picklable (module-level) callable taking a single item.
+    :param items: Iterable of picklable items.
+    :param int jobs: Maximum number of worker processes; 0 means one per CPU.
+    :returns: List of results.
+    :rtype: list
+    """
+    items = list(items)
+    jobs = min(resolve_jobs(jobs), len(items))
+    if jobs <= 1 or in_worker():
+        return [func(item) for item in items]
+
+    LOG.debug('Running %d tasks on %d worker processes.', len(items), jobs)
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_initialize_worker,
+            initargs=(copy.deepcopy(config.GLOBAL_CONTEXT),
+                      logging.getLogger().getEffectiveLevel())) as executor:
+        return list(executor.map(func, items))
@@ -0,0 +1,218 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Repository files served from a Git revision, without a checkout.
+
+A local repository registered with :func:`register` is mapped to a root
+path that doesn't exist on disk. Directory listings below that root (see
+:mod:`pegleg.engine.util.index`) come from the tree of the registered
+commit and file contents from the repository's object database, through
+a single long-lived ``git cat-file --batch`` process per repository.
+
+Registrations are kept in :data:`pegleg.config.GLOBAL_CONTEXT`, so that
+they carry over to worker processes.
+"""
+
+import atexit
+import logging
+import os
+import posixpath
+import threading
+
+from git import exc as git_exc
+from git import Git
+
+from pegleg import config
+from pegleg.engine import exceptions
+
+LOG = logging.getLogger(__name__)
+
+__all__ = ('lookup', 'register')
+
+_SYMLINK_MODE = '120000'
+# Symbolic links are followed at most this many times, like the kernel.
+_MAX_SYMLINKS = 40
+
+_REVISIONS = {}
+_REVISIONS_LOCK = threading.Lock()
+
+
+class Revision(object):
+    """The files of local repository ``repo_path`` at ``commit``."""
+    def __init__(self, repo_path, commit, ref):
+        self.repo_path = repo_path
+        self.commit = commit
+        self.ref = ref
+        self._lock = threading.Lock()
+        self._git = None
+        self._pid = None
+        self._tree = None
+
+    def _load_tree(self):
+        """Index the whole tree of the commit with a single ``ls-tree``."""
+        blobs = {}
+        listings = {'': ([], [])}
+        output = Git(self.repo_path).ls_tree(
+            '-r', '-t', '-z', '--full-tree', self.commit)
+        for entry in output.split('\0'):
+            if not entry:
+                continue
+            meta, path = entry.split('\t', 1)
+            mode, kind, sha = meta.split()
+            parent, name = posixpath.split(path)
+            if kind == 'blob':
+                listings[parent][1].append(name)
+                blobs[path] = (mode, sha)
+            else:
+                # Trees, as well as submodules which are never descended into.
+                listings[parent][0].append(name)
+                listings.setdefault(path, ([], []))
+        return blobs, listings
+
+    @property
+    def tree(self):
+        with self._lock:
+            if self._tree is None:
+                LOG.debug(
+                    'Indexing tree of commit %s of repo %s', self.commit,
+                    self.repo_path)
+                self._tree = self._load_tree()
+            return self._tree
+
+    def _object_data(self, sha):
+        with self._lock:
+            # The persistent cat-file process can't be shared with, or
+            # inherited by, other processes.
+            if self._git is None or self._pid != os.getpid():
+                self._git = Git(self.repo_path)
+                self._pid = os.getpid()
+            return self._git.get_object_data(sha)[3]
+
+    def _resolve(self, relpath):
+        """Return the path of the entry ``relpath`` ultimately points to,
+        following symbolic links within the tree.
+        """
+        blobs, _ = self.tree
+        for _ in range(_MAX_SYMLINKS):
+            mode_sha = blobs.get(relpath)
+            if mode_sha is None or mode_sha[0] != _SYMLINK_MODE:
+                return relpath
+            target = self._object_data(mode_sha[1]).decode('utf-8')
+            relpath = posixpath.normpath(
+                posixpath.join(posixpath.dirname(relpath), target))
+        return None
+
+    def listing(self, relpath):
+        """Return the ``(dirs, files, links)`` listing of directory
+        ``relpath``, classified like :func:`os.walk` does.
+
+        :raises FileNotFoundError: If ``relpath`` isn't a directory.
+        """
+        blobs, listings = self.tree
+        relpath = _posix(relpath)
+        if relpath not in listings:
+            raise FileNotFoundError(relpath)
+        dirs, files = listings[relpath]
+        dirs = list(dirs)
+        links = set()
+        regular = []
+        for name in files:
+            path = posixpath.join(relpath, name)
+            if blobs[path][0] == _SYMLINK_MODE:
+                if self._resolve(path) in listings:
+                    dirs.append(name)
+                    links.add(name)
+                    continue
+            regular.append(name)
+        return tuple(dirs), tuple(regular), frozenset(links)
+
+    def sha(self, relpath):
+        """Return the SHA of the blob of file ``relpath``.
+
+        :raises FileNotFoundError: If ``relpath`` isn't a file.
+        """
+        blobs, _ = self.tree
+        resolved = self._resolve(_posix(relpath))
+        if resolved not in blobs:
+            raise FileNotFoundError(relpath)
+        return blobs[resolved][1]
+
+    def read(self, relpath):
+        """Return the content of file ``relpath`` as bytes.
+
+        :raises FileNotFoundError: If ``relpath`` isn't a file.
+        """
+        return self._object_data(self.sha(relpath))
+
+    def exists(self, relpath):
+        relpath = _posix(relpath)
+        blobs, listings = self.tree
+        return relpath in listings or self._resolve(relpath) in blobs
+
+    def close(self):
+        with self._lock:
+            if self._git is not None and self._pid == os.getpid():
+                self._git.clear_cache()
+            self._git = None
+
+
+def _posix(relpath):
+    relpath = posixpath.normpath(relpath.replace(os.sep, '/'))
+    return '' if relpath == '.' else relpath
+
+
+def register(root, repo_path, ref):
+    """Serve the files of local repository ``repo_path`` at ``ref`` from
+    ``root``, a path that must not exist.
+
+    :returns: ``root``
+    :raises GitInvalidRefException: If ``ref`` isn't a commit, branch or tag
+        of ``repo_path``.
+    """
+    try:
+        commit = Git(repo_path).rev_parse(
+            '--verify', '--quiet', '%s^{commit}' % ref)
+    except git_exc.GitCommandError:
+        raise exceptions.GitInvalidRefException(ref=ref, repo_url=repo_path)
+    LOG.debug(
+        'Serving %s at ref=%s (%s) from %s', repo_path, ref, commit, root)
+    config.add_repo_revision(
+        os.path.abspath(root), os.path.abspath(repo_path), commit, ref)
+    return root
+
+
+def lookup(path):
+    """Return the :class:`Revision` ``path`` is served from, and ``path``
+    relative to its root, or None if ``path`` is an ordinary path.
+    """
+    registered = config.get_repo_revisions()
+    if not registered:
+        return None
+    path = os.path.abspath(path)
+    for root, (repo_path, commit, ref) in registered.items():
+        if path == root or path.startswith(root + os.sep):
+            key = (root, repo_path, commit)
+            with _REVISIONS_LOCK:
+                revision = _REVISIONS.get(key)
+                if revision is None:
+                    revision = _REVISIONS[key] = Revision(
+                        repo_path, commit, ref)
+            return revision, os.path.relpath(path, root)
+    return None
+
+
+@atexit.register
+def _close():
+    for revision in _REVISIONS.values():
+        revision.close()
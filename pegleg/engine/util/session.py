@@ -0,0 +1,69 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-invocation document session.
+
+Commands such as ``site collect --validate`` run several stages (file
+checks, rendering, collection) over the same files. Within a
+:func:`session`, results memoized through :func:`memo` are shared by all of
+those stages, so that each file is parsed once per command even when the
+persistent cache is disabled. Outside of a session nothing is retained.
+"""
+
+import contextlib
+import logging
+
+LOG = logging.getLogger(__name__)
+
+__all__ = ('active', 'memo', 'session')
+
+_MEMOS = None
+
+
+@contextlib.contextmanager
+def session():
+    """Context manager delimiting a document session.
+
+    Nested sessions join the outermost one.
+    """
+    global _MEMOS
+    if _MEMOS is not None:
+        yield
+        return
+    _MEMOS = {}
+    try:
+        yield
+    finally:
+        LOG.debug(
+            'Closing document session: %s', {
+                namespace: len(values)
+                for namespace, values in _MEMOS.items()
+            })
+        _MEMOS = None
+
+
+def active():
+    """Return True if a document session is open."""
+    return _MEMOS is not None
+
+
+def memo(namespace):
+    """Return the memo dict for ``namespace`` in the current session.
+
+    Outside of a session a new, empty dict is returned every time, so
+    callers can use the result unconditionally.
+    """
+    if _MEMOS is None:
+        return {}
+    return _MEMOS.setdefault(namespace, {})
@@ -12,10 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import json
 import logging
 import uuid
+import zlib
 
+import requests
 from shipyard_client.api_client.shipyard_api_client import ShipyardClient
 from shipyard_client.api_client.shipyardclient_context import \
     ShipyardClientContext
@@ -23,12 +26,25 @@ import yaml
 
 from pegleg.engine import exceptions
 from pegleg.engine import site
+from pegleg.engine.util import cache
 from pegleg.engine.util import files
 from pegleg.engine.util.files import add_representer_ordered_dict
 from pegleg.engine.util.pegleg_secret_management import PeglegSecretManagement
 
 LOG = logging.getLogger(__name__)
 
+# Path of the configdocs endpoint, relative to the Shipyard API endpoint.
+CONFIGDOCS_PATH = '{}/configdocs/{}'
+# Size of the chunks the upload payload is sent in.
+CHUNK_SIZE = 64 * 1024
+# (connect, read) timeouts of the upload request, in seconds. Shipyard
+# validates the documents before responding, which takes a while for big
+# sites.
+UPLOAD_TIMEOUT = (60, 3600)
+
+_MANIFEST_VERSION = '1'
+_MANIFEST_CACHE = cache.get_cache('uploads')
+
 
 class AuthValuesError(exceptions.PeglegBaseException):
     """Shipyard authentication failed. """
@@ -50,13 +66,24 @@ class ShipyardHelper(object):
     3. Commits the document
     4. Formats response from Shipyard api_client
     """
-    def __init__(self, context, buffer_mode='replace'):
+    def __init__(
+            self,
+            context,
+            buffer_mode='replace',
+            compress=False,
+            force=False,
+            stream=False):
         """
         Initializes params to be used by Shipyard
 
         :param context: ShipyardHelper context object that contains
                         params for initializing ShipyardClient with
                         correct client context and the site_name.
+        :param compress: Whether to gzip the uploaded documents.
+        :param force: Whether to upload the documents even if they haven't
+                      changed since their last upload.
+        :param stream: Whether to send the documents with chunked transfer
+                       encoding while they are read.
         """
         self.ctx = context
         self.api_parameters = self.ctx.obj['API_PARAMETERS']
@@ -70,24 +97,22 @@ class ShipyardHelper(object):
             self.auth_vars, self.context_marker)
         self.api_client = ShipyardClient(self.client_context)
         self.buffer_mode = buffer_mode
+        self.compress = compress
+        self.force = force
+        self.stream = stream
         self.collection = self.ctx.obj.get('collection', self.site_name)
 
     def upload_documents(self):
-        """Uploads documents to Shipyard"""
-
-        collected_documents = files.collect_files_by_repo(self.site_name)
-
-        collection_data = [site.get_deployment_data_doc(self.site_name)]
-        LOG.info("Processing %d collection(s)", len(collected_documents))
-        for idx, document in enumerate(collected_documents):
-            # Decrypt the documents if encrypted
-            pegleg_secret_mgmt = PeglegSecretManagement(
-                docs=collected_documents[document])
-            decrypted_documents = pegleg_secret_mgmt.get_decrypted_secrets()
-            collection_data.extend(decrypted_documents)
-        add_representer_ordered_dict()
-        collection_as_yaml = yaml.dump_all(
-            collection_data, Dumper=yaml.SafeDumper)
+        """Uploads documents to Shipyard
+
+        The documents are read, decrypted and serialized one file at a time.
+        With ``stream`` set they are sent with chunked transfer encoding as
+        they are, so that the whole collection is never held in memory.
+
+        Upload and commit are skipped when the documents are the same as
+        the ones last uploaded to, and committed in, the collection, unless
+        ``force`` is set.
+        """
 
         # Append flag is not required for the first
         # collection being uploaded to Shipyard. It
@@ -99,10 +124,26 @@ class ShipyardHelper(object):
 
         try:
             self.validate_auth_vars()
-            resp_text = self.api_client.post_configdocs(
-                collection_id=self.collection,
-                buffer_mode=buffer_mode,
-                document_data=collection_as_yaml)
+            deployment_data = site.get_deployment_data_doc(self.site_name)
+            manifest = UploadManifest(
+                self.api_client.get_endpoint(), self.collection)
+            for document in self._documents(deployment_data, decrypt=False):
+                manifest.add(document)
+            previous = manifest.load_previous()
+            if previous is not None and not self.force:
+                changed, removed = manifest.changes(previous)
+                if not changed and not removed:
+                    return self._skip_unchanged(previous)
+                LOG.info(
+                    "%d document(s) added or changed, and %d removed or "
+                    "changed since the last upload of collection %s", changed,
+                    removed, self.collection)
+            payload = _chunked(
+                _serialize(self._documents(deployment_data)), CHUNK_SIZE)
+            if self.compress:
+                payload = _gzip(payload)
+            resp_text = self.post_configdocs(
+                buffer_mode, manifest.counted(payload))
 
         except AuthValuesError as ave:
             resp_text = "Error: {}".format(ave.diagnostic)
@@ -113,14 +154,7 @@ class ShipyardHelper(object):
             LOG.debug(resp_text, exc_info=True)
             raise DocumentUploadError(resp_text)
 
-        # FIXME: Standardize status_code in Deckhand to avoid this
-        # workaround.
-        code = 0
-        if hasattr(resp_text, 'status_code'):
-            code = resp_text.status_code
-        elif hasattr(resp_text, 'code'):
-            code = resp_text.code
-        if code >= 400:
+        if _status_code(resp_text) >= 400:
             if hasattr(resp_text, 'content'):
                 raise DocumentUploadError(resp_text.content)
             else:
@@ -131,20 +165,80 @@ class ShipyardHelper(object):
 
         # Commit in the last iteration of the loop when all the documents
         # have been pushed to Shipyard buffer.
-        return self.commit_documents()
+        return self.commit_documents(manifest)
+
+    def _documents(self, deployment_data, decrypt=True):
+        """Yield ``deployment_data``, then the documents of the site, one
+        file at a time.
+
+        :param decrypt: Whether to decrypt the documents if encrypted.
+        """
+        yield deployment_data
+        for repo_name, documents in files.iter_files_by_repo(self.site_name):
+            if decrypt:
+                # Decrypt the documents if encrypted
+                pegleg_secret_mgmt = PeglegSecretManagement(docs=documents)
+                documents = pegleg_secret_mgmt.get_decrypted_secrets()
+            yield from documents
+
+    def _skip_unchanged(self, previous):
+        resp_text = (
+            "Collection {} is unchanged since its last upload, skipped "
+            "upload and commit. Avoided sending {} bytes.".format(
+                self.collection, previous['size']))
+        LOG.info(resp_text)
+        return resp_text
+
+    def post_configdocs(self, buffer_mode, payload):
+        """Post ``payload``, an iterable of bytes, to the Shipyard buffer.
+
+        By default the payload is joined and posted with a Content-Length,
+        through ``ShipyardClient.post_configdocs`` unless it is gzip encoded,
+        which the client cannot declare. With ``stream`` set, it is sent as
+        it is produced with chunked transfer encoding instead.
+        """
+        if not self.stream:
+            payload = b''.join(payload)
+            if not self.compress:
+                return self.api_client.post_configdocs(
+                    collection_id=self.collection,
+                    buffer_mode=buffer_mode,
+                    document_data=payload.decode('utf-8'))
+        url = CONFIGDOCS_PATH.format(
+            self.api_client.get_endpoint(), self.collection)
+        headers = {
+            'X-Context-Marker': self.context_marker,
+            'X-Auth-Token': self.api_client.get_token(),
+            'Content-Type': 'application/x-yaml',
+        }
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+        LOG.debug("Posting documents to %s", url)
+        return requests.post(
+            url,
+            data=payload,
+            params={'buffermode': buffer_mode},
+            headers=headers,
+            timeout=UPLOAD_TIMEOUT)
+
+    def commit_documents(self, manifest=None):
+        """Commit Shipyard buffer documents
 
-    def commit_documents(self):
-        """Commit Shipyard buffer documents """
+        :param manifest: :class:`UploadManifest` of the uploaded documents,
+                         saved once they have been committed.
+        """
 
         LOG.info("Commiting Shipyard buffer documents")
 
         try:
-            resp_text = self.formatted_response_handler(
-                self.api_client.commit_configdocs())
+            response = self.api_client.commit_configdocs()
+            resp_text = self.formatted_response_handler(response)
         except Exception as ex:
             resp_text = (
                 "Error: Unable to invoke action due to: {}".format(str(ex)))
             raise DocumentUploadError(resp_text)
+        if manifest is not None and _status_code(response) < 400:
+            manifest.save()
         return resp_text
 
     def validate_auth_vars(self):
@@ -175,3 +269,97 @@ class ShipyardHelper(object):
                 return (
                     "This is not json and could not be printed as such. \n"
                     + response.text)
+
+
+class UploadManifest(object):
+    """Content hashes of the documents uploaded to a Shipyard collection.
+
+    The manifest of the last upload that was committed is kept in the
+    ``uploads`` cache, keyed by Shipyard endpoint and collection id.
+    Documents are hashed as read from the site repositories, before they
+    are decrypted, so that secrets never end up in the cache.
+    """
+    def __init__(self, endpoint, collection):
+        self.key = cache.digest(_MANIFEST_VERSION, endpoint, collection)
+        self.documents = collections.Counter()
+        self.size = 0
+
+    def add(self, document):
+        add_representer_ordered_dict()
+        self.documents[cache.digest(
+            yaml.dump(document, Dumper=yaml.SafeDumper))] += 1
+
+    def counted(self, data):
+        """Yield the byte strings of iterable ``data``, adding up their size
+        as the size of the upload.
+        """
+        for item in data:
+            self.size += len(item)
+            yield item
+
+    def changes(self, previous):
+        """Return the number of documents added or changed, and removed,
+        since the ``previous`` manifest.
+        """
+        documents = collections.Counter(previous['documents'])
+        return (
+            sum((self.documents - documents).values()),
+            sum((documents - self.documents).values()))
+
+    def load_previous(self):
+        """Return the manifest of the last committed upload, or None."""
+        return _MANIFEST_CACHE.get(self.key)
+
+    def save(self):
+        _MANIFEST_CACHE.set(
+            self.key, {
+                'documents': dict(self.documents),
+                'size': self.size
+            })
+
+
+def _status_code(response):
+    # FIXME: Standardize status_code in Deckhand to avoid this
+    # workaround.
+    if hasattr(response, 'status_code'):
+        return response.status_code
+    elif hasattr(response, 'code'):
+        return response.code
+    return 0
+
+
+def _serialize(documents):
+    """Yield ``documents`` as a YAML stream, as ``yaml.dump_all`` does, but
+    one encoded document at a time.
+    """
+    add_representer_ordered_dict()
+    for idx, document in enumerate(documents):
+        yield yaml.dump(
+            document, Dumper=yaml.SafeDumper, explicit_start=idx
+            > 0).encode('utf-8')
+
+
+def _chunked(data, size):
+    """Coalesce the byte strings of iterable ``data`` into chunks of at least
+    ``size`` bytes, except for the last one.
+    """
+    buffer = bytearray()
+    for item in data:
+        buffer += item
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _gzip(data):
+    """Yield the byte strings of iterable ``data`` compressed in the gzip
+    format.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for item in data:
+        compressed = compressor.compress(item)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
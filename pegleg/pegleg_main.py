@@ -16,12 +16,15 @@ import functools
 import logging
 import os
 
+import click
+
 from pegleg import config
 from pegleg import engine
 from pegleg.engine import bundle
 from pegleg.engine import catalog
 from pegleg.engine.secrets import wrap_secret
 from pegleg.engine.util import files
+from pegleg.engine.util import session
 from pegleg.engine.util.shipyard_helper import ShipyardHelper
 
 LOG_FORMAT = '%(asctime)s %(levelname)-8s %(name)s:' \
@@ -43,6 +46,19 @@ def set_logging_level(verbose=False, logging_level=40):
     logging.basicConfig(format=LOG_FORMAT, level=int(lvl))
 
 
+def set_cache(enabled=True, cache_dir=None):
+    """Configures the persistent on-disk cache used by pegleg
+
+    :param enabled: disables the cache entirely when False
+    :param cache_dir: directory in which cache entries are stored; defaults
+                      to ``pegleg`` under ``$XDG_CACHE_HOME``
+    :return:
+    """
+    config.set_cache_enabled(enabled)
+    if cache_dir:
+        config.set_cache_dir(cache_dir)
+
+
 def run_config(
         site_repository,
         clone_path,
@@ -50,7 +66,9 @@ def run_config(
         repo_username,
         extra_repositories,
         run_umask=True,
-        decrypt_repos=False):
+        decrypt_repos=False,
+        clone_mode='full',
+        checkout=True):
     """Initializes pegleg configuration data
 
     :param site_repository: path or URL for site repository
@@ -62,8 +80,19 @@ def run_config(
                                from, specified as "type=REPO_URL/PATH"
     :param run_umask: if True, runs set_umask for os file output
     :param decrypt_repos: if True, decrypts repos before executing command
+    :param clone_mode: how to clone remote repositories: full, shallow or
+                       sparse
+    :param checkout: if False, reads local repositories at a revision from
+                     their Git object database rather than checking them out
     :return:
+    :raises click.ClickException: if both ``decrypt_repos`` is True and
+                                  ``checkout`` is False
     """
+    if decrypt_repos and not checkout:
+        # Secrets are decrypted in place, which a revision read from the
+        # object database has none of.
+        raise click.ClickException(
+            '--decrypt cannot be used with --no-checkout.')
     config.set_site_repo(site_repository)
     config.set_clone_path(clone_path)
     if extra_repositories:
@@ -73,15 +102,25 @@ def run_config(
     if run_umask:
         config.set_umask()
     config.set_decrypt_repos(decrypt_repos)
+    config.set_clone_mode(clone_mode)
+    config.set_checkout(checkout)
 
 
 def _run_lint_helper(
-        *, fail_on_missing_sub_src, exclude_lint, warn_lint, site_name=None):
+        *,
+        fail_on_missing_sub_src,
+        exclude_lint,
+        warn_lint,
+        site_name=None,
+        jobs=1,
+        sitenames=None,
+        timings=None):
     """Helper for executing lint on specific site or all sites in repo."""
     if site_name:
         func = functools.partial(engine.lint.site, site_name=site_name)
     else:
-        func = engine.lint.full
+        func = functools.partial(
+            engine.lint.full, jobs=jobs, sitenames=sitenames, timings=timings)
     warns = func(
         fail_on_missing_sub_src=fail_on_missing_sub_src,
         exclude_lint=exclude_lint,
@@ -103,21 +142,44 @@ def _run_precommand_decrypt(site_name):
         LOG.debug('Skipping pre-command repository decryption.')
 
 
-def run_lint(exclude_lint, fail_on_missing_sub_src, warn_lint):
+def run_lint(
+        exclude_lint,
+        fail_on_missing_sub_src,
+        warn_lint,
+        jobs=1,
+        sitenames=None,
+        since=None,
+        timings=None):
     """Runs linting on a repository
 
     :param exclude_lint: exclude specified linting rules
     :param fail_on_missing_sub_src: if True, fails when a substitution source
                                     file is missing
     :param warn_lint: output warnings for specified rules
+    :param jobs: number of worker processes to lint with, 0 for one per CPU
+    :param sitenames: only lint these sites, all sites if None
+    :param since: only lint sites (of ``sitenames``) whose inputs changed
+                  since this Git ref
+    :param timings: list extended with a ``(site_name, render_errors,
+                    seconds)`` tuple per linted site, if given
     :return: warnings developed from linting
     :rtype: list
     """
     engine.repository.process_site_repository(update_config=True)
-    warns = _run_lint_helper(
-        fail_on_missing_sub_src=fail_on_missing_sub_src,
-        exclude_lint=exclude_lint,
-        warn_lint=warn_lint)
+    if since:
+        affected = engine.site.affected(since)
+        if sitenames is not None:
+            affected = [s for s in affected if s in sitenames]
+        LOG.info('Sites affected by changes since %s: %s', since, affected)
+        sitenames = affected
+    with session.session():
+        warns = _run_lint_helper(
+            fail_on_missing_sub_src=fail_on_missing_sub_src,
+            exclude_lint=exclude_lint,
+            warn_lint=warn_lint,
+            jobs=jobs,
+            sitenames=sitenames,
+            timings=timings)
     return warns
 
 
@@ -134,14 +196,17 @@ def run_collect(exclude_lint, save_location, site_name, validate, warn_lint):
     :return:
     """
     _run_precommand_decrypt(site_name)
-    if validate:
-        # Lint the primary repo prior to document collection.
-        _run_lint_helper(
-            site_name=site_name,
-            fail_on_missing_sub_src=True,
-            exclude_lint=exclude_lint,
-            warn_lint=warn_lint)
-    engine.site.collect(site_name, save_location)
+    # Lint and collection share one document session, so that validating
+    # doesn't parse every file a second time.
+    with session.session():
+        if validate:
+            # Lint the primary repo prior to document collection.
+            _run_lint_helper(
+                site_name=site_name,
+                fail_on_missing_sub_src=True,
+                exclude_lint=exclude_lint,
+                warn_lint=warn_lint)
+        engine.site.collect(site_name, save_location)
 
 
 def run_list_sites(output_stream):
@@ -154,6 +219,17 @@ def run_list_sites(output_stream):
     engine.site.list_(output_stream)
 
 
+def run_list_affected_sites(output_stream, since):
+    """Output the sites whose inputs changed since a Git ref
+
+    :param output_stream: where to output site names
+    :param since: branch, tag, commit or ref to compare against
+    :return:
+    """
+    engine.repository.process_site_repository(update_config=True)
+    engine.site.list_affected(since, output_stream)
+
+
 def run_show(output_stream, site_name):
     """Shows details for one site
 
@@ -173,7 +249,8 @@ def run_render(output_stream, site_name, validate):
     :return:
     """
     _run_precommand_decrypt(site_name)
-    engine.site.render(site_name, output_stream, validate)
+    with session.session():
+        engine.site.render(site_name, output_stream, validate)
 
 
 def run_lint_site(exclude_lint, fail_on_missing_sub_src, site_name, warn_lint):
@@ -187,17 +264,31 @@ def run_lint_site(exclude_lint, fail_on_missing_sub_src, site_name, warn_lint):
     :return:
     """
     _run_precommand_decrypt(site_name)
-    return _run_lint_helper(
-        fail_on_missing_sub_src=fail_on_missing_sub_src,
-        exclude_lint=exclude_lint,
-        warn_lint=warn_lint,
-        site_name=site_name)
+    with session.session():
+        return _run_lint_helper(
+            fail_on_missing_sub_src=fail_on_missing_sub_src,
+            exclude_lint=exclude_lint,
+            warn_lint=warn_lint,
+            site_name=site_name)
 
 
 def run_upload(
-        buffer_mode, collection, context_marker, ctx, os_auth_token,
-        os_auth_url, os_domain_name, os_password, os_project_domain_name,
-        os_project_name, os_user_domain_name, os_username, site_name):
+        buffer_mode,
+        collection,
+        context_marker,
+        ctx,
+        os_auth_token,
+        os_auth_url,
+        os_domain_name,
+        os_password,
+        os_project_domain_name,
+        os_project_name,
+        os_user_domain_name,
+        os_username,
+        site_name,
+        compress=False,
+        stream=False,
+        force=False):
     """Uploads a collection of documents to shipyard
 
     :param buffer_mode: mode used when uploading documents
@@ -213,6 +304,11 @@ def run_upload(
     :param os_user_domain_name: user domain name
     :param os_username: username
     :param site_name: site name to process
+    :param compress: whether to gzip the uploaded documents
+    :param stream: whether to send the documents with chunked transfer
+        encoding as they are read, rather than all at once
+    :param force: whether to upload documents that haven't changed since
+        their last upload
     :return: response from shipyard instance
     """
     _run_precommand_decrypt(site_name)
@@ -242,11 +338,21 @@ def run_upload(
     ctx.obj['site_name'] = site_name
     ctx.obj['collection'] = collection
     config.set_global_enc_keys(site_name)
-    return ShipyardHelper(ctx, buffer_mode).upload_documents()
+    return ShipyardHelper(
+        ctx, buffer_mode, compress=compress, force=force,
+        stream=stream).upload_documents()
 
 
 def run_generate_pki(
-        author, days, regenerate_all, site_name, save_location=None):
+        author,
+        days,
+        regenerate_all,
+        site_name,
+        save_location=None,
+        pki_backend=None,
+        jobs=0,
+        expiring_within=None,
+        regenerate_changed=False):
     """Generates certificates from PKI catalog
 
     :param author: identifies author generating new certificates for
@@ -256,8 +362,18 @@ def run_generate_pki(
                            expiration
     :param site_name: site name to process
     :param save_location: directory to store the generated site certificates in
+    :param pki_backend: backend generating the certificates, defaults to the
+                        configured one
+    :param jobs: number of worker processes generating certificates, 0 for
+                 one per CPU
+    :param expiring_within: regenerate only the missing certificates and
+                            those expiring within this many days
+    :param regenerate_changed: regenerate the certificates whose common name,
+                               hosts or groups changed in the catalog
     :return: list of paths written to
     """
+    if pki_backend:
+        config.set_pki_backend(pki_backend)
     _run_precommand_decrypt(site_name)
     engine.repository.process_repositories(site_name, overwrite_existing=True)
     pkigenerator = catalog.pki_generator.PKIGenerator(
@@ -265,7 +381,10 @@ def run_generate_pki(
         author=author,
         duration=days,
         regenerate_all=regenerate_all,
-        save_location=save_location)
+        save_location=save_location,
+        jobs=jobs,
+        expiring_within=expiring_within,
+        regenerate_changed=regenerate_changed)
     output_paths = pkigenerator.generate()
     return output_paths
 
@@ -314,20 +433,44 @@ def run_genesis_bundle(build_dir, site_name, validators):
         logging.DEBUG == LOG.getEffectiveLevel(), site_name)
 
 
-def run_check_pki_certs(days, site_name):
+def run_check_pki_certs(
+        days, site_name, pki_backend=None, jobs=1, output_format='table'):
     """Checks PKI certificates for upcoming expiration
 
     :param days: number of days in advance to check for upcoming expirations
     :param site_name: site name to process
-    :return:
+    :param pki_backend: backend inspecting the certificates, defaults to the
+                        configured one
+    :param jobs: number of worker processes scanning certificate files
+    :param output_format: ``table`` or ``json`` report
+    :return: whether certificates are expiring, and the report
     """
+    if pki_backend:
+        config.set_pki_backend(pki_backend)
     _run_precommand_decrypt(site_name)
-    config.set_global_enc_keys(site_name)
     expiring_certs_exist, cert_results = engine.secrets.check_cert_expiry(
-        site_name, duration=days)
+        site_name, duration=days, jobs=jobs, output_format=output_format)
     return expiring_certs_exist, cert_results
 
 
+def run_check_repo_pki_certs(
+        days, pki_backend=None, jobs=1, output_format='table'):
+    """Checks PKI certificates of all sites for upcoming expiration
+
+    :param days: number of days in advance to check for upcoming expirations
+    :param pki_backend: backend inspecting the certificates, defaults to the
+                        configured one
+    :param jobs: number of worker processes scanning certificate files
+    :param output_format: ``table`` or ``json`` report
+    :return: whether certificates are expiring, and the report
+    """
+    if pki_backend:
+        config.set_pki_backend(pki_backend)
+    engine.repository.process_site_repository(update_config=True)
+    return engine.secrets.check_repo_cert_expiry(
+        duration=days, jobs=jobs, output_format=output_format)
+
+
 def run_list_types(output_stream):
     """List type names for a repository
 
@@ -338,6 +481,24 @@ def run_list_types(output_stream):
     engine.type.list_types(output_stream)
 
 
+def run_cache_stats(output_stream):
+    """Reports the contents of the persistent cache
+
+    :param output_stream: stream to output the report to
+    :return:
+    """
+    engine.cache.stats(output_stream)
+
+
+def run_cache_clear(namespaces):
+    """Removes entries from the persistent cache
+
+    :param namespaces: cache namespaces to clear, all of them if empty
+    :return:
+    """
+    engine.cache.clear(namespaces)
+
+
 def run_generate_passphrases(
         author,
         force_cleartext,
@@ -368,7 +529,7 @@ def run_generate_passphrases(
         force_cleartext=force_cleartext)
 
 
-def run_encrypt(author, save_location, site_name, path=None):
+def run_encrypt(author, save_location, site_name, path=None, jobs=1):
     """Wraps and encrypts site secret documents
 
     :param author: identifies author generating new certificates for
@@ -377,16 +538,17 @@ def run_encrypt(author, save_location, site_name, path=None):
                           original documents are overwritten
     :param site_name: site name to process
     :param path: path to the document(s) to encrypt
+    :param jobs: number of worker processes, 0 uses one per CPU
     :return:
     """
     config.set_global_enc_keys(site_name)
     if save_location is None and path is None:
         save_location = config.get_site_repo()
     engine.secrets.encrypt(
-        save_location, author, site_name=site_name, path=path)
+        save_location, author, site_name=site_name, path=path, jobs=jobs)
 
 
-def run_decrypt(overwrite, path, save_location, site_name):
+def run_decrypt(overwrite, path, save_location, site_name, jobs=1):
     """Unwraps and decrypts secret documents for a site
 
     :param overwrite: if True, overwrites original files with decrypted
@@ -394,6 +556,7 @@ def run_decrypt(overwrite, path, save_location, site_name):
     :param save_location: if specified saves to the given path, otherwise
                           returns list of decrypted information
     :param site_name: site name to process
+    :param jobs: number of worker processes, 0 uses one per CPU
     :return: decrypted data list if save_location is None
     :rtype: list
     """
@@ -402,10 +565,10 @@ def run_decrypt(overwrite, path, save_location, site_name):
     if type(path) is not list and type(path) is not tuple:
         path = [path]
     for p in path:
-        decrypted = engine.secrets.decrypt(p, site_name=site_name)
+        decrypted = engine.secrets.decrypt(p, site_name=site_name, jobs=jobs)
         if overwrite:
             for file_path, data in decrypted.items():
-                files.write(data, file_path)
+                files.write(data, file_path, atomic=True)
         elif save_location is None:
             for data in decrypted.values():
                 decrypted_data.append(data)
@@ -413,7 +576,7 @@ def run_decrypt(overwrite, path, save_location, site_name):
             for file_path, data in decrypted.items():
                 file_name = os.path.split(file_path)[1]
                 file_save_location = os.path.join(save_location, file_name)
-                files.write(data, file_save_location)
+                files.write(data, file_save_location, atomic=True)
     return decrypted_data
 
 
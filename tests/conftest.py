@@ -21,6 +21,7 @@ import yaml
 
 from pegleg import config
 from pegleg.engine.util import files
+from pegleg.engine.util import index
 
 TEST_DOCUMENT = """
 ---
@@ -49,6 +50,22 @@ def restore_config():
         config.GLOBAL_CONTEXT = original_global_context
 
 
+@pytest.fixture(autouse=True)
+def isolate_cache(tmp_path_factory):
+    """Points the persistent cache at a fresh directory for each test so
+    that tests never share, or pollute, the user's cache.
+    """
+    config.set_cache_dir(str(tmp_path_factory.mktemp('pegleg-cache')))
+
+
+@pytest.fixture(autouse=True)
+def reset_index():
+    """Ensures directory listings indexed by one test, whose files may have
+    been changed directly on disk, are not reused by the next one.
+    """
+    index.invalidate()
+
+
 def _gen_document(**kwargs):
     if "storagePolicy" not in kwargs:
         kwargs["storagePolicy"] = "cleartext"
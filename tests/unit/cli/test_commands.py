@@ -17,6 +17,7 @@ import subprocess
 from unittest import mock
 
 from click.testing import CliRunner
+from git import Repo
 import pytest
 import yaml
 
@@ -499,6 +500,22 @@ class TestRepoCliActions(BaseCLIActionTest):
         # output nothing.
         assert not result.output
 
+    def test_lint_repo_with_timings(self):
+        """Validates repo lint action prints per-site render timings."""
+        lint_command = [
+            '-r', self.treasuremap_path, 'lint', '--site', self.site_name,
+            '--timings', '-x', errorcodes.SCHEMA_STORAGE_POLICY_MISMATCH_FLAG,
+            '-x', errorcodes.SECRET_NOT_ENCRYPTED_POLICY
+        ]
+
+        with mock.patch('pegleg.engine.site.util.deckhand') as mock_deckhand:
+            mock_deckhand.deckhand_render.return_value = ([], [])
+            result = self.runner.invoke(commands.repo, lint_command)
+
+        assert result.exit_code == 0, result.output
+        assert 'Per-site render timings:' in result.output
+        assert self.site_name in result.output
+
 
 class TestSiteSecretsActions(BaseCLIActionTest):
     """Tests site secrets-related CLI actions."""
@@ -1062,3 +1079,34 @@ class TestCliSiteSubcommandsWithDecryptOption(BaseCLIActionTest):
         assert result.exit_code == 0
         assert self._validate_no_files_encrypted(tmpdir)
         mock_generator.assert_called_once()
+
+
+@pytest.mark.parametrize('command', ['affected-sites', 'lint'])
+def test_repo_since_invalid_ref(tmpdir, command):
+    repo = Repo.init(str(tmpdir))
+    repo.create_remote('origin', 'https://example.com/site-repo.git')
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'Test')
+        writer.set_value('user', 'email', 'test@example.com')
+    tmpdir.join('file.yaml').write('---\n')
+    repo.index.add(['file.yaml'])
+    repo.index.commit('initial')
+
+    result = CliRunner().invoke(
+        commands.main,
+        ['repo', '-r',
+         str(tmpdir), command, '--since', 'no-such-ref'])
+
+    assert result.exit_code == 1, result.output
+    assert 'Error: Failed to resolve ref no-such-ref in repo' in result.output
+
+
+def test_site_decrypt_with_no_checkout(tmpdir):
+    result = CliRunner().invoke(
+        commands.main, [
+            'site', '-r',
+            str(tmpdir), '--decrypt', '--no-checkout', 'lint', 'site'
+        ])
+
+    assert result.exit_code == 1, result.output
+    assert '--decrypt cannot be used with --no-checkout' in result.output
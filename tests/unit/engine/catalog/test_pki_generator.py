@@ -18,6 +18,10 @@ import shutil
 import textwrap
 from unittest import mock
 
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
+from cryptography import x509
 import pytest
 import yaml
 
@@ -27,6 +31,7 @@ from pegleg.engine.catalog import pki_utility
 from pegleg.engine.common import managed_document
 from pegleg.engine import secrets
 from pegleg.engine.util import files
+from pegleg.engine.util.pegleg_secret_management import PeglegSecretManagement
 from tests.unit import test_utils
 
 _SITE_TEST_STRUCTURE = {
@@ -414,3 +419,179 @@ class TestPKIGenerator(object):
         rootpath = create_tmp_pki_structure(sitename, _PKI_CATALOG_EVERYTHING)
 
         self._test_pki_generates_everything(sitename)
+
+
+_PKI_CATALOG_TWO_CAS = textwrap.dedent(
+    """
+    ---
+    schema: pegleg/PKICatalog/v1
+    metadata:
+      schema: metadata/Document/v1
+      name: cluster-certificates
+      layeringDefinition:
+        abstract: false
+        layer: site
+      storagePolicy: cleartext
+    data:
+      certificate_authorities:
+        kubernetes:
+          certificates:
+            - document_name: apiserver
+              common_name: apiserver
+              kubernetes_service_names:
+                - kubernetes.default.svc
+            - document_name: kubelet-n3
+              common_name: system:node:n3
+              groups:
+                - system:nodes
+        etcd:
+          certificates:
+            - document_name: etcd-n3
+              common_name: etcd-n3
+              hosts:
+                - 192.168.77.13
+      keypairs:
+        - name: service-account
+    ...
+    """)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_pki_generation_order_is_deterministic(tmpdir, jobs):
+    """Validate that certificates are signed by their CA and that documents
+    are output in catalog order, however many jobs generate them.
+    """
+    documents = list(yaml.safe_load_all(_PKI_CATALOG_TWO_CAS))
+    with mock.patch.object(pki_generator.site, 'get_rendered_docs',
+                           return_value=documents), \
+            mock.patch.object(managed_document, '_get_repo_url_and_rev',
+                              return_value=('fake://nothing.git', 'master')):
+        pkigenerator = pki_generator.PKIGenerator(
+            'test', save_location=tmpdir.strpath, jobs=jobs)
+        output_paths = pkigenerator.generate()
+
+    generated = [
+        d['data']['managedDocument'] for d in pkigenerator.get_documents()
+    ]
+    assert [(d['schema'], d['metadata']['name']) for d in generated] == [
+        ('deckhand/CertificateAuthority/v1', 'kubernetes'),
+        ('deckhand/CertificateAuthority/v1', 'etcd'),
+        ('deckhand/CertificateAuthorityKey/v1', 'kubernetes'),
+        ('deckhand/CertificateAuthorityKey/v1', 'etcd'),
+        ('deckhand/Certificate/v1', 'apiserver'),
+        ('deckhand/Certificate/v1', 'kubelet-n3'),
+        ('deckhand/Certificate/v1', 'etcd-n3'),
+        ('deckhand/CertificateKey/v1', 'apiserver'),
+        ('deckhand/CertificateKey/v1', 'kubelet-n3'),
+        ('deckhand/CertificateKey/v1', 'etcd-n3'),
+        ('deckhand/PublicKey/v1', 'service-account'),
+        ('deckhand/PrivateKey/v1', 'service-account'),
+    ]
+    assert len(output_paths) == 6
+
+    # Generated documents are encrypted as they are written out.
+    decrypted = PeglegSecretManagement(
+        docs=pkigenerator.get_documents()).get_decrypted_secrets()
+    pems = {(d['schema'], d['metadata']['name']): d['data'] for d in decrypted}
+    signed_by = [
+        ('apiserver', 'kubernetes'),
+        ('kubelet-n3', 'kubernetes'),
+        ('etcd-n3', 'etcd'),
+    ]
+    for cert_name, ca_name in signed_by:
+        cert = x509.load_pem_x509_certificate(
+            pems[('deckhand/Certificate/v1', cert_name)].encode())
+        ca = x509.load_pem_x509_certificate(
+            pems[('deckhand/CertificateAuthority/v1', ca_name)].encode())
+        cert.verify_directly_issued_by(ca)
+
+
+def _generate_pki(documents, save_location, **kwargs):
+    with mock.patch.object(pki_generator.site, 'get_rendered_docs',
+                           return_value=documents), \
+            mock.patch.object(managed_document, '_get_repo_url_and_rev',
+                              return_value=('fake://nothing.git', 'master')):
+        pkigenerator = pki_generator.PKIGenerator(
+            'test', save_location=save_location, **kwargs)
+        output_paths = pkigenerator.generate()
+    documents = {
+        (d['schema'], d['metadata']['name']): d['data']
+        for d in PeglegSecretManagement(
+            docs=pkigenerator.get_documents()).get_decrypted_secrets()
+    }
+    return pkigenerator.get_documents(), documents, output_paths
+
+
+def test_pki_regenerate_changed(tmpdir):
+    """Validate that only the certificates changed in the catalog are
+    regenerated and rewritten.
+    """
+    catalog = list(yaml.safe_load_all(_PKI_CATALOG_TWO_CAS))
+    existing, before, _ = _generate_pki(catalog, tmpdir.strpath)
+
+    catalog = list(yaml.safe_load_all(_PKI_CATALOG_TWO_CAS))
+    catalog[0]['data']['certificate_authorities']['kubernetes'][
+        'certificates'][1]['groups'].append('system:masters')
+    _, after, output_paths = _generate_pki(
+        catalog + existing, tmpdir.strpath, regenerate_changed=True)
+
+    certificates = os.path.join(
+        tmpdir.strpath, 'site', 'test', 'secrets', 'certificates')
+    assert output_paths == {
+        os.path.join(certificates, 'kubernetes_kubelet_n3_certificate.yaml')
+    }
+    changed = [key for key in before if before[key] != after[key]]
+    assert sorted(changed) == [
+        ('deckhand/Certificate/v1', 'kubelet-n3'),
+        ('deckhand/CertificateKey/v1', 'kubelet-n3'),
+    ]
+
+
+def test_pki_regenerate_expiring(tmpdir):
+    """Validate that only the expiring certificates are regenerated, signed
+    by the existing CAs.
+    """
+    catalog = list(yaml.safe_load_all(_PKI_CATALOG_TWO_CAS))
+    existing, before, _ = _generate_pki(catalog, tmpdir.strpath, duration=30)
+
+    _, after, output_paths = _generate_pki(
+        catalog + existing, tmpdir.strpath, expiring_within=60)
+
+    assert len(output_paths) == 3
+    changed = [key for key in before if before[key] != after[key]]
+    assert sorted(changed) == sorted(
+        (schema, name) for schema in (
+            'deckhand/Certificate/v1', 'deckhand/CertificateKey/v1')
+        for name in ('apiserver', 'etcd-n3', 'kubelet-n3'))
+    for cert_name, ca_name in (('apiserver', 'kubernetes'), ('etcd-n3',
+                                                             'etcd')):
+        cert = x509.load_pem_x509_certificate(
+            after[('deckhand/Certificate/v1', cert_name)].encode())
+        ca = x509.load_pem_x509_certificate(
+            after[('deckhand/CertificateAuthority/v1', ca_name)].encode())
+        cert.verify_directly_issued_by(ca)
+
+
+def test_pki_generates_catalog_key_algorithms(tmpdir):
+    """Validate that the key algorithms of the catalog are used, and that
+    RSA 2048 remains the default.
+    """
+    catalog = list(yaml.safe_load_all(_PKI_CATALOG_TWO_CAS))
+    cas = catalog[0]['data']['certificate_authorities']
+    cas['kubernetes']['key'] = {'algo': 'ecdsa', 'size': 384}
+    cas['kubernetes']['certificates'][0]['key'] = {'algo': 'ecdsa'}
+    catalog[0]['data']['keypairs'][0]['key'] = {'algo': 'ed25519'}
+    _, documents, _ = _generate_pki(catalog, tmpdir.strpath)
+
+    def private_key(schema, name):
+        return serialization.load_pem_private_key(
+            documents[('deckhand/%s/v1' % schema, name)].encode(),
+            password=None)
+
+    assert private_key('CertificateAuthorityKey', 'kubernetes').key_size == 384
+    assert private_key('CertificateKey', 'apiserver').key_size == 256
+    assert isinstance(
+        private_key('CertificateKey', 'kubelet-n3'), rsa.RSAPrivateKey)
+    assert isinstance(
+        private_key('PrivateKey', 'service-account'),
+        ed25519.Ed25519PrivateKey)
@@ -12,13 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 from unittest import mock
 
+from git import Repo
+
+from pegleg import config
 from pegleg.engine import lint
 from pegleg.engine.errorcodes import DECKHAND_DUPLICATE_SCHEMA
 from pegleg.engine.errorcodes import DECKHAND_RENDER_EXCEPTION
+from pegleg.engine.errorcodes import FILE_MISSING_YAML_DOCUMENT_HEADER
+from pegleg.engine.errorcodes import SCHEMA_STORAGE_POLICY_MISMATCH_FLAG
+from pegleg.engine.errorcodes import SECRET_NOT_ENCRYPTED_POLICY
 from pegleg.engine.util import deckhand
+from pegleg.engine.util import definition
 from pegleg.engine.util import files
+from pegleg.engine.util import revision
 from pegleg.engine.util.pegleg_managed_document \
         import PeglegManagedSecretsDocument
 
@@ -199,6 +208,158 @@ def test_handle_managed_document():
     assert lint._handle_managed_document(managed) == not_managed
 
 
+def test_verify_file_contents_parallel_matches_serial(temp_deployment_files):
+    serial = lint._verify_file_contents()
+    parallel = lint._verify_file_contents(jobs=2)
+    # The cleartext passphrases in the fixture produce lint errors.
+    assert serial
+    assert parallel == serial
+
+
+def test_verify_deckhand_render_parallel_is_deterministic(
+        temp_deployment_files):
+    def _render(documents, **kwargs):
+        names = sorted(
+            d['metadata']['name'] for d in documents
+            if d['metadata']['layeringDefinition']['layer'] == 'site')
+        return None, [('P005', names[0]), ('P005', 'shared')]
+
+    def _in_process_map(func, items, jobs=1):
+        # Reverse the completion order to prove results are re-ordered.
+        return list(reversed([func(item) for item in reversed(list(items))]))
+
+    # Render results would otherwise be reused by the second call.
+    config.set_cache_enabled(False)
+    with mock.patch('pegleg.engine.util.deckhand.deckhand_render',
+                    autospec=True, side_effect=_render):
+        serial = lint._verify_deckhand_render()
+        with mock.patch.object(lint.util.pool, 'parallel_map',
+                               side_effect=_in_process_map) as mock_map:
+            parallel = lint._verify_deckhand_render(jobs=2)
+
+    mock_map.assert_called_once()
+    assert serial == parallel
+    assert serial == [
+        ('P005', 'cicd-chart'), ('P005', 'shared'), ('P005', 'lab-chart')
+    ]
+
+
+def test_verify_file_contents_reuses_findings_of_unchanged_files(
+        temp_deployment_files):
+    expected = lint._verify_file_contents()
+
+    with mock.patch.object(lint, '_verify_single_file',
+                           wraps=lint._verify_single_file) as mock_verify:
+        assert lint._verify_file_contents() == expected
+        assert not mock_verify.called
+
+        # Only the changed file is verified again.
+        path = os.path.join(
+            config.get_site_repo(), 'site', 'cicd', 'secrets', 'passphrases',
+            'cicd-passphrase.yaml')
+        with open(path, 'a') as f:
+            f.write('# changed\n')
+        assert lint._verify_file_contents() == expected
+        mock_verify.assert_called_once_with(path, mock.ANY)
+
+
+def test_verify_deckhand_render_skips_unchanged_sites(temp_deployment_files):
+    with mock.patch('pegleg.engine.util.deckhand.deckhand_render',
+                    autospec=True) as mock_render:
+        mock_render.return_value = (None, [('P005', 'render error')])
+        assert lint._verify_deckhand_render() == [('P005', 'render error')]
+        assert mock_render.call_count == 2
+
+        # Nothing changed: both sites are skipped.
+        assert lint._verify_deckhand_render() == [('P005', 'render error')]
+        assert lint._verify_deckhand_render(sitename='lab') == [
+            ('P005', 'render error')
+        ]
+        assert mock_render.call_count == 2
+
+        # A change to the lab site only re-renders lab.
+        path = os.path.join(
+            config.get_site_repo(), 'site', 'lab', 'software', 'charts',
+            'lab-chart.yaml')
+        with open(path, 'a') as f:
+            f.write('# changed\n')
+        lint._verify_deckhand_render()
+        assert mock_render.call_count == 3
+        # Global files are inputs to every site.
+        path = os.path.join(
+            config.get_site_repo(), 'global', 'common', 'global-common.yaml')
+        with open(path, 'a') as f:
+            f.write('# changed\n')
+        lint._verify_deckhand_render()
+        assert mock_render.call_count == 5
+
+
+def test_lint_site_at_revision(tmpdir, temp_deployment_files):
+    path = config.get_site_repo()
+    repo = Repo.init(path)
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'Test')
+        writer.set_value('user', 'email', 'test@example.com')
+    repo.git.add(all=True)
+    repo.index.commit('initial')
+    warn_lint = [
+        FILE_MISSING_YAML_DOCUMENT_HEADER, SCHEMA_STORAGE_POLICY_MISMATCH_FLAG,
+        SECRET_NOT_ENCRYPTED_POLICY
+    ]
+    assert lint._lint_store().enabled
+
+    with mock.patch('pegleg.engine.util.deckhand.deckhand_render',
+                    autospec=True) as mock_render:
+        mock_render.return_value = (None, [])
+        checked_out = lint.site('cicd', warn_lint=warn_lint)
+        assert mock_render.call_count == 1
+
+        # Files at a revision don't exist on disk: they are fingerprinted
+        # by their blob SHA, and render results are recorded against them.
+        virtual = str(tmpdir.join('virtual', 'deployment_files'))
+        revision.register(virtual, path, repo.active_branch.name)
+        config.set_site_repo(virtual)
+        for call_count in (2, 2):
+            at_revision = lint.site('cicd', warn_lint=warn_lint)
+            assert len(at_revision) == len(checked_out)
+            assert mock_render.call_count == call_count
+
+
+def test_lint_only_given_sites(temp_deployment_files):
+    assert lint._verify_file_contents(
+        sitenames=['lab']) == (lint._verify_file_contents(sitename='lab'))
+    with mock.patch.object(definition, 'site_files',
+                           wraps=definition.site_files) as mock_files:
+        lint._verify_file_contents(sitenames=[])
+        mock_files.assert_not_called()
+
+    with mock.patch('pegleg.engine.util.deckhand.deckhand_render',
+                    autospec=True) as mock_render:
+        mock_render.return_value = (None, [])
+        assert lint._verify_deckhand_render(sitenames=[]) == []
+        mock_render.assert_not_called()
+        lint._verify_deckhand_render(sitenames=['lab'])
+        assert mock_render.call_count == 1
+
+
+def test_verify_deckhand_render_collects_site_timings(temp_deployment_files):
+    timings = []
+    with mock.patch('pegleg.engine.util.deckhand.deckhand_render',
+                    autospec=True) as mock_render:
+        mock_render.return_value = (None, [('P005', 'render error')])
+        lint._verify_deckhand_render(timings=timings)
+        # Unchanged sites are reused from the lint store.
+        lint._verify_deckhand_render(sitenames=['lab'], timings=timings)
+
+    assert [(name, errors) for name, errors, _ in timings] == [
+        ('cicd', 1), ('lab', 1), ('lab', 1)
+    ]
+    assert timings[-1][2] == 0.0
+    table = lint.format_site_timings(timings)
+    assert 'render_errors' in table
+    assert 'cicd' in table
+
+
 def _deckhand_render_exception_msg(errors):
     """
     Helper function to create deckhand render exception msg.
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+import json
 import os
 from os import listdir
 from unittest import mock
@@ -22,6 +24,7 @@ import yaml
 from pegleg import config
 from pegleg.engine.catalog.pki_generator import PKIGenerator
 from pegleg.engine.catalog import pki_utility
+from pegleg.engine.common import managed_document
 from pegleg.engine import exceptions
 from pegleg.engine import secrets
 from pegleg.engine.util import encryption as crypt, git
@@ -181,6 +184,46 @@ data: {0}-password
         decrypted[encrypted_path]) == yaml.safe_load(passphrase_doc)
 
 
+@mock.patch.dict(
+    os.environ, {
+        'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
+        'PEGLEG_SALT': 'MySecretSalt1234567890]['
+    })
+def test_secret_encrypt_and_decrypt_concurrently(
+        temp_deployment_files, tmpdir):
+    passphrases_dir = tmpdir.join(
+        "deployment_files", "site", "cicd", "secrets", "passphrases")
+    passphrase_docs = {}
+    for i in range(4):
+        name = "cicd-passphrase-encrypted-%d" % i
+        passphrase_docs[name] = {
+            'schema': 'deckhand/Passphrase/v1',
+            'metadata': {
+                'schema': 'metadata/Document/v1',
+                'name': name,
+                'storagePolicy': 'encrypted',
+                'layeringDefinition': {
+                    'abstract': False,
+                    'layer': 'site'
+                }
+            },
+            'data': '%s-password' % name
+        }
+        files.write(
+            passphrase_docs[name], str(passphrases_dir.join(name + '.yaml')))
+    save_location = tmpdir.mkdir("encrypted_files")
+
+    secrets.encrypt(str(save_location), "pytest", "cicd", jobs=2)
+
+    encrypted_dir = str(save_location.join("site/cicd/secrets/passphrases"))
+    assert not [f for f in listdir(encrypted_dir) if f.startswith('.tmp-')]
+    decrypted = secrets.decrypt(encrypted_dir, jobs=2)
+    assert decrypted == secrets.decrypt(encrypted_dir)
+    for name, doc in passphrase_docs.items():
+        path = os.path.join(encrypted_dir, name + '.yaml')
+        assert yaml.safe_load(decrypted[path]) == doc
+
+
 @mock.patch.dict(
     os.environ, {
         'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
@@ -301,6 +344,36 @@ def test_encrypt_decrypt_using_docs(tmpdir):
         'metadata']['storagePolicy']
 
 
+@mock.patch.dict(
+    os.environ, {
+        'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
+        'PEGLEG_SALT': 'MySecretSalt1234567890]['
+    })
+def test_decrypt_leaves_documents_untouched(tmpdir):
+    cleartext = list(yaml.safe_load_all(TEST_DATA))
+    save_path = os.path.join(tmpdir, 'encrypted_secrets_file.yaml')
+    PeglegSecretManagement(docs=cleartext).encrypt_secrets(save_path)
+    encrypted = files.read(save_path)
+    encrypted_copy = copy.deepcopy(encrypted)
+    plain = {
+        'schema': 'deckhand/Plain/v1',
+        'metadata': {
+            'name': 'plain'
+        },
+        'data': 'plain'
+    }
+
+    with mock.patch.object(PeglegManagedSecretsDocument,
+                           '__init__') as mock_wrap:
+        decrypted_data = PeglegSecretManagement(
+            docs=[plain] + encrypted).get_decrypted_secrets()
+
+    mock_wrap.assert_not_called()
+    assert decrypted_data[0] is plain
+    assert decrypted_data[1]['data'] == cleartext[0]['data']
+    assert encrypted == encrypted_copy
+
+
 @pytest.mark.skipif(
     not pki_utility.PKIUtility.cfssl_exists(),
     reason='cfssl must be installed to execute these tests')
@@ -484,3 +557,77 @@ def test_global_encrypt_decrypt(temp_deployment_files, tmpdir):
     test_data = list(yaml.safe_load_all(TEST_GLOBAL_DATA))
     assert test_data[0]['data'] == decrypted_data[0]['data']
     assert test_data[0]['schema'] == decrypted_data[0]['schema']
+
+
+def _write_certificates(site, name, expiry):
+    """Write an encrypted CA and certificate expiring after ``expiry``."""
+    pki_util = pki_utility.PKIUtility(duration=365, backend='cryptography')
+    ca_config = json.loads(pki_util.ca_config)
+    ca_config['signing']['default']['expiry'] = expiry
+    with mock.patch.object(pki_utility.PKIUtility, 'ca_config',
+                           new_callable=mock.PropertyMock,
+                           return_value=json.dumps(ca_config)), \
+            mock.patch.object(managed_document, '_get_repo_url_and_rev',
+                              return_value=('fake://nothing.git', 'master')):
+        ca_cert, ca_key = pki_util.generate_ca(name + '-ca')
+        cert, _ = pki_util.generate_certificate(
+            name,
+            ca_cert=ca_cert['data']['managedDocument']['data'],
+            ca_key=ca_key['data']['managedDocument']['data'],
+            cn=name)
+    documents = []
+    for document in (ca_cert, cert):
+        document['data']['managedDocument']['metadata']['storagePolicy'] = \
+            'encrypted'
+        documents.append(
+            PeglegSecretManagement(
+                docs=[document]).get_encrypted_secrets()[0][0])
+    path = os.path.join(
+        config.get_site_repo(), 'site', site, 'secrets', 'certificates',
+        '%s_certificate.yaml' % name)
+    files.write(documents, path)
+    return path
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@mock.patch.dict(
+    os.environ, {
+        'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
+        'PEGLEG_SALT': 'MySecretSalt1234567890]['
+    })
+def test_check_repo_cert_expiry(temp_deployment_files, jobs):
+    """Validates scanning the certificates of all sites in one pass."""
+    config.set_passphrase()
+    config.set_salt()
+    expiring = _write_certificates('cicd', 'expiring', '1h')
+    valid = _write_certificates('lab', 'valid', '8760h')
+    global_creds = (config.get_global_passphrase(), config.get_global_salt())
+
+    expired, report = secrets.check_repo_cert_expiry(
+        duration=1, jobs=jobs, output_format='json')
+
+    # Scanning, even in-process, leaves the global credentials alone.
+    assert (
+        config.get_global_passphrase(),
+        config.get_global_salt()) == global_creds
+    assert expired
+    report = json.loads(report)
+    assert report['days'] == 1
+    assert report['expiring'] == 1
+    assert [
+        (c['site'], c['file'], c['cert_name'], c['expired'])
+        for c in report['certificates']
+    ] == [
+        ('cicd', expiring, 'expiring-ca', False),
+        ('cicd', expiring, 'expiring', True),
+        ('lab', valid, 'valid-ca', False),
+        ('lab', valid, 'valid', False),
+    ]
+
+    expired, table = secrets.check_repo_cert_expiry(duration=1, jobs=jobs)
+    assert expired
+    assert 'expiring' in table and 'valid' not in table
+
+    expired, table = secrets.check_cert_expiry('lab', duration=1, jobs=jobs)
+    assert not expired
+    assert 'site' not in table
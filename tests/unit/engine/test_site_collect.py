@@ -12,15 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import io
 import os
 import shutil
-import yaml
 from unittest import mock
 
-import click
+from git import Repo
+import yaml
 
+from pegleg import config
 from pegleg.engine import site
 from pegleg.engine.util import deckhand
+from pegleg.engine.util import revision
+from pegleg.engine.util import session
 
 
 def _site_definition(site_name):
@@ -89,23 +93,75 @@ def test_site_collect_to_file(tmpdir, temp_deployment_files):
     _test_site_collect_to_file(tmpdir, "lab", "lab_path")
 
 
-def _test_site_collect_to_stdout(site_name):
+def _test_site_collect_to_stdout(capfd, site_name):
     # 2nd arg of None will force redirection to stdout.
-    with mock.patch.object(click, 'echo') as mock_echo:
-        site.collect(site_name, None)
+    site.collect(site_name, None)
 
     expected_names = _expected_document_names(site_name)
-    all_lines = [x[1][0].strip() for x in mock_echo.mock_calls]
-
-    assert all_lines, "Nothing written to stdout"
-    assert any("pegleg/DeploymentData/v1" in line for line in all_lines)
-    for expected in expected_names:
-        assert 'name: {}'.format(expected) in all_lines
-
-
-def test_site_collect_to_stdout(temp_deployment_files):
-    _test_site_collect_to_stdout("cicd")
-    _test_site_collect_to_stdout("lab")
+    out = capfd.readouterr().out
+
+    assert out, "Nothing written to stdout"
+    assert "pegleg/DeploymentData/v1" in out
+    deployment_documents = list(yaml.safe_load_all(out))
+    assert sorted(expected_names) == sorted(
+        [x['metadata']['name'] for x in deployment_documents])
+
+
+def test_site_collect_to_stdout(capfd, temp_deployment_files):
+    _test_site_collect_to_stdout(capfd, "cicd")
+    _test_site_collect_to_stdout(capfd, "lab")
+
+
+def test_site_collect_at_revision(tmpdir, temp_deployment_files):
+    path = config.get_site_repo()
+    repo = Repo.init(path)
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'Test')
+        writer.set_value('user', 'email', 'test@example.com')
+    repo.git.add(all=True)
+    repo.index.commit('initial')
+    checked_out = tmpdir.mkdir('checked_out')
+    site.collect('cicd', str(checked_out))
+
+    # Changes to the working tree are not part of the revision.
+    with open(os.path.join(path, 'global', 'common', 'global-common.yaml'),
+              'a') as f:
+        f.write('# changed\n')
+    virtual = str(tmpdir.join('virtual', 'deployment_files'))
+    revision.register(virtual, path, repo.active_branch.name)
+    config.set_site_repo(virtual)
+    at_revision = tmpdir.mkdir('at_revision')
+    site.collect('cicd', str(at_revision))
+
+    expected = checked_out.join('deployment_files.yaml').read()
+    assert at_revision.join('deployment_files.yaml').read() == expected
+
+
+def test_deployment_data_stanza(temp_deployment_files):
+    path = config.get_site_repo()
+    repo = Repo.init(path)
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'Test')
+        writer.set_value('user', 'email', 'test@example.com')
+    repo.git.add(all=True)
+    commit = repo.index.commit('initial')
+    repo.create_tag('v1.0', message='release')
+
+    with mock.patch.object(site.util.git, 'tags_by_commit',
+                           wraps=site.util.git.tags_by_commit) as m_tags:
+        with session.session():
+            stanzas = [
+                site._get_repo_deployment_data_stanza(path) for _ in range(2)
+            ]
+
+    assert stanzas == [
+        {
+            'commit': commit.hexsha,
+            'tag': 'v1.0',
+            'dirty': False
+        }
+    ] * 2
+    assert m_tags.call_count == 1
 
 
 def test_read_and_format_yaml(tmpdir):
@@ -126,3 +182,28 @@ def test_read_and_format_yaml(tmpdir):
     output = list(site._read_and_format_yaml(str(tempfile)))
     expected = ['---\n', 'foo:bar\n', '...\n']
     assert expected == output
+
+
+def test_write_document_file(tmpdir):
+    cases = [
+        (b"---\nfoo: bar\n...\n", b"---\nfoo: bar\n...\n"),
+        (b"foo: bar\n", b"---\nfoo: bar\n...\n"),
+        (b"foo: bar", b"---\nfoo: bar\n...\n"),
+        (b"---\nfoo: bar\n...", b"---\nfoo: bar\n...\n"),
+        (b"...", b"---\n...\n"),
+        (b"---\na: 1\n---\nb: 2\n", b"---\na: 1\n---\nb: 2\n...\n"),
+        (b"---\r\nfoo: bar\r\n...\r\n", b"---\nfoo: bar\n...\n"),
+        (b"", b"---\n...\n"),
+    ]
+    for i, (content, expected) in enumerate(cases):
+        source = tmpdir.join("source-%d.yaml" % i)
+        source.write_binary(content)
+        # Real files take the kernel copy path, in-memory streams do not.
+        target = tmpdir.join("target-%d.yaml" % i)
+        with open(str(target), 'wb') as f:
+            f.write(b"# header\n")
+            site._write_document_file(str(source), f)
+        assert target.read_binary() == b"# header\n" + expected
+        buffer = io.BytesIO()
+        site._write_document_file(str(source), buffer)
+        assert buffer.getvalue() == expected
@@ -13,9 +13,12 @@
 # limitations under the License.
 
 import os
+import threading
+import time
 from unittest import mock
 
 import click
+from git import Repo
 import pytest
 
 from pegleg import config
@@ -150,7 +153,8 @@ def _test_process_repositories(
                     mock.call(r['url'], ref=r['revision'], auth_key=None)
                     for r in FORMATTED_REPOSITORIES['repositories'].values()
                 ])
-            m_clone_repo.assert_has_calls(mock_calls)
+            # Extra repositories are processed concurrently, in any order.
+            m_clone_repo.assert_has_calls(mock_calls, any_order=True)
         elif repo_username:
             # Validate that the REPO_USERNAME placeholder is replaced by
             # repo_username.
@@ -161,7 +165,8 @@ def _test_process_repositories(
                         ref=r['revision'],
                         auth_key=None)
                     for r in FORMATTED_REPOSITORIES['repositories'].values()
-                ])
+                ],
+                any_order=True)
         elif repo_overrides:
             # This is computed from: len(cloned extra repos) +
             # len(cloned primary repo), which is len(cloned extra repos) + 1
@@ -183,7 +188,8 @@ def _test_process_repositories(
                 [
                     mock.call(r['url'], ref=r['revision'], auth_key=None)
                     for r in FORMATTED_REPOSITORIES['repositories'].values()
-                ])
+                ],
+                any_order=True)
 
     if site_repo:
         # Set a test site repo, call the test and clean up.
@@ -254,6 +260,93 @@ def test_process_repositories_with_local_site_path_exists_not_repo(*_):
     assert "The repository path or URL is invalid" in str(exc.value)
 
 
+@mock.patch.object(
+    util.definition,
+    'load_as_params',
+    autospec=True,
+    return_value=TEST_REPOSITORIES)
+@mock.patch.object(util.git, 'is_repository', autospec=True, return_value=True)
+def test_process_repositories_concurrently_in_deterministic_order(*_):
+    started = threading.Barrier(2, timeout=10)
+
+    def handle_repository(repo_url, *args, **kwargs):
+        if 'site' not in repo_url:
+            # Both extra repos must be in progress at the same time, and the
+            # first one finishes last.
+            started.wait()
+            if 'security' not in repo_url:
+                time.sleep(0.1)
+        return _repo_name(repo_url)
+
+    with mock.patch.object(repository, '_handle_repository',
+                           side_effect=handle_repository):
+        with mock.patch.object(config, 'get_site_repo',
+                               return_value='ssh://gerrit/site-manifests'):
+            repository.process_repositories('test_site')
+
+    assert config.get_extra_repo_list() == [
+        'aic-clcp-manifests/', 'aic-clcp-security-manifests/'
+    ]
+
+
+@mock.patch.object(
+    util.definition,
+    'load_as_params',
+    autospec=True,
+    return_value=TEST_REPOSITORIES)
+@mock.patch.object(util.git, 'is_repository', autospec=True, return_value=True)
+def test_process_repositories_aggregates_errors(*_):
+    def handle_repository(repo_url, *args, **kwargs):
+        if 'site' in repo_url:
+            return 'site-manifests'
+        raise click.ClickException('unreachable %s' % _repo_name(repo_url))
+
+    with mock.patch.object(repository, '_handle_repository',
+                           side_effect=handle_repository):
+        with mock.patch.object(config, 'get_site_repo',
+                               return_value='ssh://gerrit/site-manifests'):
+            with pytest.raises(click.ClickException) as exc:
+                repository.process_repositories('test_site')
+
+    message = exc.value.format_message()
+    assert 'Failed to process 2 repositories' in message
+    assert 'global (' in message and 'unreachable aic-clcp-manifests' in message
+    assert 'secrets (' in message
+    assert 'unreachable aic-clcp-security-manifests' in message
+
+
+@mock.patch.object(
+    util.definition,
+    'load_as_params',
+    autospec=True,
+    return_value=dict(TEST_REPOSITORIES, site_type='foundry'))
+@mock.patch.object(util.git, 'is_repository', autospec=True, return_value=True)
+def test_process_repositories_sparse_paths(*_):
+    config.set_clone_mode('sparse')
+    sparse_paths = {}
+
+    def handle_repository(repo_url, *args, **kwargs):
+        sparse_paths[_repo_name(repo_url)] = kwargs.get('sparse_paths')
+        return _repo_name(repo_url)
+
+    with mock.patch.object(repository, '_handle_repository',
+                           side_effect=handle_repository):
+        with mock.patch.object(config, 'get_site_repo',
+                               return_value='ssh://gerrit/site-manifests'):
+            repository.process_repositories('test_site')
+
+    # The site type is only known once the site repository is cloned.
+    assert sparse_paths['site-manifests'] == [
+        'global', 'type', 'site/test_site'
+    ]
+    assert sparse_paths['aic-clcp-manifests'] == [
+        'global', 'type/foundry', 'site/test_site'
+    ]
+    assert sparse_paths['aic-clcp-security-manifests'] == [
+        'global', 'type/foundry', 'site/test_site'
+    ]
+
+
 def test_process_repositories_with_repo_username():
     _test_process_repositories(repo_username='test_username')
 
@@ -516,6 +609,27 @@ def test_process_site_repository(_):
         expected='ssh://foo@opendev.org/airship/treasuremap:12345')
 
 
+def test_process_site_repository_without_checkout(tmpdir):
+    path = str(tmpdir.mkdir('repo'))
+    repo = Repo.init(path)
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'Test')
+        writer.set_value('user', 'email', 'test@example.com')
+    os.makedirs(os.path.join(path, 'site', 'cicd'))
+    with open(os.path.join(path, 'site', 'cicd', 'a.yaml'), 'w') as f:
+        f.write('---\n')
+    repo.git.add(all=True)
+    commit = repo.index.commit('initial')
+    config.set_site_repo('%s@%s' % (path, commit.hexsha))
+    config.set_checkout(False)
+
+    site_repo = repository.process_site_repository(update_config=True)
+
+    assert not os.path.exists(site_repo)
+    assert list(util.files.list_sites()) == ['cicd']
+    assert not repo.is_dirty() and repo.head.commit == commit
+
+
 def test_format_url_with_repo_username():
     TEST_URL = 'ssh://REPO_USERNAME@gerrit:29418/airship/pegleg'
 
@@ -0,0 +1,206 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import stat
+import time
+
+import yaml
+
+from pegleg import config
+from pegleg.engine.util import cache
+from pegleg.engine.util import encryption
+from pegleg.engine.util import files
+
+
+def test_digest_separates_parts():
+    assert cache.digest('ab', 'c') != cache.digest('a', 'bc')
+    assert cache.digest('abc') == cache.digest(b'abc')
+
+
+def test_get_set_round_trip():
+    c = cache.DiskCache('test')
+    key = cache.digest('round-trip')
+    assert c.get(key) is None
+    c.set(key, [{'a': 1}])
+    assert c.get(key) == [{'a': 1}]
+    assert (c.hits, c.misses, c.writes) == (1, 1, 1)
+
+
+def test_corrupt_entry_is_a_miss():
+    c = cache.DiskCache('test')
+    key = cache.digest('corrupt')
+    c.set(key, 'value')
+    entry = c._entry_path(key)
+    with open(entry, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b'X')
+    assert c.get(key, 'default') == 'default'
+    assert c.misses == 1
+
+
+def test_entry_for_other_key_is_a_miss():
+    c = cache.DiskCache('test')
+    key, other = cache.digest('key'), cache.digest('other')
+    c.set(other, 'value')
+    os.makedirs(os.path.dirname(c._entry_path(key)), exist_ok=True)
+    os.replace(c._entry_path(other), c._entry_path(key))
+    assert c.get(key) is None
+
+
+def test_disabled_cache_is_bypassed():
+    config.set_cache_enabled(False)
+    c = cache.DiskCache('test')
+    key = cache.digest('disabled')
+    c.set(key, 'value')
+    assert c.get(key) is None
+    assert not os.path.exists(c.path)
+
+
+def test_prune_evicts_least_recently_used():
+    c = cache.DiskCache('test')
+    keys = [cache.digest(str(i)) for i in range(3)]
+    for i, key in enumerate(keys):
+        c.set(key, 'x' * 1000)
+        past = time.time() - 100 + i
+        os.utime(c._entry_path(key), (past, past))
+    # Reading the oldest entry makes it the most recently used.
+    assert c.get(keys[0]) is not None
+
+    c.prune(max_size=c.size() - 1)
+
+    assert os.path.exists(c._entry_path(keys[0]))
+    assert not os.path.exists(c._entry_path(keys[1]))
+    assert os.path.exists(c._entry_path(keys[2]))
+
+
+def test_files_read_uses_cache(temp_deployment_files):
+    path = os.path.join(
+        config.get_site_repo(), 'site', 'cicd', 'secrets', 'passphrases',
+        'cicd-passphrase.yaml')
+    read_cache = files._READ_CACHE
+    hits, misses = read_cache.hits, read_cache.misses
+
+    first = files.read(path)
+    second = files.read(path)
+
+    assert first == second
+    assert read_cache.misses == misses + 1
+    assert read_cache.hits == hits + 1
+
+    # Changing the content must never return the stale document list.
+    with open(path, 'a') as f:
+        f.write(
+            '---\nschema: deckhand/Passphrase/v1\n'
+            'metadata: {schema: metadata/Document/v1, name: extra}\n'
+            'data: extra\n')
+    assert len(files.read(path)) == len(first) + 1
+
+
+def test_namespaces_usage_and_clear():
+    assert cache.namespaces() == []
+    c = cache.DiskCache('test')
+    c.set(cache.digest('a'), 'a')
+    c.set(cache.digest('b'), 'b')
+
+    assert cache.namespaces() == ['test']
+    entries, size = c.usage()
+    assert entries == 2
+    assert size == c.size() > 0
+
+    c.clear()
+    assert c.usage() == (0, 0)
+
+
+def test_default_cache_dir_is_per_user(tmpdir, monkeypatch):
+    config.set_cache_dir(None)
+    config.set_clone_path(str(tmpdir.join('clones')))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir.join('xdg')))
+
+    assert config.get_cache_dir() == str(tmpdir.join('xdg', 'pegleg'))
+
+    c = cache.DiskCache('test')
+    c.set(cache.digest('private'), 'value')
+    for path in (config.get_cache_dir(), c.path):
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+
+
+def test_shared_cache_dir_is_ignored(tmpdir):
+    cache_dir = str(tmpdir.join('shared'))
+    config.set_cache_dir(cache_dir)
+    c = cache.DiskCache('test')
+    key = cache.digest('shared')
+    c.set(key, 'value')
+    assert c.get(key) == 'value'
+
+    # Entries must not be loaded from, or written to, a directory that
+    # other users could have planted them in.
+    cache._PRIVATE_DIRS.clear()
+    os.chmod(cache_dir, 0o777)
+    assert c.get(key) is None
+    c.set(cache.digest('other'), 'value')
+    assert not os.path.exists(c._entry_path(cache.digest('other')))
+
+    os.chmod(cache_dir, 0o700)
+    os.chmod(c.path, 0o770)
+    assert c.get(key) is None
+
+
+def test_writable_cache_entry_is_ignored():
+    c = cache.DiskCache('test')
+    key = cache.digest('writable')
+    c.set(key, 'value')
+    os.chmod(c._entry_path(key), 0o666)
+    assert c.get(key) is None
+
+
+def test_files_read_never_caches_cleartext_secrets(tmpdir):
+    secret = {
+        'schema': 'deckhand/Passphrase/v1',
+        'metadata': {
+            'schema': 'metadata/Document/v1',
+            'name': 'passphrase',
+            'storagePolicy': 'encrypted',
+            'layeringDefinition': {
+                'abstract': False,
+                'layer': 'site'
+            }
+        },
+        'data': 'cleartext-passphrase'
+    }
+    path = tmpdir.join('passphrase.yaml')
+    read_cache = files._READ_CACHE
+    writes = read_cache.writes
+
+    # Secrets decrypted in place are not cached, ciphertext is.
+    path.write(yaml.safe_dump(secret, explicit_start=True))
+    assert files.read(str(path)) == [secret]
+    assert read_cache.writes == writes
+    ciphertext = encryption.encrypt(b'secret', b'p' * 32, b's' * 16)
+    encrypted = dict(secret, data=ciphertext.decode())
+    path.write(yaml.safe_dump(encrypted, explicit_start=True))
+    assert files.read(str(path)) == [encrypted]
+    assert read_cache.writes == writes + 1
+
+    # Nothing is cached once repositories have been decrypted.
+    config.set_decrypt_repos(True)
+    cleartext = dict(secret)
+    cleartext['metadata'] = dict(secret['metadata'], storagePolicy='cleartext')
+    path.write(yaml.safe_dump(cleartext, explicit_start=True))
+    assert files.read(str(path)) == [cleartext]
+    assert read_cache.writes == writes + 1
+
+    for _, _, entry in read_cache._entries():
+        with open(entry, 'rb') as f:
+            assert b'cleartext-passphrase' not in f.read()
@@ -0,0 +1,127 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from unittest import mock
+
+from pegleg import config
+from pegleg.engine.util import deckhand
+from pegleg.engine.util import session
+
+DOCUMENTS = [
+    {
+        'schema': 'deckhand/Passphrase/v1',
+        'metadata': {
+            'schema': 'metadata/Document/v1',
+            'name': 'passphrase',
+            'layeringDefinition': {
+                'abstract': False,
+                'layer': 'site'
+            },
+            'storagePolicy': 'cleartext'
+        },
+        'data': 'password'
+    }
+]
+
+
+def test_render_fingerprint_is_canonical():
+    reordered = [
+        OrderedDict(
+            [
+                ('data', 'password'),
+                ('metadata', DOCUMENTS[0]['metadata']),
+                ('schema', 'deckhand/Passphrase/v1'),
+            ])
+    ]
+    changed = [dict(DOCUMENTS[0], data='other')]
+    with_bytes = [dict(DOCUMENTS[0], data=b'password')]
+
+    fingerprint = deckhand.render_fingerprint(DOCUMENTS, False, True)
+    assert fingerprint == deckhand.render_fingerprint(reordered, False, True)
+    assert fingerprint != deckhand.render_fingerprint(changed, False, True)
+    assert fingerprint != deckhand.render_fingerprint(with_bytes, False, True)
+    assert fingerprint != deckhand.render_fingerprint(DOCUMENTS, True, True)
+    assert fingerprint != deckhand.render_fingerprint(DOCUMENTS, False, False)
+
+
+@mock.patch.object(deckhand, 'document_validation', autospec=True)
+@mock.patch.object(deckhand, 'layering', autospec=True)
+def test_deckhand_render_reuses_cached_results(mock_layering, *args):
+    mock_layering.DocumentLayering.return_value.render.return_value = (
+        DOCUMENTS)
+
+    first = deckhand.deckhand_render(documents=DOCUMENTS, validate=False)
+    second = deckhand.deckhand_render(documents=DOCUMENTS, validate=False)
+
+    assert first == second == (DOCUMENTS, [])
+    assert mock_layering.DocumentLayering.call_count == 1
+
+    # Different flags are a different render.
+    deckhand.deckhand_render(
+        documents=DOCUMENTS, validate=False, fail_on_missing_sub_src=True)
+    assert mock_layering.DocumentLayering.call_count == 2
+
+
+@mock.patch.object(deckhand, 'document_validation', autospec=True)
+@mock.patch.object(deckhand, 'layering', autospec=True)
+def test_deckhand_render_without_cache(mock_layering, *args):
+    config.set_cache_enabled(False)
+    mock_layering.DocumentLayering.return_value.render.return_value = (
+        DOCUMENTS)
+
+    deckhand.deckhand_render(documents=DOCUMENTS, validate=False)
+    deckhand.deckhand_render(documents=DOCUMENTS, validate=False)
+
+    assert mock_layering.DocumentLayering.call_count == 2
+
+
+@mock.patch.object(deckhand, 'document_validation', autospec=True)
+@mock.patch.object(deckhand, 'layering', autospec=True)
+def test_deckhand_render_once_per_session(mock_layering, *args):
+    config.set_cache_enabled(False)
+    mock_layering.DocumentLayering.return_value.render.return_value = (
+        DOCUMENTS)
+
+    with session.session():
+        first, _ = deckhand.deckhand_render(
+            documents=DOCUMENTS, validate=False)
+        # Extending the returned documents must not affect later renders.
+        first.append({})
+        second, _ = deckhand.deckhand_render(
+            documents=DOCUMENTS, validate=False)
+
+    assert second == DOCUMENTS
+    assert mock_layering.DocumentLayering.call_count == 1
+
+
+@mock.patch.object(deckhand, 'document_validation', autospec=True)
+@mock.patch.object(deckhand, 'layering', autospec=True)
+def test_deckhand_render_never_caches_cleartext_secrets(mock_layering, *args):
+    secret = dict(
+        DOCUMENTS[0],
+        metadata=dict(DOCUMENTS[0]['metadata'], storagePolicy='encrypted'),
+        data='cleartext-passphrase')
+    mock_layering.DocumentLayering.return_value.render.return_value = [secret]
+    render_cache = deckhand._RENDER_CACHE
+
+    # A decrypted secret, or decrypted repositories, keep renders in memory.
+    with session.session():
+        deckhand.deckhand_render(documents=[secret], validate=False)
+        deckhand.deckhand_render(documents=[secret], validate=False)
+    config.set_decrypt_repos(True)
+    deckhand.deckhand_render(documents=DOCUMENTS, validate=False)
+
+    assert mock_layering.DocumentLayering.call_count == 2
+    assert render_cache.usage() == (0, 0)
@@ -11,9 +11,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import collections
+from unittest import mock
+
 from pytest import mark
 
 from pegleg.engine.util import definition
+from pegleg.engine.util import files
 
 
 class TestSiteDefinitionHelpers(object):
@@ -67,3 +71,33 @@ class TestSiteDefinitionHelpers(object):
         assert (
             sorted(lab_documents, key=sort_func) == sorted(
                 documents_by_site["lab"], key=sort_func))
+
+    def test_documents_for_each_site_parses_shared_files_once(
+            self, temp_deployment_files):
+        with mock.patch.object(files, 'read', wraps=files.read) as mock_read:
+            documents_by_site = definition.documents_for_each_site()
+
+        read_counts = collections.Counter(
+            c[0][0] for c in mock_read.call_args_list)
+        # Global files are shared by both sites but only parsed once.
+        assert read_counts
+        assert set(read_counts.values()) == {1}
+        assert documents_by_site["cicd"][0] is documents_by_site["lab"][0]
+
+    def test_affected_sites(self, temp_deployment_files):
+        repo = temp_deployment_files.join('deployment_files')
+
+        def affected(*paths):
+            return definition.affected_sites(
+                str(repo.join(*p.split('/'))) for p in paths)
+
+        assert affected('global/common/global-common.yaml') == ['cicd', 'lab']
+        assert affected('type/lab/v1.0/new.yaml') == ['lab']
+        assert affected('site/cicd/site-definition.yaml') == ['cicd']
+        # Deleted files count as well, but files that are never searched and
+        # files outside of any site's directories do not.
+        assert affected('site/cicd/removed.yaml',
+                        'type/lab/x.yaml') == ['cicd', 'lab']
+        assert affected(
+            'global/README.md', 'global/tools/x.yaml', 'global/.hidden.yaml',
+            'type/other/x.yaml', 'docs/x.yaml') == []
@@ -13,12 +13,15 @@
 # limitations under the License.
 
 import os
+from unittest import mock
 
 import pytest
 import yaml
 
 from pegleg import config
 from pegleg.engine.util import files
+from pegleg.engine.util import pool
+from pegleg.engine.util import session
 
 EXPECTED_FILE_PERM = '0o640'
 EXPECTED_DIR_PERM = '0o750'
@@ -95,3 +98,68 @@ def test_read(tmpdir):
     read_files = files.read(os.path.join(tmpdir, "valid.yaml"))
     # Assert that the tag was not parsed into the method int
     assert int not in read_files
+
+
+def test_write_atomic(tmpdir):
+    path = str(tmpdir.join('secrets.yaml'))
+    files.write('old', path)
+    os.chmod(path, 0o640)
+
+    files.write({'a': 1}, path, atomic=True)
+
+    with open(path) as f:
+        assert yaml.safe_load(f) == {'a': 1}
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(str(tmpdir)) == ['secrets.yaml']
+
+    with pytest.raises(ValueError):
+        files.write(1, path, atomic=True)
+    with open(path) as f:
+        assert yaml.safe_load(f) == {'a': 1}
+    assert os.listdir(str(tmpdir)) == ['secrets.yaml']
+
+
+def test_read_many_matches_serial_order(temp_deployment_files):
+    paths = sorted(files.all())
+    expected = [files.read(path) for path in paths]
+    # Drop the cache entries written above so that every file is parsed
+    # again, by the workers.
+    files._READ_CACHE.clear()
+    config.set_parse_parallel_threshold(0)
+
+    assert files.read_many(paths, jobs=2) == expected
+
+
+def test_read_many_stays_in_process_below_threshold(temp_deployment_files):
+    paths = sorted(files.all())
+    config.set_parse_parallel_threshold(1024 * 1024)
+
+    with mock.patch.object(pool, 'parallel_map',
+                           wraps=pool.parallel_map) as mock_map:
+        documents = files.read_many(paths, jobs=4)
+
+    assert documents == [files.read(path) for path in paths]
+    assert mock_map.call_args[0][2] == 1
+
+
+def test_read_parses_each_file_once_per_session(temp_deployment_files):
+    config.set_cache_enabled(False)
+    path = sorted(files.all())[0]
+
+    with mock.patch.object(files, '_read', wraps=files._read) as mock_read:
+        with session.session():
+            first = files.read(path)
+            assert files.read(path) == first
+            assert files.read_many([path]) == [first]
+            assert mock_read.call_count == 1
+
+            # Files changed during the session are read again.
+            with open(path, 'a') as f:
+                f.write('\n')
+            files.read(path)
+            assert mock_read.call_count == 2
+
+        # Nothing is retained outside of a session.
+        files.read(path)
+        files.read(path)
+        assert mock_read.call_count == 4
@@ -0,0 +1,84 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from unittest import mock
+
+from pegleg import config
+from pegleg.engine.util import files
+from pegleg.engine.util import index
+
+
+def _make_tree(tmpdir):
+    root = tmpdir.mkdir('repo')
+    root.mkdir('global').mkdir('common').join('a.yaml').write('---\n')
+    root.join('global', 'b.yaml').write('---\n')
+    root.join('global').mkdir('.hidden').mkdir('sub').join('c.yaml').write(
+        '---\n')
+    root.join('global').mkdir('tools').join('d.yaml').write('---\n')
+    root.mkdir('outside').join('e.yaml').write('---\n')
+    os.symlink(str(root.join('outside')), str(root.join('global', 'linked')))
+    return str(root)
+
+
+def test_walk_matches_os_walk(tmpdir):
+    root = _make_tree(tmpdir)
+    assert list(index.walk(root)) == [
+        (path, tuple(dirs), tuple(filenames))
+        for path, dirs, filenames in os.walk(root)
+    ]
+
+
+def test_walk_prunes_before_listing(tmpdir):
+    root = _make_tree(tmpdir)
+    with mock.patch.object(index, '_scan', wraps=index._scan) as mock_scan:
+        walked = [
+            path for path, _, _ in index.walk(
+                root, skip_dir=lambda name: name.startswith('.'))
+        ]
+    scanned = [c[0][0] for c in mock_scan.call_args_list]
+    assert os.path.join(root, 'global', '.hidden') not in walked
+    assert not any('.hidden' in path for path in scanned)
+
+
+def test_listings_are_reused_until_invalidated(tmpdir):
+    root = _make_tree(tmpdir)
+    with mock.patch.object(index, '_scan', wraps=index._scan) as mock_scan:
+        list(index.walk(root))
+        calls = mock_scan.call_count
+        list(index.walk(root))
+        index.subdirectories(os.path.join(root, 'global'))
+        assert mock_scan.call_count == calls
+
+        index.invalidate()
+        list(index.walk(root))
+        assert mock_scan.call_count == 2 * calls
+
+
+def test_search_skips_hidden_tools_and_symlinked_dirs(tmpdir):
+    root = _make_tree(tmpdir)
+    config.set_site_repo(root)
+    found = sorted(
+        os.path.relpath(path, root)
+        for path in files.search(os.path.join(root, 'global')))
+    assert found == ['global/b.yaml', 'global/common/a.yaml']
+
+
+def test_written_files_are_visible_to_search(tmpdir):
+    root = _make_tree(tmpdir)
+    global_path = os.path.join(root, 'global')
+    before = set(files.search(global_path))
+    new_file = os.path.join(global_path, 'common', 'new.yaml')
+    files.write({'a': 'b'}, new_file)
+    assert set(files.search(global_path)) == before | {new_file}
@@ -0,0 +1,50 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from pegleg import config
+from pegleg.engine.util import pool
+
+
+def _site_repo_and_item(item):
+    return config.get_site_repo(), item, pool.in_worker()
+
+
+def test_chunks_are_ordered_and_complete():
+    items = list(range(10))
+    chunks = pool.chunks(items, 3)
+    assert len(chunks) == 3
+    assert [i for c in chunks for i in c] == items
+    assert pool.chunks([], 3) == []
+    assert pool.chunks([1], 3) == [[1]]
+
+
+def test_resolve_jobs():
+    assert pool.resolve_jobs(3) == 3
+    assert pool.resolve_jobs(0) >= 1
+
+
+def test_parallel_map_runs_in_process_for_one_job():
+    results = pool.parallel_map(_site_repo_and_item, [1, 2], jobs=1)
+    assert [in_worker for _, _, in_worker in results] == [False, False]
+
+
+def test_parallel_map_keeps_order_and_config():
+    config.set_site_repo('/tmp/pool-test-repo')
+    items = list(range(8))
+
+    results = pool.parallel_map(_site_repo_and_item, items, jobs=2)
+
+    assert [item for _, item, _ in results] == items
+    assert {repo for repo, _, _ in results} == {'/tmp/pool-test-repo/'}
+    assert all(in_worker for _, _, in_worker in results)
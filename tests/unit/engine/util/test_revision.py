@@ -0,0 +1,136 @@
+# Copyright 2019 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from unittest import mock
+
+from git import Repo
+import pytest
+
+from pegleg import config
+from pegleg.engine import exceptions
+from pegleg.engine.util import definition
+from pegleg.engine.util import files
+from pegleg.engine.util import index
+from pegleg.engine.util import revision
+from pegleg.engine.util import session
+
+
+def _init_repo(path):
+    repo = Repo.init(path)
+    with repo.config_writer() as writer:
+        writer.set_value('user', 'name', 'Test')
+        writer.set_value('user', 'email', 'test@example.com')
+    repo.git.add(all=True)
+    repo.index.commit('initial')
+    return repo
+
+
+def _passphrase_path(root, site):
+    return os.path.join(
+        root, 'site', site, 'secrets', 'passphrases',
+        '%s-passphrase.yaml' % site)
+
+
+def test_walk_matches_checkout(tmpdir):
+    root = tmpdir.mkdir('repo')
+    root.mkdir('global').mkdir('common').join('a.yaml').write('---\n')
+    root.join('global', 'b.yaml').write('---\n')
+    root.join('global').mkdir('tools').join('d.yaml').write('---\n')
+    root.mkdir('outside').join('e.yaml').write('---\n')
+    os.symlink(os.path.join('..', 'outside'), str(root.join('global', 'dir')))
+    os.symlink('b.yaml', str(root.join('global', 'file.yaml')))
+    _init_repo(str(root))
+    virtual = str(tmpdir.join('virtual', 'repo'))
+
+    revision.register(virtual, str(root), 'HEAD')
+
+    assert not os.path.exists(virtual)
+    walked = [
+        (os.path.relpath(path, virtual), sorted(dirs), sorted(names))
+        for path, dirs, names in index.walk(virtual)
+    ]
+    expected = [
+        (os.path.relpath(path, str(root)), sorted(dirs), sorted(names))
+        for path, dirs, names in os.walk(str(root))
+        if '.git' not in path.split(os.sep)
+    ]
+    expected[0][1].remove('.git')
+    assert sorted(walked) == sorted(expected)
+    link = os.path.join(virtual, 'global', 'file.yaml')
+    with files.open_document(link) as f:
+        assert f.read() == '---\n'
+
+
+def test_documents_are_read_at_revision(temp_deployment_files):
+    path = config.get_site_repo()
+    repo = _init_repo(path)
+    commit = repo.head.commit.hexsha
+    with open(_passphrase_path(path, 'cicd'), 'a') as f:
+        f.write(
+            '---\nschema: deckhand/Passphrase/v1\n'
+            'metadata: {schema: metadata/Document/v1, name: extra}\n'
+            'data: extra\n')
+    virtual = str(temp_deployment_files.join('virtual', 'deployment_files'))
+
+    revision.register(virtual, path, commit)
+    config.set_site_repo(virtual)
+
+    assert sorted(files.list_sites()) == ['cicd', 'lab']
+    assert definition.load_as_params('cicd') == {
+        'site_name': 'cicd',
+        'site_type': 'cicd'
+    }
+    names = [
+        d['metadata']['name'] for d in definition.documents_for_site('cicd')
+    ]
+    assert 'cicd-passphrase' in names
+    assert 'extra' not in names
+
+
+def test_unchanged_blobs_are_parsed_once(temp_deployment_files):
+    path = config.get_site_repo()
+    repo = _init_repo(path)
+    first = repo.head.commit.hexsha
+    with open(_passphrase_path(path, 'lab'), 'a') as f:
+        f.write('# changed\n')
+    repo.git.add(all=True)
+    second = repo.index.commit('second').hexsha
+    roots = [str(temp_deployment_files.join(c, 'repo')) for c in 'ab']
+    revision.register(roots[0], path, first)
+    revision.register(roots[1], path, second)
+    config.set_cache_enabled(False)
+
+    with mock.patch.object(files, '_parse', wraps=files._parse) as m_parse:
+        with session.session():
+            for root in roots:
+                for site in ('cicd', 'lab'):
+                    files.read(_passphrase_path(root, site))
+
+    parsed = [c[0][1] for c in m_parse.call_args_list]
+    assert parsed == [
+        _passphrase_path(roots[0], 'cicd'),
+        _passphrase_path(roots[0], 'lab'),
+        _passphrase_path(roots[1], 'lab'),
+    ]
+
+
+def test_register_unknown_ref(tmpdir):
+    root = tmpdir.mkdir('repo')
+    root.join('a.yaml').write('---\n')
+    _init_repo(str(root))
+
+    with pytest.raises(exceptions.GitInvalidRefException):
+        revision.register(str(tmpdir.join('virtual')), str(root), 'missing')
+    assert revision.lookup(str(tmpdir.join('virtual'))) is None
@@ -12,8 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 from collections import OrderedDict
+import gzip
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import os
+import threading
 from unittest import mock
 
 import pytest
@@ -108,6 +112,42 @@ class FakeResponse():
     code = 404
 
 
+class ShipyardStandIn(BaseHTTPRequestHandler):
+    """Records the configdocs posted to it, decoding chunked requests."""
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.received.append((self.path, self.headers, bytes(body)))
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def shipyard_endpoint():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ShipyardStandIn)
+    server.received = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, 'http://127.0.0.1:%d/api/v1.0' % server.server_port
+    server.shutdown()
+    server.server_close()
+
+
 def _get_context():
     ctx = context()
     ctx.obj = {}
@@ -171,10 +211,12 @@ def test_shipyard_helper_init_():
     assert isinstance(shipyard_helper.api_client, ShipyardClient)
 
 
+@pytest.mark.parametrize(
+    'compress,stream', [(False, True), (True, True), (True, False)])
 @mock.patch(
-    'pegleg.engine.util.files.collect_files_by_repo',
+    'pegleg.engine.util.files.iter_files_by_repo',
     autospec=True,
-    return_value=MULTI_REPO_DATA)
+    return_value=list(MULTI_REPO_DATA.items()))
 @mock.patch.object(
     ShipyardHelper,
     'formatted_response_handler',
@@ -185,39 +227,153 @@ def test_shipyard_helper_init_():
         'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
         'PEGLEG_SALT': 'MySecretSalt1234567890]['
     })
-def test_upload_documents(*args):
+def test_upload_documents(
+        mock_response_handler, mock_iter_files, shipyard_endpoint, compress,
+        stream):
     """ Tests upload document """
     # Scenario:
     #
     # 1) Get a dummy context Object
-    # 2) Mock external calls
-    # 3) Check documents uploaded to Shipyard with correct parameters
+    # 2) Point the Shipyard client at a local stand-in for Shipyard
+    # 3) Check documents were streamed to Shipyard with correct parameters
+
+    server, endpoint = shipyard_endpoint
+    context = _get_context()
+    with mock.patch('pegleg.engine.util.shipyard_helper.ShipyardClient',
+                    autospec=True) as mock_shipyard:
+        mock_api_client = mock_shipyard.return_value
+        mock_api_client.get_endpoint.return_value = endpoint
+        mock_api_client.get_token.return_value = 'token'
+        mock_api_client.commit_configdocs.return_value = 'Success'
+        ShipyardHelper(
+            context, 'replace', compress, stream=stream).upload_documents()
+
+        # Validate the documents were posted to the configdocs of the
+        # collection, in the requested buffer mode, in chunks if streamed.
+        expected_data = '---\n'.join(
+            [
+                _get_deployment_data_as_yaml(context.obj['site_name']),
+                _get_data_as_collection(MULTI_REPO_DATA)
+            ])
+        assert len(server.received) == 1
+        path, headers, body = server.received[0]
+        assert path == '/api/v1.0/configdocs/test-site?buffermode=replace'
+        if stream:
+            assert headers['Transfer-Encoding'] == 'chunked'
+        else:
+            assert headers['Content-Length'] == str(len(body))
+        assert headers['Content-Type'] == 'application/x-yaml'
+        assert headers['X-Auth-Token'] == 'token'
+        assert headers['X-Context-Marker'] == context.obj['context_marker']
+        if compress:
+            assert headers['Content-Encoding'] == 'gzip'
+            body = gzip.decompress(body)
+        else:
+            assert 'Content-Encoding' not in headers
+        assert body.decode('utf-8') == expected_data
+        mock_api_client.commit_configdocs.assert_called_once()
+
+
+@mock.patch(
+    'pegleg.engine.util.files.iter_files_by_repo',
+    autospec=True,
+    return_value=list(MULTI_REPO_DATA.items()))
+@mock.patch.object(
+    ShipyardHelper,
+    'formatted_response_handler',
+    autospec=True,
+    return_value=None)
+@mock.patch.dict(
+    os.environ, {
+        'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
+        'PEGLEG_SALT': 'MySecretSalt1234567890]['
+    })
+def test_upload_documents_through_client(*args):
+    """ Tests upload document through the Shipyard client by default """
+    # Scenario:
+    #
+    # 1) Get a dummy context Object
+    # 2) Mock the Shipyard client
+    # 3) Check the documents were posted at once with the client
 
     context = _get_context()
     with mock.patch('pegleg.engine.util.shipyard_helper.ShipyardClient',
                     autospec=True) as mock_shipyard:
         mock_api_client = mock_shipyard.return_value
-        mock_api_client.post_configdocs.return_value = 'Success'
-        result = ShipyardHelper(context, 'replace').upload_documents()
+        mock_api_client.get_endpoint.return_value = 'http://shipyard'
+        mock_api_client.post_configdocs.return_value = FakeResponse()
+        mock_api_client.post_configdocs.return_value.code = 201
+        mock_api_client.commit_configdocs.return_value = 'Success'
+        ShipyardHelper(context).upload_documents()
 
-        # Validate Shipyard call to post configdocs was invoked with correct
-        # collection name and buffer mode.
         expected_data = '---\n'.join(
             [
                 _get_deployment_data_as_yaml(context.obj['site_name']),
                 _get_data_as_collection(MULTI_REPO_DATA)
             ])
-        mock_api_client.post_configdocs.assert_called_with(
+        mock_api_client.post_configdocs.assert_called_once_with(
             collection_id='test-site',
             buffer_mode='replace',
             document_data=expected_data)
-        mock_api_client.post_configdocs.assert_called_once()
+        mock_api_client.commit_configdocs.assert_called_once()
 
 
 @mock.patch(
-    'pegleg.engine.util.files.collect_files_by_repo',
+    'pegleg.engine.util.files.iter_files_by_repo',
     autospec=True,
-    return_value=DATA)
+    return_value=list(MULTI_REPO_DATA.items()))
+@mock.patch.object(
+    ShipyardHelper,
+    'formatted_response_handler',
+    autospec=True,
+    return_value=None)
+@mock.patch.dict(
+    os.environ, {
+        'PEGLEG_PASSPHRASE': 'ytrr89erARAiPE34692iwUMvWqqBvC',
+        'PEGLEG_SALT': 'MySecretSalt1234567890]['
+    })
+def test_upload_documents_unchanged(
+        mock_response_handler, mock_iter_files, shipyard_endpoint):
+    """Tests unchanged documents are only uploaded when forced"""
+    # Scenario:
+    #
+    # 1) Upload the documents to a local stand-in for Shipyard
+    # 2) Check uploading the same documents again is skipped
+    # 3) Check changed documents, or forced uploads, are uploaded
+
+    server, endpoint = shipyard_endpoint
+    context = _get_context()
+    with mock.patch('pegleg.engine.util.shipyard_helper.ShipyardClient',
+                    autospec=True) as mock_shipyard:
+        mock_api_client = mock_shipyard.return_value
+        mock_api_client.get_endpoint.return_value = endpoint
+        mock_api_client.get_token.return_value = 'token'
+        mock_api_client.commit_configdocs.return_value = 'Success'
+
+        ShipyardHelper(context, stream=True).upload_documents()
+        size = len(server.received[0][2])
+        result = ShipyardHelper(context, stream=True).upload_documents()
+
+        assert len(server.received) == 1
+        assert mock_api_client.commit_configdocs.call_count == 1
+        assert 'Avoided sending {} bytes'.format(size) in result
+
+        ShipyardHelper(context, force=True, stream=True).upload_documents()
+
+        assert len(server.received) == 2
+        assert mock_api_client.commit_configdocs.call_count == 2
+
+        mock_iter_files.return_value = list(DATA.items())
+        ShipyardHelper(context, stream=True).upload_documents()
+
+        assert len(server.received) == 3
+        assert mock_api_client.commit_configdocs.call_count == 3
+
+
+@mock.patch(
+    'pegleg.engine.util.files.iter_files_by_repo',
+    autospec=True,
+    return_value=list(DATA.items()))
 @mock.patch.object(
     ShipyardHelper,
     'formatted_response_handler',
@@ -240,11 +396,11 @@ def test_upload_documents_fail(*args):
     shipyard_helper = ShipyardHelper(context)
 
     with mock.patch('pegleg.engine.util.shipyard_helper.ShipyardClient',
-                    autospec=True) as mock_shipyard:
-        mock_api_client = mock_shipyard.return_value
-        mock_api_client.post_configdocs.return_value = FakeResponse()
-        with pytest.raises(util.shipyard_helper.DocumentUploadError):
-            ShipyardHelper(context).upload_documents()
+                    autospec=True):
+        with mock.patch.object(ShipyardHelper, 'post_configdocs',
+                               autospec=True, return_value=FakeResponse()):
+            with pytest.raises(util.shipyard_helper.DocumentUploadError):
+                ShipyardHelper(context).upload_documents()
 
 
 @mock.patch(
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Copyright 2026 AT&T Intellectual Property.  All other rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare how long PKI generation takes per key algorithm and backend.
+
+Usage::
+
+    python tools/pki_benchmark.py [-n ROUNDS] [-b cryptography] [-b cfssl]
+
+For each key algorithm and size, reports the mean time to generate a CA, a
+certificate signed by that CA and a keypair.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from pegleg import config
+from pegleg.engine.catalog import pki_utility
+
+# Keys compared, as ``PKICatalog`` ``key`` entries.
+KEYS = [
+    {
+        'algo': 'rsa',
+        'size': 2048
+    },
+    {
+        'algo': 'rsa',
+        'size': 4096
+    },
+    {
+        'algo': 'ecdsa',
+        'size': 256
+    },
+    {
+        'algo': 'ecdsa',
+        'size': 384
+    },
+    {
+        'algo': 'ed25519'
+    },
+]
+
+
+def _time(func, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.mean(timings)
+
+
+def benchmark(backend, key, rounds):
+    """Return mean seconds to generate a CA, certificate and keypair."""
+    keys = pki_utility.PKIUtility(duration=365, backend=backend)
+    name = '%s-%s' % (key['algo'], key.get('size', ''))
+    results = {}
+    if key['algo'] in pki_utility.CERTIFICATE_KEY_ALGORITHMS:
+        ca_cert, ca_key = keys.generate_ca(name, key=key)
+        ca_cert = ca_cert['data']['managedDocument']['data']
+        ca_key = ca_key['data']['managedDocument']['data']
+        results['ca'] = _time(lambda: keys.generate_ca(name, key=key), rounds)
+        results['certificate'] = _time(
+            lambda: keys.generate_certificate(
+                name,
+                ca_cert=ca_cert,
+                ca_key=ca_key,
+                cn=name,
+                hosts=['%s.example.com' % name],
+                key=key), rounds)
+    results['keypair'] = _time(
+        lambda: keys.generate_keypair(name, key=key), rounds)
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '-n',
+        '--rounds',
+        type=int,
+        default=10,
+        help='Number of times each document is generated (default: 10).')
+    parser.add_argument(
+        '-b',
+        '--backend',
+        dest='backends',
+        action='append',
+        choices=sorted(pki_utility.pki_backend.BACKENDS),
+        help='Backend to benchmark, may be repeated (default: cryptography).')
+    args = parser.parse_args(argv)
+
+    # Generated documents record the site repository they came from; no
+    # repository is involved here, so name one explicitly.
+    config.set_site_repo('benchmark')
+    config.set_site_rev('HEAD')
+
+    print(
+        '%-13s %-12s %12s %12s %12s' %
+        ('backend', 'key', 'ca (ms)', 'cert (ms)', 'keypair (ms)'))
+    for backend in args.backends or ['cryptography']:
+        for key in KEYS:
+            results = benchmark(backend, key, args.rounds)
+            print(
+                '%-13s %-12s %12s %12s %12s' % (
+                    backend, '%s %s' % (key['algo'], key.get('size', '')), *(
+                        '%.1f' % (results[k] * 1000) if k in results else '-'
+                        for k in ('ca', 'certificate', 'keypair'))))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])